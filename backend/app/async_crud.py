@@ -0,0 +1,195 @@
+import asyncio
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+from app import async_db, crud, importer, worker_deletion
+from app.async_db import run_sync
+from app.etags import make_etag
+
+
+async def get_timezone_setting() -> str:
+    cached = crud.get_cached_timezone_setting()
+    if cached is not None:
+        return cached
+    return await run_sync(crud.get_timezone_setting)
+
+
+async def update_timezone_setting(timezone: str) -> str:
+    return await run_sync(crud.update_timezone_setting, timezone)
+
+
+async def get_data_version(kind: str) -> int:
+    cached = crud.get_cached_data_version(kind)
+    if cached is not None:
+        return cached
+    return await run_sync(crud.get_data_version, kind)
+
+
+async def data_etag(kinds: List[str], *parts, fresh: bool = False) -> str:
+    # Built from cached versions, which may lag another instance's writes by
+    # up to their TTL; that only costs a client a needless full response. A
+    # 304 must not rest on them, so requests with If-None-Match pass
+    # fresh=True and pay one key lookup per kind.
+    if fresh:
+        versions = await asyncio.gather(*(run_sync(crud.get_fresh_data_version, kind) for kind in kinds))
+    else:
+        versions = await asyncio.gather(*(get_data_version(kind) for kind in kinds))
+    return make_etag(*kinds, *versions, *parts)
+
+
+async def list_workers() -> List[dict]:
+    entities = await async_db.list_entities("Worker")
+    return [crud.worker_to_dict(entity) for entity in entities]
+
+
+async def list_workers_page(limit: int, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    entities, next_cursor = await async_db.list_entities_page("Worker", limit, cursor)
+    return [crud.worker_to_dict(entity) for entity in entities], next_cursor
+
+
+async def create_worker(name: str) -> dict:
+    return await run_sync(crud.create_worker, name)
+
+
+async def create_workers_batch(names: List[str]) -> List[dict]:
+    return await run_sync(crud.create_workers_batch, names)
+
+
+async def get_workers_by_ids(worker_ids: List[int]) -> List[dict]:
+    return await run_sync(crud.get_workers_by_ids, worker_ids)
+
+
+async def get_worker(worker_id: int) -> Optional[dict]:
+    entity = await async_db.get_entity_by_id("Worker", worker_id)
+    if entity is None:
+        return None
+    return crud.worker_to_dict(entity)
+
+
+async def update_worker(worker_id: int, name: str) -> Optional[dict]:
+    return await run_sync(crud.update_worker, worker_id, name)
+
+
+async def delete_worker(worker_id: int) -> Optional[bool]:
+    return await run_sync(crud.delete_worker, worker_id)
+
+
+async def count_worker_shifts(worker_id: int, limit: int) -> int:
+    return await run_sync(crud.count_worker_shifts, worker_id, limit)
+
+
+async def start_worker_deletion(worker_id: int) -> Optional[dict]:
+    return await run_sync(worker_deletion.start_worker_deletion, worker_id)
+
+
+async def run_worker_deletion(state: dict) -> dict:
+    return await run_sync(worker_deletion.run_worker_deletion, state)
+
+
+async def get_worker_deletion(job_id: str) -> Optional[dict]:
+    return await run_sync(worker_deletion.load_deletion_state, job_id)
+
+
+async def validate_worker_exists(worker_id: int) -> bool:
+    return await async_db.entity_exists("Worker", worker_id)
+
+
+async def list_shifts(start: Optional[str] = None, end: Optional[str] = None, worker_id: Optional[int] = None) -> List[dict]:
+    if start is None and end is None:
+        entities, timezone_setting = await asyncio.gather(
+            run_sync(crud.find_shift_entities, None, None, worker_id),
+            get_timezone_setting(),
+        )
+    else:
+        timezone_setting = await get_timezone_setting()
+        start_utc, end_utc = crud.resolve_shift_range(start, end, timezone_setting)
+        entities = await run_sync(crud.find_shift_entities, start_utc, end_utc, worker_id)
+    # Unpaginated listings can be large; keep the conversion off the event loop.
+    return await run_sync(crud.shifts_to_dicts, entities, timezone_setting)
+
+
+async def list_shifts_page(limit: int, cursor: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None, worker_id: Optional[int] = None) -> Tuple[List[dict], Optional[str]]:
+    if start is None and end is None:
+        (entities, next_cursor), timezone_setting = await asyncio.gather(
+            run_sync(crud.find_shift_entities_page, limit, cursor, None, None, worker_id),
+            get_timezone_setting(),
+        )
+    else:
+        # Naive range bounds are read in the configured timezone, so it is needed first.
+        timezone_setting = await get_timezone_setting()
+        start_utc, end_utc = crud.resolve_shift_range(start, end, timezone_setting)
+        entities, next_cursor = await run_sync(crud.find_shift_entities_page, limit, cursor, start_utc, end_utc, worker_id)
+    return await run_sync(crud.shifts_to_dicts, entities, timezone_setting), next_cursor
+
+
+async def export_shifts(start: Optional[str] = None, end: Optional[str] = None, worker_id: Optional[int] = None) -> Iterator[List[dict]]:
+    return await run_sync(crud.export_shifts, start, end, worker_id)
+
+
+async def hours_report(start: str, end: str, granularity: str, worker_id: Optional[int] = None) -> dict:
+    return await run_sync(crud.hours_report, start, end, granularity, worker_id)
+
+
+async def coverage_report(start: str, end: str, slot_minutes: int) -> dict:
+    return await run_sync(crud.coverage_report, start, end, slot_minutes)
+
+
+async def create_shift(worker_id: int, start: str, end: str) -> dict:
+    start_utc = crud.to_utc(start)
+    end_utc = crud.to_utc(end)
+
+    # The checks and writes are crud's; only the independent RPCs in front
+    # of the write run concurrently here.
+    _, shift_ids, timezone_setting = await asyncio.gather(
+        run_sync(crud.precheck_new_shift, worker_id, start_utc, end_utc),
+        async_db.allocate_ids("Shift", 1),
+        get_timezone_setting(),
+    )
+
+    entity = await run_sync(crud.write_new_shift, worker_id, shift_ids[0], start_utc, end_utc)
+    return crud.shift_to_dict(entity, timezone_setting)
+
+
+async def create_shifts_batch(items: List[Tuple[int, str, str]], atomic: bool = True) -> dict:
+    return await run_sync(crud.create_shifts_batch, items, atomic)
+
+
+async def get_shift(shift_id: int) -> Optional[dict]:
+    (found, parent), timezone_setting = await asyncio.gather(
+        run_sync(crud.locate_shift, shift_id),
+        get_timezone_setting(),
+    )
+    if not found:
+        return None
+    entity = await async_db.get_entity_by_id("Shift", shift_id, parent=parent)
+    if entity is None:
+        return None
+    return crud.shift_to_dict(entity, timezone_setting)
+
+
+async def update_shift(shift_id: int, worker_id: int, start: str, end: str) -> Optional[dict]:
+    start_utc = crud.to_utc(start)
+    end_utc = crud.to_utc(end)
+
+    (found, parent), timezone_setting = await asyncio.gather(
+        run_sync(crud.locate_shift, shift_id),
+        get_timezone_setting(),
+    )
+    if not found:
+        return None
+
+    entity = await run_sync(crud.update_located_shift, shift_id, parent, worker_id, start_utc, end_utc)
+    if entity is None:
+        return None
+    return crud.shift_to_dict(entity, timezone_setting)
+
+
+async def delete_shift(shift_id: int) -> Optional[bool]:
+    return await run_sync(crud.delete_shift, shift_id)
+
+
+async def start_import(kind: str, stream: BinaryIO, job_id: Optional[str] = None) -> Iterator[dict]:
+    return await run_sync(importer.start_import, kind, stream, job_id)
+
+
+async def get_import_job(job_id: str) -> Optional[dict]:
+    return await run_sync(importer.load_import_state, job_id)
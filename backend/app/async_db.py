@@ -0,0 +1,37 @@
+from functools import partial
+from typing import Any, Callable, List, Optional, Tuple
+
+from anyio import to_thread
+
+from app import db
+from app.db import Parent
+from app.settings import THREADPOOL_SIZE
+
+
+def configure_threadpool(size: int = THREADPOOL_SIZE) -> None:
+    to_thread.current_default_thread_limiter().total_tokens = size
+
+
+async def run_sync(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    # The Datastore client is blocking; each call holds one threadpool worker.
+    return await to_thread.run_sync(partial(func, *args, **kwargs))
+
+
+async def list_entities(kind: str) -> List[Any]:
+    return await run_sync(db.list_entities, kind)
+
+
+async def list_entities_page(kind: str, limit: int, cursor: Optional[str] = None, filters: Optional[List[Tuple[str, str, Any]]] = None, order: Optional[List[str]] = None) -> Tuple[List[Any], Optional[str]]:
+    return await run_sync(db.list_entities_page, kind, limit, cursor, filters=filters, order=order)
+
+
+async def get_entity_by_id(kind: str, entity_id: int, parent: Parent = None) -> Optional[Any]:
+    return await run_sync(db.get_entity_by_id, kind, entity_id, parent=parent)
+
+
+async def entity_exists(kind: str, entity_id: int, parent: Parent = None) -> bool:
+    return await run_sync(db.entity_exists, kind, entity_id, parent=parent)
+
+
+async def allocate_ids(kind: str, count: int) -> List[int]:
+    return await run_sync(db.allocate_ids, kind, count)
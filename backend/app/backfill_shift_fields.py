@@ -0,0 +1,94 @@
+import argparse
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+from app.crud import backfill_shift_time_fields
+from app.db import get_entity, list_keys_page, put_entity, MAX_BATCH_WRITE
+from app.settings import BACKFILL_BATCH_SIZE, BACKFILL_MAX_IN_FLIGHT
+
+BACKFILL_NAME = "shift_time_fields"
+
+
+def load_backfill_state(restart: bool = False) -> dict:
+    entity = None if restart else get_entity("Backfill", BACKFILL_NAME)
+    if entity is None:
+        return {"status": "running", "cursor": None, "scanned": 0, "updated": 0}
+    return {"status": entity["status"], "cursor": entity.get("cursor"), "scanned": entity["scanned"], "updated": entity["updated"]}
+
+
+def save_backfill_state(state: dict) -> None:
+    put_entity("Backfill", BACKFILL_NAME, state, exclude_from_indexes=("cursor",))
+
+
+def backfill_shifts(batch_size: int = BACKFILL_BATCH_SIZE, max_in_flight: int = BACKFILL_MAX_IN_FLIGHT, restart: bool = False) -> Iterator[dict]:
+    # Keys are walked in key order here while up to `max_in_flight` batches are
+    # rewritten on the pool. The saved cursor only moves past a batch once it
+    # and every batch before it have committed; after a crash the batches
+    # re-read from there are already up to date and are not written again.
+    state = load_backfill_state(restart)
+    if state["status"] == "completed":
+        yield dict(state)
+        return
+    state["status"] = "running"
+    save_backfill_state(state)
+
+    in_flight = deque()
+
+    def commit_oldest() -> dict:
+        future, scanned, cursor = in_flight.popleft()
+        state["updated"] += future.result()
+        state["scanned"] += scanned
+        state["cursor"] = cursor
+        save_backfill_state(state)
+        return dict(state)
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        try:
+            cursor = state["cursor"]
+            while True:
+                keys, cursor = list_keys_page("Shift", batch_size, cursor)
+                if not keys:
+                    break
+                in_flight.append((executor.submit(backfill_shift_time_fields, keys), len(keys), cursor))
+                if len(in_flight) >= max_in_flight:
+                    yield commit_oldest()
+                if cursor is None:
+                    break
+            while in_flight:
+                yield commit_oldest()
+        except BaseException:
+            state["status"] = "failed"
+            save_backfill_state(state)
+            raise
+
+    state["status"] = "completed"
+    save_backfill_state(state)
+    yield dict(state)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Store duration_seconds on existing shifts")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE, help=f"Shifts per transaction (at most {MAX_BATCH_WRITE})")
+    parser.add_argument("--max-in-flight", type=int, default=BACKFILL_MAX_IN_FLIGHT)
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved checkpoint and walk every shift again")
+    parser.add_argument("--progress-every", type=float, default=2.0, help="Seconds between progress lines")
+    args = parser.parse_args()
+    if not 1 <= args.batch_size <= MAX_BATCH_WRITE:
+        parser.error(f"--batch-size must be between 1 and {MAX_BATCH_WRITE}")
+
+    last_report = 0.0
+    state = None
+    for state in backfill_shifts(args.batch_size, args.max_in_flight, args.restart):
+        now = time.monotonic()
+        if now - last_report >= args.progress_every:
+            print(f"scanned {state['scanned']:,}  updated {state['updated']:,}", file=sys.stderr)
+            last_report = now
+    print(json.dumps({key: value for key, value in state.items() if key != "cursor"}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
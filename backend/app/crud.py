@@ -1,172 +1,864 @@
-from datetime import datetime, timezone
-from typing import Optional, List
-from zoneinfo import ZoneInfo
-from app.db import get_entity, put_entity, list_entities, get_entity_by_id, put_entity_with_auto_id, delete_entity, update_entity_by_id, list_entities_by_property
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, Optional, List, Tuple
+import numpy as np
+from app.db import get_entity, get_entity_projection, put_entity, list_entities, list_entities_page, iter_entity_pages, get_entity_by_id, put_entity_with_auto_id, put_entity_by_id, delete_entity, update_entity_by_id, query_entities, get_entities_by_ids, put_entities_by_ids, allocate_ids, delete_entities, find_entity_key, run_in_transaction, get_entities_by_keys, put_entities, put_entities_with_parents, entity_exists, query_projection, query_keys, delete_keys, MAX_BATCH_WRITE, MAX_TRANSACTION_GROUPS
+from app.models import MAX_SHIFT_DURATION_HOURS
+from app.settings import SHIFT_INDEX_ENABLED, SHIFT_INDEX_TTL_SECONDS, SETTINGS_CACHE_TTL_SECONDS, DATA_VERSION_TTL_SECONDS, LEGACY_SHIFT_KEYS_ENABLED, EXPORT_PAGE_SIZE, WORKER_DELETE_CHUNK_SIZE, REPORT_MAX_BUCKETS, COVERAGE_MAX_SLOTS
+from app.reports import bucket_periods, coverage_slots, headcount_by_slot, hours_by_bucket
+from app.settings_cache import SettingsCache
+from app.shift_index import ShiftIntervalIndex
+from app.timezones import get_zone
+from app.tzconvert import MIN_BATCH_SIZE, ONE_MICROSECOND, batch_from_epoch, batch_from_utc
 
 
 DEFAULT_TIMEZONE = "UTC"
+MAX_SHIFT_DURATION = timedelta(hours=MAX_SHIFT_DURATION_HOURS)
+SHIFT_TIMESTAMP_PROJECTION = ["start_utc", "end_utc"]
+# Read back with the shift but never filtered or sorted on, so no index
+# entries are written for it.
+SHIFT_UNINDEXED_PROPERTIES = ("duration_seconds",)
+SHIFT_OVERLAP_ERROR = "Shift overlaps with existing shift for this worker"
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
 
+_shift_index = ShiftIntervalIndex(ttl_seconds=SHIFT_INDEX_TTL_SECONDS)
+_settings_cache = SettingsCache(ttl_seconds=SETTINGS_CACHE_TTL_SECONDS)
+_data_versions = SettingsCache(ttl_seconds=DATA_VERSION_TTL_SECONDS)
 
-def get_timezone_setting() -> str:
+
+def load_timezone_setting() -> Tuple[str, Optional[int]]:
     entity = get_entity("Settings", "timezone")
     if entity is None:
-        return DEFAULT_TIMEZONE
-    return entity.get("timezone", DEFAULT_TIMEZONE)
+        return DEFAULT_TIMEZONE, None
+    return entity.get("timezone", DEFAULT_TIMEZONE), entity.get("version")
+
+
+def load_timezone_setting_version() -> Optional[int]:
+    entity = get_entity_projection("Settings", "timezone", ["version"])
+    if entity is None:
+        return None
+    return entity.get("version")
+
+
+def get_timezone_setting() -> str:
+    return _settings_cache.get("timezone", load_timezone_setting, load_timezone_setting_version)
+
+
+def get_cached_timezone_setting() -> Optional[str]:
+    return _settings_cache.peek("timezone")
 
 
 def update_timezone_setting(timezone: str) -> str:
-    put_entity("Settings", "timezone", {"timezone": timezone})
+    version = time.time_ns()
+    put_entity("Settings", "timezone", {"timezone": timezone, "version": version})
+    _settings_cache.set("timezone", timezone, version)
+    # Shift responses are rendered in this timezone, so their ETags depend on it.
+    bump_data_version("Settings")
     return timezone
 
 
+def get_settings_cache_stats() -> dict:
+    return _settings_cache.stats()
+
+
+def load_data_version(kind: str) -> Tuple[int, Optional[int]]:
+    entity = get_entity("DataVersion", kind)
+    if entity is None:
+        return 0, None
+    return entity["version"], entity["version"]
+
+
+def load_data_version_only(kind: str) -> Optional[int]:
+    entity = get_entity_projection("DataVersion", kind, ["version"])
+    if entity is None:
+        return None
+    return entity["version"]
+
+
+def get_data_version(kind: str) -> int:
+    return _data_versions.get(kind, lambda: load_data_version(kind), lambda: load_data_version_only(kind))
+
+
+def get_cached_data_version(kind: str) -> Optional[int]:
+    return _data_versions.peek(kind)
+
+
+def get_fresh_data_version(kind: str) -> int:
+    # A key lookup past the TTL cache, for answering If-None-Match: a cached
+    # version can miss another instance's write for up to
+    # DATA_VERSION_TTL_SECONDS, and a 304 built on it would hide that write.
+    version, stored = load_data_version(kind)
+    _data_versions.set(kind, version, stored)
+    return version
+
+
+def save_data_version(kind: str, version: int) -> None:
+    put_entity("DataVersion", kind, {"version": version})
+
+
+def bump_data_version(*kinds: str) -> None:
+    # Called after every committed write, so ETags built from the version
+    # change whenever the data behind them may have. This is one extra small
+    # put per kind on top of the write itself.
+    version = time.time_ns()
+    for kind in kinds:
+        save_data_version(kind, version)
+        _data_versions.set(kind, version, version)
+
+
+def worker_to_dict(entity) -> dict:
+    return {"id": entity.key.id, "name": entity["name"]}
+
+
 def list_workers():
     entities = list_entities("Worker")
-    return [{"id": entity.key.id, "name": entity["name"]} for entity in entities]
+    return [worker_to_dict(entity) for entity in entities]
+
+
+def list_workers_page(limit: int, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    entities, next_cursor = list_entities_page("Worker", limit, cursor)
+    return [worker_to_dict(entity) for entity in entities], next_cursor
 
 
 def create_worker(name: str):
     entity = put_entity_with_auto_id("Worker", {"name": name})
-    return {"id": entity.key.id, "name": entity["name"]}
+    bump_data_version("Worker")
+    return worker_to_dict(entity)
+
+
+def create_workers_batch(names: List[str]) -> List[dict]:
+    worker_ids = allocate_ids("Worker", len(names))
+    entities = put_entities_by_ids("Worker", [(worker_id, {"name": name}) for worker_id, name in zip(worker_ids, names)])
+    bump_data_version("Worker")
+    return [worker_to_dict(entity) for entity in entities]
+
+
+def get_workers_by_ids(worker_ids: List[int]) -> List[dict]:
+    unique_ids = list(dict.fromkeys(worker_ids))
+    entities = get_entities_by_ids("Worker", unique_ids)
+    return [worker_to_dict(entities[worker_id]) for worker_id in unique_ids if worker_id in entities]
 
 
 def get_worker(worker_id: int) -> Optional[dict]:
     entity = get_entity_by_id("Worker", worker_id)
     if entity is None:
         return None
-    return {"id": entity.key.id, "name": entity["name"]}
+    return worker_to_dict(entity)
 
 
 def update_worker(worker_id: int, name: str) -> Optional[dict]:
     entity = update_entity_by_id("Worker", worker_id, {"name": name})
     if entity is None:
         return None
-    return {"id": entity.key.id, "name": entity["name"]}
+    bump_data_version("Worker")
+    return worker_to_dict(entity)
 
 
-def delete_worker(worker_id: int) -> Optional[bool]:
-    entity = get_entity_by_id("Worker", worker_id)
-    if entity is None:
+def delete_worker(worker_id: int, cascade: bool = True) -> Optional[bool]:
+    # A delete does not report whether the key existed, so the 404 needs a
+    # keys-only check first. The Worker goes before its shifts: once it is
+    # gone write_new_shift rejects new shifts for it, so the shift query in
+    # delete_worker_shifts sees every shift it will ever have.
+    if not entity_exists("Worker", worker_id):
         return None
     delete_entity("Worker", worker_id)
+    bump_data_version("Worker")
+    if cascade:
+        for _ in delete_worker_shifts(worker_id):
+            pass
     return True
 
 
+def count_worker_shifts(worker_id: int, limit: int) -> int:
+    # Keys-only and capped, so a huge history costs no more than `limit` keys.
+    return len(query_projection("Shift", ["__key__"], [("worker_id", "=", worker_id)], limit=limit))
+
+
+def find_worker_shift_keys(worker_id: int) -> List[Any]:
+    # worker_id is on every shift, so this also finds root-level legacy shifts.
+    return query_keys("Shift", [("worker_id", "=", worker_id)])
+
+
+def delete_worker_shifts(worker_id: int, chunk_size: int = WORKER_DELETE_CHUNK_SIZE) -> Iterator[int]:
+    # Yields how many shifts each delete_multi removed, so callers can report
+    # progress on long histories.
+    keys = find_worker_shift_keys(worker_id)
+    try:
+        for offset in range(0, len(keys), chunk_size):
+            chunk = keys[offset:offset + chunk_size]
+            delete_keys(chunk)
+            yield len(chunk)
+    finally:
+        if keys:
+            _shift_index.invalidate(worker_id)
+            bump_data_version("Shift")
+
+
+def find_orphan_worker_ids() -> List[int]:
+    # One projection row per distinct worker_id rather than one per shift.
+    worker_ids = [entity["worker_id"] for entity in query_projection("Shift", ["worker_id"], distinct_on=["worker_id"])]
+    existing = get_entities_by_ids("Worker", worker_ids)
+    return [worker_id for worker_id in worker_ids if worker_id not in existing]
+
+
+def sweep_orphan_shifts(dry_run: bool = False) -> Dict[int, int]:
+    swept = {}
+    for worker_id in find_orphan_worker_ids():
+        if dry_run:
+            swept[worker_id] = len(find_worker_shift_keys(worker_id))
+        else:
+            swept[worker_id] = sum(delete_worker_shifts(worker_id))
+    return swept
+
+
 def to_utc(iso_string: str) -> datetime:
     dt = datetime.fromisoformat(iso_string)
     return dt.astimezone(timezone.utc)
 
 
 def from_utc(dt_utc: datetime, tz_name: str) -> str:
-    tz = ZoneInfo(tz_name)
+    tz = get_zone(tz_name)
     dt_local = dt_utc.astimezone(tz)
     return dt_local.isoformat()
 
 
 def validate_worker_exists(worker_id: int) -> bool:
-    entity = get_entity_by_id("Worker", worker_id)
-    return entity is not None
+    return entity_exists("Worker", worker_id)
+
+
+def projected_datetime(value: Any) -> datetime:
+    # Projection queries return timestamps as integer microseconds since the epoch.
+    if isinstance(value, int):
+        return EPOCH + timedelta(microseconds=value)
+    return value
+
+
+def projected_microseconds(value: Any) -> int:
+    if isinstance(value, int):
+        return value
+    return (value - EPOCH) // ONE_MICROSECOND
+
+
+def rebuild_shift_index() -> int:
+    entities = query_entities("Shift", [], projection=["worker_id"] + SHIFT_TIMESTAMP_PROJECTION)
+    return _shift_index.rebuild(
+        (entity["worker_id"], entity.key.id, projected_datetime(entity["start_utc"]), projected_datetime(entity["end_utc"]))
+        for entity in entities
+    )
+
+
+def find_overlap_candidates(worker_id: int, start_utc: datetime, end_utc: datetime) -> List[Any]:
+    # No stored shift is longer than MAX_SHIFT_DURATION, so anything starting
+    # earlier than that before start_utc has already ended.
+    return query_entities("Shift", [
+        ("worker_id", "=", worker_id),
+        ("start_utc", ">", start_utc - MAX_SHIFT_DURATION),
+        ("start_utc", "<", end_utc),
+    ], projection=SHIFT_TIMESTAMP_PROJECTION)
+
+
+def find_group_overlap_candidates(worker_id: int, start_utc: datetime, end_utc: datetime) -> List[Any]:
+    # Ancestor query over the worker's entity group, so it can run inside a
+    # transaction and sees every committed write to that group.
+    return query_entities("Shift", [
+        ("start_utc", ">", start_utc - MAX_SHIFT_DURATION),
+        ("start_utc", "<", end_utc),
+    ], projection=SHIFT_TIMESTAMP_PROJECTION, ancestor=worker_parent(worker_id))
+
+
+def load_overlap_candidates(worker_id: int, start_utc: datetime, end_utc: datetime) -> List[Any]:
+    # Only the bounded window is read, and cached for checks that fall inside
+    # it; the worker's full history is never loaded per request.
+    token = _shift_index.load_token()
+    shifts = find_overlap_candidates(worker_id, start_utc, end_utc)
+    _shift_index.load_worker(
+        worker_id,
+        [(shift.key.id, projected_datetime(shift["start_utc"]), projected_datetime(shift["end_utc"])) for shift in shifts],
+        token,
+        window=(start_utc, end_utc)
+    )
+    return shifts
+
 
+def check_group_shift_overlap(worker_id: int, start_utc: datetime, end_utc: datetime, exclude_shift_id: Optional[int] = None) -> bool:
+    shifts = find_group_overlap_candidates(worker_id, start_utc, end_utc)
+    return shifts_overlap(shifts, start_utc, end_utc, exclude_shift_id)
 
-def check_shift_overlap(worker_id: int, start_utc: datetime, end_utc: datetime, exclude_shift_id: Optional[int] = None) -> bool:
-    shifts = list_entities_by_property("Shift", "worker_id", worker_id)
+
+def shifts_overlap(shifts: List[Any], start_utc: datetime, end_utc: datetime, exclude_shift_id: Optional[int] = None) -> bool:
     for shift in shifts:
         if exclude_shift_id is not None and shift.key.id == exclude_shift_id:
             continue
-        shift_start_utc = shift["start_utc"]
-        shift_end_utc = shift["end_utc"]
+        shift_start_utc = projected_datetime(shift["start_utc"])
+        shift_end_utc = projected_datetime(shift["end_utc"])
         if (start_utc < shift_end_utc) and (shift_start_utc < end_utc):
             return True
     return False
 
 
-def list_shifts() -> List[dict]:
-    entities = list_entities("Shift")
-    timezone_setting = get_timezone_setting()
+def precheck_shift_overlap(worker_id: int, start_utc: datetime, end_utc: datetime, exclude_shift_id: Optional[int] = None) -> bool:
+    # Rejects overlaps before the write transaction is opened. A miss in the
+    # worker's cached intervals needs no read: the ancestor query in the write
+    # transaction has the final say, and no new root-level shift is written
+    # that the index could have missed. A hit may be stale, so it is confirmed
+    # with a fresh read; a cold worker has its bounded window read and cached
+    # for the checks that follow.
+    if SHIFT_INDEX_ENABLED:
+        indexed = _shift_index.overlaps(worker_id, start_utc, end_utc, exclude_shift_id)
+        if indexed is False:
+            return False
+        if indexed:
+            shifts = find_overlap_candidates(worker_id, start_utc, end_utc)
+        else:
+            shifts = load_overlap_candidates(worker_id, start_utc, end_utc)
+    elif LEGACY_SHIFT_KEYS_ENABLED:
+        # Without the index only root-level legacy shifts need the extra read:
+        # the write transaction's ancestor query cannot see them.
+        shifts = [shift for shift in find_overlap_candidates(worker_id, start_utc, end_utc) if shift.key.parent is None]
+    else:
+        return False
+    return shifts_overlap(shifts, start_utc, end_utc, exclude_shift_id)
+
+
+def shift_duration_hours(entity) -> float:
+    if "duration_seconds" in entity:
+        return entity["duration_seconds"] / 3600
+    # Written before duration_seconds was stored and not yet backfilled.
+    return (entity["end_utc"] - entity["start_utc"]).total_seconds() / 3600
+
+
+def shift_to_dict(entity, timezone_setting: str) -> dict:
+    return {
+        "id": entity.key.id,
+        "worker_id": entity["worker_id"],
+        "start": from_utc(entity["start_utc"], timezone_setting),
+        "end": from_utc(entity["end_utc"], timezone_setting),
+        "duration_hours": shift_duration_hours(entity)
+    }
+
+
+def shifts_to_dicts(entities: List[Any], timezone_setting: str) -> List[dict]:
+    if len(entities) < MIN_BATCH_SIZE:
+        return [shift_to_dict(entity, timezone_setting) for entity in entities]
+    count = len(entities)
+    converted = batch_from_utc(
+        [entity["start_utc"] for entity in entities] + [entity["end_utc"] for entity in entities],
+        timezone_setting
+    )
     return [
         {
             "id": entity.key.id,
             "worker_id": entity["worker_id"],
-            "start": from_utc(entity["start_utc"], timezone_setting),
-            "end": from_utc(entity["end_utc"], timezone_setting)
+            "start": converted[position],
+            "end": converted[count + position],
+            "duration_hours": shift_duration_hours(entity)
         }
-        for entity in entities
+        for position, entity in enumerate(entities)
     ]
 
 
+def parse_range_bound(value: str, tz_name: str) -> datetime:
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid ISO 8601 datetime format: {value}")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=get_zone(tz_name))
+    return dt.astimezone(timezone.utc)
+
+
+def shift_query_filters(start_utc: Optional[datetime], end_utc: Optional[datetime], worker_id: Optional[int]) -> List[Tuple[str, str, Any]]:
+    filters = []
+    if worker_id is not None:
+        filters.append(("worker_id", "=", worker_id))
+    if start_utc is not None:
+        # Shifts overlapping the range may start up to MAX_SHIFT_DURATION earlier.
+        filters.append(("start_utc", ">", start_utc - MAX_SHIFT_DURATION))
+    if end_utc is not None:
+        filters.append(("start_utc", "<", end_utc))
+    return filters
+
+
+def resolve_shift_range(start: Optional[str], end: Optional[str], timezone_setting: str) -> Tuple[Optional[datetime], Optional[datetime]]:
+    start_utc = parse_range_bound(start, timezone_setting) if start else None
+    end_utc = parse_range_bound(end, timezone_setting) if end else None
+    if start_utc is not None and end_utc is not None and end_utc <= start_utc:
+        raise ValueError("`to` must be after `from`")
+    return start_utc, end_utc
+
+
+def find_shift_entities(start_utc: Optional[datetime], end_utc: Optional[datetime], worker_id: Optional[int]) -> List[Any]:
+    filters = shift_query_filters(start_utc, end_utc, worker_id)
+    if filters:
+        entities = query_entities("Shift", filters, order=["start_utc"])
+    else:
+        entities = list_entities("Shift")
+    if start_utc is not None:
+        entities = [entity for entity in entities if entity["end_utc"] > start_utc]
+    return entities
+
+
+def find_shift_entities_page(limit: int, cursor: Optional[str], start_utc: Optional[datetime], end_utc: Optional[datetime], worker_id: Optional[int]) -> Tuple[List[Any], Optional[str]]:
+    filters = shift_query_filters(start_utc, end_utc, worker_id)
+    order = ["start_utc"] if filters else None
+    entities, next_cursor = list_entities_page("Shift", limit, cursor, filters=filters, order=order)
+    if start_utc is not None:
+        entities = [entity for entity in entities if entity["end_utc"] > start_utc]
+    return entities, next_cursor
+
+
+def list_shifts(start: Optional[str] = None, end: Optional[str] = None, worker_id: Optional[int] = None) -> List[dict]:
+    timezone_setting = get_timezone_setting()
+    start_utc, end_utc = resolve_shift_range(start, end, timezone_setting)
+    entities = find_shift_entities(start_utc, end_utc, worker_id)
+    return shifts_to_dicts(entities, timezone_setting)
+
+
+def list_shifts_page(limit: int, cursor: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None, worker_id: Optional[int] = None) -> Tuple[List[dict], Optional[str]]:
+    timezone_setting = get_timezone_setting()
+    start_utc, end_utc = resolve_shift_range(start, end, timezone_setting)
+    entities, next_cursor = find_shift_entities_page(limit, cursor, start_utc, end_utc, worker_id)
+    return shifts_to_dicts(entities, timezone_setting), next_cursor
+
+
+def export_shifts(start: Optional[str] = None, end: Optional[str] = None, worker_id: Optional[int] = None, page_size: int = EXPORT_PAGE_SIZE) -> Iterator[List[dict]]:
+    # The range is resolved up front so bad input fails before streaming starts.
+    timezone_setting = get_timezone_setting()
+    start_utc, end_utc = resolve_shift_range(start, end, timezone_setting)
+    filters = shift_query_filters(start_utc, end_utc, worker_id)
+    order = ["start_utc"] if filters else None
+
+    def pages() -> Iterator[List[dict]]:
+        for entities in iter_entity_pages("Shift", page_size, filters=filters, order=order):
+            if start_utc is not None:
+                entities = [entity for entity in entities if entity["end_utc"] > start_utc]
+            yield shifts_to_dicts(entities, timezone_setting)
+
+    return pages()
+
+
+def find_shift_timestamps(start_utc: datetime, end_utc: datetime, worker_id: Optional[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Worker IDs and epoch microsecond start/end arrays from a projection query.
+    # Datastore cannot project a property with an equality filter, so a single
+    # worker's ID is filled in rather than read back.
+    filters = shift_query_filters(start_utc, end_utc, worker_id)
+    if worker_id is None:
+        entities = query_entities("Shift", filters, projection=["worker_id"] + SHIFT_TIMESTAMP_PROJECTION)
+        worker_ids = np.fromiter((entity["worker_id"] for entity in entities), dtype=np.int64, count=len(entities))
+    else:
+        entities = query_entities("Shift", filters, projection=SHIFT_TIMESTAMP_PROJECTION)
+        worker_ids = np.full(len(entities), worker_id, dtype=np.int64)
+    starts = np.fromiter((projected_microseconds(entity["start_utc"]) for entity in entities), dtype=np.int64, count=len(entities))
+    ends = np.fromiter((projected_microseconds(entity["end_utc"]) for entity in entities), dtype=np.int64, count=len(entities))
+    return worker_ids, starts, ends
+
+
+def hours_report(start: str, end: str, granularity: str, worker_id: Optional[int] = None) -> dict:
+    timezone_setting = get_timezone_setting()
+    start_utc, end_utc = resolve_shift_range(start, end, timezone_setting)
+    # Built first so an oversized range is rejected before any shifts are read.
+    periods, edges = bucket_periods(start_utc, end_utc, granularity, timezone_setting, REPORT_MAX_BUCKETS)
+    workers, hours = hours_by_bucket(*find_shift_timestamps(start_utc, end_utc, worker_id), edges)
+    return {
+        "timezone": timezone_setting,
+        "granularity": granularity,
+        "periods": [period.isoformat() for period in periods],
+        "workers": [
+            {"worker_id": worker, "total_hours": total, "hours": row}
+            for worker, total, row in zip(workers.tolist(), hours.sum(axis=1).tolist(), hours.tolist())
+        ]
+    }
+
+
+def coverage_report(start: str, end: str, slot_minutes: int) -> dict:
+    timezone_setting = get_timezone_setting()
+    start_utc, end_utc = resolve_shift_range(start, end, timezone_setting)
+    origin, slot, count = coverage_slots(start_utc, end_utc, slot_minutes, COVERAGE_MAX_SLOTS)
+    headcount = headcount_by_slot(*find_shift_timestamps(start_utc, end_utc, None), origin, slot, count)
+    seconds, microseconds = np.divmod(origin + np.arange(count, dtype=np.int64) * slot, 1_000_000)
+    return {
+        "timezone": timezone_setting,
+        "bucket_minutes": slot_minutes,
+        "slots": batch_from_epoch(seconds, timezone_setting, microseconds),
+        "headcount": headcount.tolist()
+    }
+
+
+def worker_parent(worker_id: int) -> Tuple[str, int]:
+    return ("Worker", worker_id)
+
+
+def shift_time_fields(start_utc: datetime, end_utc: datetime) -> dict:
+    # Stored so responses read duration_hours without subtracting the times;
+    # keeps sub-second precision. There are no integer copies of the times:
+    # Datastore already indexes datetimes as int64 microseconds, so range
+    # filters, overlap checks and report projections on start_utc/end_utc
+    # cost the same as they would on integers.
+    return {
+        "duration_seconds": (end_utc - start_utc).total_seconds()
+    }
+
+
+def shift_data(worker_id: int, shift_id: int, start_utc: datetime, end_utc: datetime) -> dict:
+    # shift_id mirrors the key ID so a shift can be found without knowing its worker.
+    return {
+        "worker_id": worker_id,
+        "shift_id": shift_id,
+        "start_utc": start_utc,
+        "end_utc": end_utc,
+        **shift_time_fields(start_utc, end_utc)
+    }
+
+
+def backfill_shift_time_fields(keys: List[Any]) -> int:
+    # Re-reads the shifts inside the transaction so a concurrent update is
+    # never overwritten with stale times.
+    def rewrite() -> int:
+        stale = []
+        for entity in get_entities_by_keys(keys):
+            fields = shift_time_fields(entity["start_utc"], entity["end_utc"])
+            if any(entity.get(name) != value for name, value in fields.items()):
+                entity.update(fields)
+                entity.exclude_from_indexes.update(SHIFT_UNINDEXED_PROPERTIES)
+                stale.append(entity)
+        put_entities(stale)
+        return len(stale)
+
+    return run_in_transaction(rewrite)
+
+
+def find_shift_parent(shift_id: int) -> Optional[Tuple[str, int]]:
+    key = find_entity_key("Shift", "shift_id", shift_id)
+    if key is None or key.parent is None:
+        return None
+    return (key.parent.kind, key.parent.id)
+
+
+def locate_shift(shift_id: int) -> Tuple[bool, Optional[Tuple[str, int]]]:
+    parent = find_shift_parent(shift_id)
+    if parent is not None:
+        return True, parent
+    return LEGACY_SHIFT_KEYS_ENABLED, None
+
+
+def get_shift_entity(shift_id: int) -> Optional[Any]:
+    found, parent = locate_shift(shift_id)
+    if not found:
+        return None
+    return get_entity_by_id("Shift", shift_id, parent=parent)
+
+
 def create_shift(worker_id: int, start: str, end: str) -> dict:
-    if not validate_worker_exists(worker_id):
-        raise ValueError("Worker not found")
-    
     start_utc = to_utc(start)
     end_utc = to_utc(end)
-    
-    if check_shift_overlap(worker_id, start_utc, end_utc):
-        raise ValueError("Shift overlaps with existing shift for this worker")
-    
-    entity = put_entity_with_auto_id("Shift", {
-        "worker_id": worker_id,
-        "start_utc": start_utc,
-        "end_utc": end_utc
-    })
-    
+
+    precheck_new_shift(worker_id, start_utc, end_utc)
+
+    shift_id = allocate_ids("Shift", 1)[0]
+    entity = write_new_shift(worker_id, shift_id, start_utc, end_utc)
+
     timezone_setting = get_timezone_setting()
-    return {
-        "id": entity.key.id,
-        "worker_id": entity["worker_id"],
-        "start": from_utc(entity["start_utc"], timezone_setting),
-        "end": from_utc(entity["end_utc"], timezone_setting)
-    }
+    return shift_to_dict(entity, timezone_setting)
+
+
+def write_new_shift(worker_id: int, shift_id: int, start_utc: datetime, end_utc: datetime) -> Any:
+    def write() -> Any:
+        if get_entity_by_id("Worker", worker_id) is None:
+            raise ValueError("Worker not found")
+        if check_group_shift_overlap(worker_id, start_utc, end_utc):
+            raise ValueError(SHIFT_OVERLAP_ERROR)
+        return put_entity_by_id("Shift", shift_id, shift_data(worker_id, shift_id, start_utc, end_utc), parent=worker_parent(worker_id), exclude_from_indexes=SHIFT_UNINDEXED_PROPERTIES)
+
+    entity = run_in_transaction(write)
+    _shift_index.add(worker_id, shift_id, start_utc, end_utc)
+    bump_data_version("Shift")
+    return entity
+
+
+def reject_precheck_overlap(worker_id: int) -> None:
+    if not validate_worker_exists(worker_id):
+        raise ValueError("Worker not found")
+    raise ValueError(SHIFT_OVERLAP_ERROR)
+
+
+def precheck_new_shift(worker_id: int, start_utc: datetime, end_utc: datetime) -> None:
+    if precheck_shift_overlap(worker_id, start_utc, end_utc):
+        reject_precheck_overlap(worker_id)
 
 
 def get_shift(shift_id: int) -> Optional[dict]:
-    entity = get_entity_by_id("Shift", shift_id)
+    entity = get_shift_entity(shift_id)
     if entity is None:
         return None
-    
+
     timezone_setting = get_timezone_setting()
-    return {
-        "id": entity.key.id,
-        "worker_id": entity["worker_id"],
-        "start": from_utc(entity["start_utc"], timezone_setting),
-        "end": from_utc(entity["end_utc"], timezone_setting)
-    }
+    return shift_to_dict(entity, timezone_setting)
 
 
 def update_shift(shift_id: int, worker_id: int, start: str, end: str) -> Optional[dict]:
-    entity = get_entity_by_id("Shift", shift_id)
-    if entity is None:
+    found, parent = locate_shift(shift_id)
+    if not found:
         return None
-    
-    if not validate_worker_exists(worker_id):
-        raise ValueError("Worker not found")
-    
-    start_utc = to_utc(start)
-    end_utc = to_utc(end)
-    
-    if check_shift_overlap(worker_id, start_utc, end_utc, exclude_shift_id=shift_id):
-        raise ValueError("Shift overlaps with existing shift for this worker")
-    
-    updated_entity = update_entity_by_id("Shift", shift_id, {
-        "worker_id": worker_id,
-        "start_utc": start_utc,
-        "end_utc": end_utc
-    })
-    
+
+    updated_entity = update_located_shift(shift_id, parent, worker_id, to_utc(start), to_utc(end))
     if updated_entity is None:
         return None
-    
+
     timezone_setting = get_timezone_setting()
-    return {
-        "id": updated_entity.key.id,
-        "worker_id": updated_entity["worker_id"],
-        "start": from_utc(updated_entity["start_utc"], timezone_setting),
-        "end": from_utc(updated_entity["end_utc"], timezone_setting)
-    }
+    return shift_to_dict(updated_entity, timezone_setting)
 
 
-def delete_shift(shift_id: int) -> Optional[bool]:
-    entity = get_entity_by_id("Shift", shift_id)
-    if entity is None:
+def update_located_shift(shift_id: int, parent: Optional[Tuple[str, int]], worker_id: int, start_utc: datetime, end_utc: datetime) -> Optional[Any]:
+    if precheck_shift_overlap(worker_id, start_utc, end_utc, exclude_shift_id=shift_id):
+        if get_entity_by_id("Shift", shift_id, parent=parent) is None:
+            return None
+        reject_precheck_overlap(worker_id)
+    return write_shift_update(shift_id, parent, worker_id, start_utc, end_utc)
+
+
+def write_shift_update(shift_id: int, parent: Optional[Tuple[str, int]], worker_id: int, start_utc: datetime, end_utc: datetime) -> Optional[Any]:
+    def write() -> Optional[Any]:
+        if get_entity_by_id("Shift", shift_id, parent=parent) is None:
+            return None
+        if get_entity_by_id("Worker", worker_id) is None:
+            raise ValueError("Worker not found")
+        if check_group_shift_overlap(worker_id, start_utc, end_utc, exclude_shift_id=shift_id):
+            raise ValueError(SHIFT_OVERLAP_ERROR)
+        # Moving a shift to another worker (or out of the root) changes its key.
+        if parent != worker_parent(worker_id):
+            delete_entity("Shift", shift_id, parent=parent)
+        return put_entity_by_id("Shift", shift_id, shift_data(worker_id, shift_id, start_utc, end_utc), parent=worker_parent(worker_id), exclude_from_indexes=SHIFT_UNINDEXED_PROPERTIES)
+
+    updated_entity = run_in_transaction(write)
+
+    if updated_entity is None:
+        _shift_index.remove(shift_id)
         return None
-    delete_entity("Shift", shift_id)
+    _shift_index.add(worker_id, shift_id, start_utc, end_utc)
+    bump_data_version("Shift")
+    return updated_entity
+
+
+def delete_shift(shift_id: int) -> Optional[bool]:
+    # The keys-only lookup that finds the shift's worker already proves it
+    # exists, so the delete is a single write with no transaction around it.
+    parent = find_shift_parent(shift_id)
+    if parent is None:
+        if not (LEGACY_SHIFT_KEYS_ENABLED and entity_exists("Shift", shift_id)):
+            return None
+    delete_entity("Shift", shift_id, parent=parent)
+    _shift_index.remove(shift_id)
+    bump_data_version("Shift")
     return True
+
+
+def migrate_legacy_shift_keys(keys: List[Any]) -> int:
+    # Moves the root-level shifts among `keys` under their worker. Shift IDs
+    # are kept, so links to /shifts/{id} survive the move; keys that already
+    # have a parent are skipped.
+    roots = [key for key in keys if key.parent is None]
+    # Each shift is its own root entity group and joins its worker's group.
+    per_transaction = MAX_TRANSACTION_GROUPS // 2
+    migrated = 0
+    for offset in range(0, len(roots), per_transaction):
+        migrated += move_legacy_shifts(roots[offset:offset + per_transaction])
+    if migrated:
+        bump_data_version("Shift")
+    return migrated
+
+
+def move_legacy_shifts(keys: List[Any]) -> int:
+    # Re-read inside the transaction: a shift deleted meanwhile is not brought back.
+    def move() -> int:
+        entities = get_entities_by_keys(keys)
+        put_entities_with_parents("Shift", [
+            (worker_parent(entity["worker_id"]), entity.key.id, shift_data(entity["worker_id"], entity.key.id, entity["start_utc"], entity["end_utc"]))
+            for entity in entities
+        ], exclude_from_indexes=SHIFT_UNINDEXED_PROPERTIES)
+        delete_keys([entity.key for entity in entities])
+        return len(entities)
+
+    return run_in_transaction(move)
+
+
+def find_stored_conflicts(worker_id: int, intervals: List[Tuple[datetime, datetime]], in_transaction: bool = False) -> List[bool]:
+    window_start = min(start for start, _ in intervals)
+    window_end = max(end for _, end in intervals)
+    # Outside a transaction the worker_id query also covers unmigrated root-level shifts.
+    find_candidates = find_group_overlap_candidates if in_transaction else find_overlap_candidates
+    stored = sorted(
+        (projected_datetime(entity["start_utc"]), projected_datetime(entity["end_utc"]))
+        for entity in find_candidates(worker_id, window_start, window_end)
+    )
+    starts = [start for start, _ in stored]
+    # Running maximum of end times, so one bisect answers each interval even if
+    # stored shifts overlap each other.
+    max_ends = []
+    for _, end in stored:
+        max_ends.append(end if not max_ends or end > max_ends[-1] else max_ends[-1])
+    conflicts = []
+    for start, end in intervals:
+        position = bisect_left(starts, end)
+        conflicts.append(position > 0 and max_ends[position - 1] > start)
+    return conflicts
+
+
+def delete_written_shifts(entities: List[Any]) -> None:
+    by_worker: Dict[int, List[int]] = {}
+    for entity in entities:
+        by_worker.setdefault(entity["worker_id"], []).append(entity.key.id)
+    for worker_id, shift_ids in by_worker.items():
+        delete_entities("Shift", shift_ids, parent=worker_parent(worker_id))
+    if by_worker:
+        bump_data_version("Shift")
+
+
+def create_shifts_batch(items: List[Tuple[int, str, str]], atomic: bool = True) -> dict:
+    results: List[dict] = [{"index": index, "status": "created", "shift": None, "error": None} for index in range(len(items))]
+
+    def fail(index: int, error: str) -> None:
+        results[index]["status"] = "failed"
+        results[index]["error"] = error
+
+    workers = get_entities_by_ids("Worker", {worker_id for worker_id, _, _ in items})
+    by_worker: Dict[int, List[Tuple[datetime, datetime, int]]] = {}
+    for index, (worker_id, start, end) in enumerate(items):
+        if worker_id not in workers:
+            fail(index, "Worker not found")
+            continue
+        by_worker.setdefault(worker_id, []).append((to_utc(start), to_utc(end), index))
+
+    for worker_id, entries in by_worker.items():
+        entries.sort()
+        stored_conflicts = find_stored_conflicts(worker_id, [(start, end) for start, end, _ in entries])
+        accepted_end = None
+        for (start, end, index), stored_conflict in zip(entries, stored_conflicts):
+            if stored_conflict:
+                fail(index, SHIFT_OVERLAP_ERROR)
+            elif accepted_end is not None and start < accepted_end:
+                fail(index, "Shift overlaps with another shift in this batch")
+            else:
+                accepted_end = end if accepted_end is None else max(accepted_end, end)
+
+    failed = sum(1 for result in results if result["status"] == "failed")
+    pending = [
+        (index, worker_id, start_utc, end_utc)
+        for worker_id, entries in by_worker.items()
+        for start_utc, end_utc, index in entries
+        if results[index]["status"] == "created"
+    ]
+    pending.sort()
+    if atomic and failed:
+        for index, _, _, _ in pending:
+            results[index]["status"] = "skipped"
+        return {"created": 0, "failed": failed, "results": results}
+
+    shift_ids = allocate_ids("Shift", len(pending)) if pending else []
+    by_pending_worker: Dict[int, List[Tuple[int, int, datetime, datetime]]] = {}
+    for (index, worker_id, start_utc, end_utc), shift_id in zip(pending, shift_ids):
+        by_pending_worker.setdefault(worker_id, []).append((index, shift_id, start_utc, end_utc))
+
+    if atomic and len(pending) <= MAX_BATCH_WRITE and len(by_pending_worker) <= MAX_TRANSACTION_GROUPS:
+        return write_shift_batch_in_one_transaction(by_pending_worker, pending, results)
+
+    # Too large for one transaction (or not atomic): each chunk is written in
+    # one transaction on its worker's entity group that re-checks the stored
+    # shifts, so a concurrent write cannot slip in between. An atomic batch is
+    # undone by deleting the chunks already written when a later one fails, so
+    # readers can briefly see part of it, and a crash part-way leaves it there.
+    written: List[Tuple[int, Any]] = []
+    for worker_id, entries in by_pending_worker.items():
+        for offset in range(0, len(entries), MAX_BATCH_WRITE):
+            chunk = entries[offset:offset + MAX_BATCH_WRITE]
+
+            def write(chunk=chunk, worker_id=worker_id) -> List[Any]:
+                # Read again here, as in write_new_shift, so a worker deleted
+                # since the checks above gets no shifts delete_worker missed.
+                if get_entity_by_id("Worker", worker_id) is None:
+                    raise ValueError("Worker not found")
+                if any(find_stored_conflicts(worker_id, [(start_utc, end_utc) for _, _, start_utc, end_utc in chunk], in_transaction=True)):
+                    raise ValueError(SHIFT_OVERLAP_ERROR)
+                return put_entities_by_ids("Shift", [
+                    (shift_id, shift_data(worker_id, shift_id, start_utc, end_utc))
+                    for _, shift_id, start_utc, end_utc in chunk
+                ], parent=worker_parent(worker_id), exclude_from_indexes=SHIFT_UNINDEXED_PROPERTIES)
+
+            try:
+                entities = run_in_transaction(write)
+            except ValueError as error:
+                # A concurrent write took the slot, or deleted the worker,
+                # after the checks above.
+                for index, _, _, _ in chunk:
+                    fail(index, str(error))
+                if atomic:
+                    delete_written_shifts([entity for _, entity in written])
+                    for index, _, _, _ in pending:
+                        if results[index]["status"] == "created":
+                            results[index]["status"] = "skipped"
+                    failed = sum(1 for result in results if result["status"] == "failed")
+                    return {"created": 0, "failed": failed, "results": results}
+                continue
+            except Exception:
+                if atomic:
+                    delete_written_shifts([entity for _, entity in written])
+                    raise
+                for index, _, _, _ in chunk:
+                    fail(index, "Failed to store shift")
+                continue
+            written.extend((index, entity) for (index, _, _, _), entity in zip(chunk, entities))
+
+    return finish_shift_batch(written, results)
+
+
+def write_shift_batch_in_one_transaction(by_worker: Dict[int, List[Tuple[int, int, datetime, datetime]]], pending: List[Tuple[int, int, datetime, datetime]], results: List[dict]) -> dict:
+    # Every worker and its stored shifts are re-checked and every shift written
+    # in a single transaction, so the batch commits or fails as a whole.
+    def write() -> Tuple[List[Tuple[int, str]], List[Tuple[int, Any]]]:
+        workers = get_entities_by_ids("Worker", list(by_worker))
+        rejected = []
+        for worker_id, entries in by_worker.items():
+            if worker_id not in workers:
+                rejected.extend((index, "Worker not found") for index, _, _, _ in entries)
+                continue
+            conflicts = find_stored_conflicts(worker_id, [(start_utc, end_utc) for _, _, start_utc, end_utc in entries], in_transaction=True)
+            rejected.extend((index, SHIFT_OVERLAP_ERROR) for (index, _, _, _), conflict in zip(entries, conflicts) if conflict)
+        if rejected:
+            # Returning without a write commits nothing.
+            return rejected, []
+        written = []
+        for worker_id, entries in by_worker.items():
+            entities = put_entities_by_ids("Shift", [
+                (shift_id, shift_data(worker_id, shift_id, start_utc, end_utc))
+                for _, shift_id, start_utc, end_utc in entries
+            ], parent=worker_parent(worker_id), exclude_from_indexes=SHIFT_UNINDEXED_PROPERTIES)
+            written.extend((index, entity) for (index, _, _, _), entity in zip(entries, entities))
+        return [], written
+
+    rejected, written = run_in_transaction(write)
+    if rejected:
+        # A concurrent write took a slot, or deleted a worker, after the checks
+        # outside the transaction.
+        for index, error in rejected:
+            results[index]["status"] = "failed"
+            results[index]["error"] = error
+        for index, _, _, _ in pending:
+            if results[index]["status"] == "created":
+                results[index]["status"] = "skipped"
+        failed = sum(1 for result in results if result["status"] == "failed")
+        return {"created": 0, "failed": failed, "results": results}
+    return finish_shift_batch(written, results)
+
+
+def finish_shift_batch(written: List[Tuple[int, Any]], results: List[dict]) -> dict:
+    written.sort(key=lambda item: item[0])
+    if written:
+        bump_data_version("Shift")
+    for _, entity in written:
+        _shift_index.add(entity["worker_id"], entity.key.id, entity["start_utc"], entity["end_utc"])
+    timezone_setting = get_timezone_setting()
+    shifts = shifts_to_dicts([entity for _, entity in written], timezone_setting)
+    for (index, _), shift in zip(written, shifts):
+        results[index]["shift"] = shift
+    failed = sum(1 for result in results if result["status"] == "failed")
+    return {"created": len(written), "failed": failed, "results": results}
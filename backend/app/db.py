@@ -1,74 +1,287 @@
+import base64
+import binascii
 import os
-from typing import Optional, List, Any
+import random
+import time
+from typing import Optional, List, Any, Tuple, Dict, Iterable, Iterator, Callable
+from google.api_core.exceptions import Conflict
 from google.cloud import datastore
+from app.metrics import instrument_rpc, instrument_transaction
+from app.settings import SQLITE_PATH, STORAGE_BACKEND, TRACING_ENABLED, TRANSACTION_MAX_ATTEMPTS, TRANSACTION_RETRY_DELAY_SECONDS
+from app.storage import Storage
+from app.tracing import TracedStorage
 
 
-_client = None
+_storage: Optional[Storage] = None
 
+Parent = Optional[Tuple[str, int]]
 
-def get_client():
-    global _client
-    if _client is None:
-        project_id = os.environ.get("DATASTORE_PROJECT_ID", "local-project")
-        _client = datastore.Client(project=project_id)
-    return _client
+# Datastore accepts at most 500 entities per commit and 1000 keys per lookup,
+# and a transaction may touch at most 25 entity groups.
+MAX_BATCH_WRITE = 500
+MAX_BATCH_READ = 1000
+MAX_TRANSACTION_GROUPS = 25
 
 
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    project_id = os.environ.get("DATASTORE_PROJECT_ID", "local-project")
+    if backend == "datastore":
+        from app.storage_datastore import DatastoreStorage
+        return DatastoreStorage(project_id)
+    if backend == "memory":
+        from app.storage_memory import MemoryStorage
+        return MemoryStorage(project_id)
+    if backend == "sqlite":
+        from app.storage_sqlite import SqliteStorage
+        return SqliteStorage(project_id, SQLITE_PATH)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def traced_storage(storage: Storage) -> Storage:
+    return TracedStorage(storage) if TRACING_ENABLED else storage
+
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        _storage = traced_storage(create_storage())
+    return _storage
+
+
+def set_storage(storage: Optional[Storage]) -> None:
+    global _storage
+    _storage = traced_storage(storage) if storage is not None else None
+
+
+@instrument_rpc
 def get_entity(kind: str, key_name: str) -> Optional[Any]:
-    client = get_client()
-    key = client.key(kind, key_name)
-    return client.get(key)
+    entities = get_storage().get_multi([entity_key(kind, key_name)])
+    return entities[0] if entities else None
+
+
+@instrument_rpc
+def query_projection(kind: str, properties: List[str], filters: Optional[List[Tuple[str, str, Any]]] = None, order: Optional[List[str]] = None, ancestor: Parent = None, key: Any = None, limit: Optional[int] = None, distinct_on: Optional[List[str]] = None) -> List[Any]:
+    # Only the listed properties are read and sent back, straight from the
+    # index: entities without an indexed value for each are skipped, and
+    # timestamps may come back as integer microseconds. ["__key__"] is keys-only.
+    entities, _ = get_storage().query(
+        kind, filters or [], ancestor=ancestor, key=key, projection=properties, order=order, distinct_on=distinct_on, limit=limit
+    )
+    return entities
+
+
+@instrument_rpc
+def query_keys(kind: str, filters: Optional[List[Tuple[str, str, Any]]] = None, ancestor: Parent = None) -> List[Any]:
+    return [entity.key for entity in query_projection(kind, ["__key__"], filters, ancestor=ancestor)]
+
+
+@instrument_rpc
+def get_entity_projection(kind: str, key_name: str, properties: List[str]) -> Optional[Any]:
+    results = query_projection(kind, properties, key=entity_key(kind, key_name), limit=1)
+    return results[0] if results else None
 
 
-def put_entity(kind: str, key_name: str, data: dict) -> Any:
-    client = get_client()
-    key = client.key(kind, key_name)
-    entity = datastore.Entity(key=key)
+@instrument_rpc
+def entity_exists(kind: str, entity_id: int, parent: Parent = None) -> bool:
+    return bool(query_projection(kind, ["__key__"], key=entity_key(kind, entity_id, parent), limit=1))
+
+
+@instrument_rpc
+def put_entity(kind: str, key_name: str, data: dict, exclude_from_indexes: Tuple[str, ...] = ()) -> Any:
+    entity = datastore.Entity(key=entity_key(kind, key_name), exclude_from_indexes=exclude_from_indexes)
     entity.update(data)
-    client.put(entity)
+    get_storage().put_multi([entity])
     return entity
 
 
+@instrument_rpc
 def list_entities(kind: str) -> List[Any]:
-    client = get_client()
-    query = client.query(kind=kind)
-    return list(query.fetch())
+    entities, _ = get_storage().query(kind)
+    return entities
 
 
-def delete_entity(kind: str, entity_id: int) -> None:
-    client = get_client()
-    key = client.key(kind, entity_id)
-    client.delete(key)
+@instrument_rpc
+def list_entities_page(kind: str, limit: int, cursor: Optional[str] = None, filters: Optional[List[Tuple[str, str, Any]]] = None, order: Optional[List[str]] = None) -> Tuple[List[Any], Optional[str]]:
+    if cursor:
+        _decode_cursor(cursor)
+    return get_storage().query(kind, filters or [], order=order, limit=limit, cursor=cursor)
 
 
-def get_entity_by_id(kind: str, entity_id: int) -> Optional[Any]:
-    client = get_client()
-    key = client.key(kind, entity_id)
-    return client.get(key)
+@instrument_rpc
+def iter_entity_pages(kind: str, page_size: int, filters: Optional[List[Tuple[str, str, Any]]] = None, order: Optional[List[str]] = None) -> Iterator[List[Any]]:
+    # One query RPC per page, resumed from the previous page's cursor, so only
+    # a single page is held in memory at a time.
+    storage = get_storage()
+    cursor = None
+    while True:
+        entities, cursor = storage.query(kind, filters or [], order=order, limit=page_size, cursor=cursor)
+        if not entities:
+            return
+        yield entities
+        if cursor is None:
+            return
 
 
-def put_entity_with_auto_id(kind: str, data: dict) -> Any:
-    client = get_client()
-    key = client.key(kind)
-    entity = datastore.Entity(key=key)
+@instrument_rpc
+def list_keys_page(kind: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[Any], Optional[str]]:
+    # Keys-only and in key order, so a walk over a whole kind is cheap and can
+    # be resumed from the returned cursor.
+    if cursor:
+        _decode_cursor(cursor)
+    entities, next_cursor = get_storage().query(kind, projection=["__key__"], order=["__key__"], limit=limit, cursor=cursor)
+    return [entity.key for entity in entities], next_cursor
+
+
+def _decode_cursor(cursor: str) -> bytes:
+    try:
+        base64.urlsafe_b64decode(cursor.encode("ascii"))
+    except (binascii.Error, UnicodeEncodeError):
+        raise ValueError("Invalid cursor")
+    return cursor.encode("ascii")
+
+
+def entity_key(kind: str, entity_id: Optional[Any] = None, parent: Parent = None) -> Any:
+    path = list(parent or ()) + [kind]
+    if entity_id is not None:
+        path.append(entity_id)
+    return get_storage().key(*path)
+
+
+@instrument_transaction
+def run_in_transaction(operation: Callable[[], Any], max_attempts: int = TRANSACTION_MAX_ATTEMPTS) -> Any:
+    # Reads, queries and writes made by `operation` join the transaction; it is
+    # re-run from scratch when the commit loses to a concurrent write.
+    storage = get_storage()
+    for attempt in range(max_attempts):
+        try:
+            with storage.transaction():
+                return operation()
+        except Conflict:
+            if attempt == max_attempts - 1:
+                raise
+            time.sleep(TRANSACTION_RETRY_DELAY_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+@instrument_rpc
+def delete_entity(kind: str, entity_id: int, parent: Parent = None) -> None:
+    get_storage().delete_multi([entity_key(kind, entity_id, parent)])
+
+
+@instrument_rpc
+def get_entity_by_id(kind: str, entity_id: int, parent: Parent = None) -> Optional[Any]:
+    entities = get_storage().get_multi([entity_key(kind, entity_id, parent)])
+    return entities[0] if entities else None
+
+
+@instrument_rpc
+def put_entity_by_id(kind: str, entity_id: int, data: dict, parent: Parent = None, exclude_from_indexes: Tuple[str, ...] = ()) -> Any:
+    entity = datastore.Entity(key=entity_key(kind, entity_id, parent), exclude_from_indexes=exclude_from_indexes)
     entity.update(data)
-    client.put(entity)
+    get_storage().put_multi([entity])
     return entity
 
 
-def update_entity_by_id(kind: str, entity_id: int, data: dict) -> Optional[Any]:
-    client = get_client()
-    key = client.key(kind, entity_id)
-    entity = client.get(key)
-    if entity is None:
-        return None
+@instrument_rpc
+def find_entity_key(kind: str, property_name: str, property_value: Any) -> Optional[Any]:
+    results = query_projection(kind, ["__key__"], [(property_name, "=", property_value)], limit=1)
+    return results[0].key if results else None
+
+
+@instrument_rpc
+def put_entity_with_auto_id(kind: str, data: dict) -> Any:
+    entity = datastore.Entity(key=entity_key(kind))
     entity.update(data)
-    client.put(entity)
+    get_storage().put_multi([entity])
     return entity
 
 
-def list_entities_by_property(kind: str, property_name: str, property_value: Any) -> List[Any]:
-    client = get_client()
-    query = client.query(kind=kind)
-    query.add_filter(property_name, "=", property_value)
-    return list(query.fetch())
+@instrument_rpc
+def update_entity_by_id(kind: str, entity_id: int, data: dict) -> Optional[Any]:
+    def update() -> Optional[Any]:
+        entity = get_entity_by_id(kind, entity_id)
+        if entity is None:
+            return None
+        entity.update(data)
+        get_storage().put_multi([entity])
+        return entity
+
+    return run_in_transaction(update)
+
+
+@instrument_rpc
+def query_entities(kind: str, filters: List[Tuple[str, str, Any]], projection: Optional[List[str]] = None, order: Optional[List[str]] = None, ancestor: Parent = None) -> List[Any]:
+    entities, _ = get_storage().query(kind, filters, ancestor=ancestor, projection=projection, order=order)
+    return entities
+
+
+@instrument_rpc
+def get_entities_by_ids(kind: str, entity_ids: Iterable[int]) -> Dict[int, Any]:
+    keys = [entity_key(kind, entity_id) for entity_id in entity_ids]
+    entities = {}
+    for entity in get_entities_by_keys(keys):
+        entities[entity.key.id] = entity
+    return entities
+
+
+@instrument_rpc
+def get_entities_by_keys(keys: List[Any]) -> List[Any]:
+    storage = get_storage()
+    entities = []
+    for offset in range(0, len(keys), MAX_BATCH_READ):
+        entities.extend(storage.get_multi(keys[offset:offset + MAX_BATCH_READ]))
+    return entities
+
+
+@instrument_rpc
+def put_entities(entities: List[Any], chunk_size: int = MAX_BATCH_WRITE) -> None:
+    storage = get_storage()
+    for offset in range(0, len(entities), chunk_size):
+        storage.put_multi(entities[offset:offset + chunk_size])
+
+
+@instrument_rpc
+def allocate_ids(kind: str, count: int) -> List[int]:
+    return get_storage().allocate_ids(kind, count)
+
+
+@instrument_rpc
+def put_entities_by_ids(kind: str, items: List[Tuple[int, dict]], chunk_size: int = MAX_BATCH_WRITE, parent: Parent = None, exclude_from_indexes: Tuple[str, ...] = ()) -> List[Any]:
+    entities = []
+    for entity_id, data in items:
+        entity = datastore.Entity(key=entity_key(kind, entity_id, parent), exclude_from_indexes=exclude_from_indexes)
+        entity.update(data)
+        entities.append(entity)
+    put_entities(entities, chunk_size)
+    return entities
+
+
+@instrument_rpc
+def put_entities_with_parents(kind: str, items: List[Tuple[Parent, int, dict]], chunk_size: int = MAX_BATCH_WRITE, exclude_from_indexes: Tuple[str, ...] = ()) -> List[Any]:
+    entities = []
+    for parent, entity_id, data in items:
+        entity = datastore.Entity(key=entity_key(kind, entity_id, parent), exclude_from_indexes=exclude_from_indexes)
+        entity.update(data)
+        entities.append(entity)
+    put_entities(entities, chunk_size)
+    return entities
+
+
+@instrument_rpc
+def reserve_ids(kind: str, entity_ids: List[int]) -> None:
+    # Keeps IDs assigned outside the store from being handed out by allocate_ids.
+    storage = get_storage()
+    keys = [entity_key(kind, entity_id) for entity_id in entity_ids]
+    for offset in range(0, len(keys), MAX_BATCH_READ):
+        storage.reserve_ids(keys[offset:offset + MAX_BATCH_READ])
+
+
+@instrument_rpc
+def delete_entities(kind: str, entity_ids: List[int], chunk_size: int = MAX_BATCH_WRITE, parent: Parent = None) -> None:
+    delete_keys([entity_key(kind, entity_id, parent) for entity_id in entity_ids], chunk_size)
+
+
+@instrument_rpc
+def delete_keys(keys: List[Any], chunk_size: int = MAX_BATCH_WRITE) -> None:
+    storage = get_storage()
+    for offset in range(0, len(keys), chunk_size):
+        storage.delete_multi(keys[offset:offset + chunk_size])
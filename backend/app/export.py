@@ -0,0 +1,26 @@
+import csv
+import io
+import json
+from typing import Iterable, Iterator, List
+
+SHIFT_EXPORT_FIELDS = ["id", "worker_id", "start", "end", "duration_hours"]
+
+
+def ndjson_lines(pages: Iterable[List[dict]]) -> Iterator[bytes]:
+    for shifts in pages:
+        if shifts:
+            yield "".join(json.dumps(shift, separators=(",", ":")) + "\n" for shift in shifts).encode("utf-8")
+
+
+def csv_lines(pages: Iterable[List[dict]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=SHIFT_EXPORT_FIELDS, lineterminator="\n")
+    writer.writeheader()
+    yield buffer.getvalue().encode("utf-8")
+    for shifts in pages:
+        if not shifts:
+            continue
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(shifts)
+        yield buffer.getvalue().encode("utf-8")
@@ -0,0 +1,39 @@
+import argparse
+import json
+import sys
+import time
+
+from app.importer import IMPORT_COLUMNS, start_import
+from app.settings import IMPORT_CHUNK_SIZE, IMPORT_MAX_IN_FLIGHT
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import shifts or workers from a CSV file")
+    parser.add_argument("kind", choices=sorted(IMPORT_COLUMNS))
+    parser.add_argument("path", help="CSV file with a header row")
+    parser.add_argument("--job-id", help="Resume this import job from its last checkpoint")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    parser.add_argument("--max-in-flight", type=int, default=IMPORT_MAX_IN_FLIGHT)
+    parser.add_argument("--progress-every", type=float, default=2.0, help="Seconds between progress lines")
+    args = parser.parse_args()
+
+    with open(args.path, "rb") as stream:
+        events = start_import(args.kind, stream, args.job_id, args.chunk_size, args.max_in_flight)
+        last_report = 0.0
+        event = None
+        for event in events:
+            if last_report == 0.0:
+                print(f"Import job {event['job_id']} (resume with --job-id {event['job_id']})", file=sys.stderr)
+            now = time.monotonic()
+            if now - last_report >= args.progress_every:
+                print(
+                    f"rows {event['rows_committed']:,}  created {event['created']:,}  "
+                    f"duplicates {event['duplicates']:,}  failed {event['failed']:,}",
+                    file=sys.stderr
+                )
+                last_report = now
+    print(json.dumps(event, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+import csv
+import io
+import json
+import uuid
+from bisect import bisect_left, insort
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from pydantic import ValidationError
+
+from app.crud import _shift_index, bump_data_version, find_overlap_candidates, find_stored_conflicts, projected_datetime, shift_data, to_utc, worker_parent, SHIFT_OVERLAP_ERROR, SHIFT_UNINDEXED_PROPERTIES
+from app.db import allocate_ids, entity_key, get_entities_by_ids, get_entities_by_keys, get_entity, get_entity_by_id, put_entities_by_ids, put_entity, query_keys, delete_keys, reserve_ids, run_in_transaction, MAX_BATCH_WRITE
+from app.models import ShiftCreate, WorkerCreate
+from app.settings import IMPORT_CHUNK_SIZE, IMPORT_MAX_IN_FLIGHT, IMPORT_MAX_REPORTED_ERRORS
+
+
+IMPORT_COLUMNS = {
+    "shifts": ["worker_id", "start", "end"],
+    "workers": ["name"],
+}
+IMPORT_COUNTERS = ["rows_read", "rows_committed", "created", "duplicates", "failed"]
+
+NumberedRow = Tuple[int, Dict[str, str]]
+RowError = Tuple[int, str]
+# A chunk's write returns how many entities it created and the rows it had to
+# reject after prepare() accepted them.
+ChunkWrite = Callable[[], Tuple[int, List[RowError]]]
+
+
+def new_import_state(job_id: str, kind: str) -> dict:
+    state = {"job_id": job_id, "kind": kind, "status": "running", "errors": []}
+    state.update({counter: 0 for counter in IMPORT_COUNTERS})
+    return state
+
+
+def load_import_state(job_id: str) -> Optional[dict]:
+    entity = get_entity("ImportJob", job_id)
+    if entity is None:
+        return None
+    state = new_import_state(job_id, entity["kind"])
+    state["status"] = entity["status"]
+    state.update({counter: entity.get(counter, 0) for counter in IMPORT_COUNTERS})
+    state["errors"] = json.loads(entity.get("errors_json", "[]"))
+    return state
+
+
+def save_import_state(state: dict) -> None:
+    data = {key: value for key, value in state.items() if key not in ("job_id", "errors")}
+    data["errors_json"] = json.dumps(state["errors"])
+    put_entity("ImportJob", state["job_id"], data, exclude_from_indexes=("errors_json",))
+
+
+def row_error_message(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(detail["msg"].removeprefix("Value error, ") for detail in error.errors())
+    return str(error)
+
+
+class ShiftImportChunks:
+    def __init__(self):
+        self._known_workers: Set[int] = set()
+        # Intervals handed to writes that have not committed yet, by chunk, so
+        # the next chunk's checks see them before Datastore does.
+        self._in_flight: Dict[int, Dict[int, List[Tuple[datetime, datetime]]]] = {}
+        self._next_token = 0
+
+    def prepare(self, chunk: List[NumberedRow]) -> Tuple[int, ChunkWrite, int, List[RowError]]:
+        errors: List[RowError] = []
+        candidates: List[Tuple[int, int, datetime, datetime]] = []
+        for row_number, row in chunk:
+            try:
+                shift = ShiftCreate(worker_id=row.get("worker_id"), start=row.get("start"), end=row.get("end"))
+            except (ValidationError, TypeError) as error:
+                errors.append((row_number, row_error_message(error)))
+                continue
+            candidates.append((row_number, shift.worker_id, to_utc(shift.start), to_utc(shift.end)))
+
+        unknown = {worker_id for _, worker_id, _, _ in candidates} - self._known_workers
+        if unknown:
+            self._known_workers.update(get_entities_by_ids("Worker", unknown))
+
+        by_worker: Dict[int, List[Tuple[datetime, datetime, int]]] = {}
+        for row_number, worker_id, start_utc, end_utc in candidates:
+            if worker_id not in self._known_workers:
+                errors.append((row_number, "Worker not found"))
+                continue
+            by_worker.setdefault(worker_id, []).append((start_utc, end_utc, row_number))
+
+        accepted: Dict[int, List[Tuple[datetime, datetime, int]]] = {}
+        duplicates = 0
+        for worker_id, rows in by_worker.items():
+            rows.sort()
+            taken = self._taken_intervals(worker_id, rows[0][0], max(end for _, end, _ in rows))
+            for start_utc, end_utc, row_number in rows:
+                position = bisect_left(taken, (start_utc, end_utc))
+                if position < len(taken) and taken[position] == (start_utc, end_utc):
+                    duplicates += 1
+                elif (position > 0 and taken[position - 1][1] > start_utc) or (position < len(taken) and taken[position][0] < end_utc):
+                    errors.append((row_number, SHIFT_OVERLAP_ERROR))
+                else:
+                    insort(taken, (start_utc, end_utc))
+                    accepted.setdefault(worker_id, []).append((start_utc, end_utc, row_number))
+
+        token = self._next_token
+        self._next_token += 1
+        self._in_flight[token] = {
+            worker_id: [(start_utc, end_utc) for start_utc, end_utc, _ in rows]
+            for worker_id, rows in accepted.items()
+        }
+
+        def write() -> Tuple[int, List[RowError]]:
+            pending = sum(len(rows) for rows in accepted.values())
+            if not pending:
+                return 0, []
+            shift_ids = iter(allocate_ids("Shift", pending))
+            created = 0
+            rejected: List[RowError] = []
+            for worker_id, rows in accepted.items():
+                for offset in range(0, len(rows), MAX_BATCH_WRITE):
+                    written, late_errors = write_worker_shifts(worker_id, [
+                        (shift_id, start_utc, end_utc, row_number)
+                        for (start_utc, end_utc, row_number), shift_id in zip(rows[offset:offset + MAX_BATCH_WRITE], shift_ids)
+                    ])
+                    created += written
+                    rejected.extend(late_errors)
+            return created, rejected
+
+        return token, write, duplicates, sorted(errors)
+
+    def release(self, token: int) -> None:
+        for worker_id in self._in_flight.pop(token, {}):
+            _shift_index.invalidate(worker_id)
+
+    def finish(self) -> None:
+        pass
+
+    def _taken_intervals(self, worker_id: int, window_start: datetime, window_end: datetime) -> List[Tuple[datetime, datetime]]:
+        taken = [
+            (projected_datetime(entity["start_utc"]), projected_datetime(entity["end_utc"]))
+            for entity in find_overlap_candidates(worker_id, window_start, window_end)
+        ]
+        for intervals in self._in_flight.values():
+            taken.extend(intervals.get(worker_id, ()))
+        taken.sort()
+        return taken
+
+
+def write_worker_shifts(worker_id: int, rows: List[Tuple[int, datetime, datetime, int]]) -> Tuple[int, List[RowError]]:
+    # The checks in prepare() ran outside any transaction, so the worker's
+    # entity group is checked again where the shifts are written, as
+    # write_new_shift does; rows a concurrent write got to first are reported.
+    def write() -> Tuple[int, List[RowError]]:
+        if get_entity_by_id("Worker", worker_id) is None:
+            return 0, [(row_number, "Worker not found") for _, _, _, row_number in rows]
+        conflicts = find_stored_conflicts(worker_id, [(start_utc, end_utc) for _, start_utc, end_utc, _ in rows], in_transaction=True)
+        free = [row for row, conflict in zip(rows, conflicts) if not conflict]
+        if free:
+            put_entities_by_ids("Shift", [
+                (shift_id, shift_data(worker_id, shift_id, start_utc, end_utc))
+                for shift_id, start_utc, end_utc, _ in free
+            ], parent=worker_parent(worker_id), exclude_from_indexes=SHIFT_UNINDEXED_PROPERTIES)
+        return len(free), [(row_number, SHIFT_OVERLAP_ERROR) for (_, _, _, row_number), conflict in zip(rows, conflicts) if conflict]
+
+    return run_in_transaction(write)
+
+
+class WorkerImportChunks:
+    def __init__(self, job_id: str):
+        self._job_id = job_id
+        self._seen_ids: Set[int] = set()
+
+    def prepare(self, chunk: List[NumberedRow]) -> Tuple[int, ChunkWrite, int, List[RowError]]:
+        errors: List[RowError] = []
+        with_ids: List[Tuple[int, int, str]] = []
+        without_ids: List[Tuple[int, str]] = []
+        duplicates = 0
+        for row_number, row in chunk:
+            try:
+                worker = WorkerCreate(name=row.get("name"))
+            except ValidationError as error:
+                errors.append((row_number, row_error_message(error)))
+                continue
+            raw_id = (row.get("id") or "").strip()
+            if not raw_id:
+                without_ids.append((row_number, worker.name))
+                continue
+            try:
+                worker_id = int(raw_id)
+            except ValueError:
+                worker_id = 0
+            if worker_id <= 0:
+                errors.append((row_number, f"Invalid worker id: {raw_id}"))
+            elif worker_id in self._seen_ids:
+                duplicates += 1
+            else:
+                self._seen_ids.add(worker_id)
+                with_ids.append((row_number, worker_id, worker.name))
+
+        # Rows without an id get the worker ID recorded for their row the first
+        # time this job wrote them, so a resumed job writes the same workers
+        # again instead of creating copies.
+        assigned = {
+            int(entity.key.name.rsplit(":", 1)[1]): entity["worker_id"]
+            for entity in get_entities_by_keys([entity_key("ImportRow", self._row_key(row_number)) for row_number, _ in without_ids])
+        }
+        existing = get_entities_by_ids("Worker", [worker_id for _, worker_id, _ in with_ids] + list(assigned.values()))
+
+        new_workers: List[Tuple[int, dict]] = []
+        for row_number, worker_id, name in with_ids:
+            if worker_id not in existing:
+                new_workers.append((worker_id, {"name": name}))
+            elif existing[worker_id]["name"] == name:
+                # Already written, by this job before it was resumed or by an
+                # earlier import of the same file.
+                duplicates += 1
+            else:
+                errors.append((row_number, f"Worker {worker_id} already exists"))
+        unassigned: List[Tuple[int, str]] = []
+        for row_number, name in without_ids:
+            if row_number not in assigned:
+                unassigned.append((row_number, name))
+            elif assigned[row_number] in existing:
+                duplicates += 1
+            else:
+                new_workers.append((assigned[row_number], {"name": name}))
+
+        def write() -> Tuple[int, List[RowError]]:
+            if with_ids:
+                reserve_ids("Worker", [worker_id for _, worker_id, _ in with_ids])
+            if unassigned:
+                worker_ids = allocate_ids("Worker", len(unassigned))
+                # Recorded before the workers are, so a crash in between still
+                # leaves the resumed job with the same IDs.
+                put_entities_by_ids("ImportRow", [
+                    (self._row_key(row_number), {"job_id": self._job_id, "worker_id": worker_id})
+                    for (row_number, _), worker_id in zip(unassigned, worker_ids)
+                ])
+                new_workers.extend((worker_id, {"name": name}) for (_, name), worker_id in zip(unassigned, worker_ids))
+            put_entities_by_ids("Worker", new_workers)
+            return len(new_workers), []
+
+        return 0, write, duplicates, sorted(errors)
+
+    def _row_key(self, row_number: int) -> str:
+        return f"{self._job_id}:{row_number}"
+
+    def release(self, token: int) -> None:
+        pass
+
+    def finish(self) -> None:
+        # The recorded IDs only matter to a resumed job. A job that failed
+        # keeps them until it is resumed and completes.
+        delete_keys(query_keys("ImportRow", [("job_id", "=", self._job_id)]))
+
+
+def open_import(kind: str, stream: BinaryIO, job_id: Optional[str] = None) -> Tuple[dict, Iterator[Dict[str, str]]]:
+    # Header and job problems are raised here, before any row is processed.
+    if kind not in IMPORT_COLUMNS:
+        raise ValueError(f"Unknown import kind: {kind}")
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    missing = [column for column in IMPORT_COLUMNS[kind] if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {', '.join(missing)}")
+    if job_id is None:
+        return new_import_state(uuid.uuid4().hex, kind), reader
+    state = load_import_state(job_id)
+    if state is None:
+        return new_import_state(job_id, kind), reader
+    if state["kind"] != kind:
+        raise ValueError(f"Import job {job_id} is a {state['kind']} import")
+    return state, reader
+
+
+def run_import(state: dict, rows: Iterable[Dict[str, str]], chunk_size: int = IMPORT_CHUNK_SIZE, max_in_flight: int = IMPORT_MAX_IN_FLIGHT) -> Iterator[dict]:
+    # Up to `max_in_flight` chunks are being written while the next one is
+    # parsed and checked. The checkpoint only advances past a chunk once it and
+    # every chunk before it have committed; a resumed job skips that many rows,
+    # and rows written after the checkpoint come back as duplicates.
+    if state["status"] == "completed":
+        yield progress_event(state, final=True)
+        return
+    chunks = ShiftImportChunks() if state["kind"] == "shifts" else WorkerImportChunks(state["job_id"])
+    numbered = enumerate(rows, start=1)
+    resume_from = state["rows_committed"]
+    for _ in islice(numbered, resume_from):
+        pass
+    state["rows_read"] = resume_from
+    state["status"] = "running"
+    save_import_state(state)
+
+    in_flight = deque()
+
+    def commit_oldest() -> dict:
+        future, token, last_row, duplicates, errors = in_flight.popleft()
+        created, rejected = future.result()
+        errors = sorted(errors + rejected)
+        chunks.release(token)
+        if created:
+            bump_data_version("Shift" if state["kind"] == "shifts" else "Worker")
+        state["created"] += created
+        state["duplicates"] += duplicates
+        state["failed"] += len(errors)
+        room = IMPORT_MAX_REPORTED_ERRORS - len(state["errors"])
+        state["errors"].extend({"row": row_number, "error": message} for row_number, message in errors[:max(room, 0)])
+        state["rows_committed"] = last_row
+        save_import_state(state)
+        return progress_event(state)
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        try:
+            while True:
+                chunk = list(islice(numbered, chunk_size))
+                if not chunk:
+                    break
+                state["rows_read"] = chunk[-1][0]
+                token, write, duplicates, errors = chunks.prepare(chunk)
+                in_flight.append((executor.submit(write), token, chunk[-1][0], duplicates, errors))
+                if len(in_flight) >= max_in_flight:
+                    yield commit_oldest()
+            while in_flight:
+                yield commit_oldest()
+        except BaseException:
+            state["status"] = "failed"
+            save_import_state(state)
+            raise
+
+    # Before the job is marked completed, so a crash in between leaves it to
+    # be resumed, which finishes it again.
+    chunks.finish()
+    state["status"] = "completed"
+    save_import_state(state)
+    yield progress_event(state, final=True)
+
+
+def progress_event(state: dict, final: bool = False) -> dict:
+    event = {key: value for key, value in state.items() if key != "errors"}
+    if final:
+        event["errors"] = list(state["errors"])
+    return event
+
+
+def start_import(kind: str, stream: BinaryIO, job_id: Optional[str] = None, chunk_size: int = IMPORT_CHUNK_SIZE, max_in_flight: int = IMPORT_MAX_IN_FLIGHT) -> Iterator[dict]:
+    state, rows = open_import(kind, stream, job_id)
+    return run_import(state, rows, chunk_size, max_in_flight)
@@ -1,15 +1,38 @@
-import os
-from typing import List
-from fastapi import FastAPI, HTTPException, Response, status
+import json
+from tempfile import SpooledTemporaryFile
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
+from fastapi import BackgroundTasks, FastAPI, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import ValidationError
-from app.models import TimezoneSettings, Worker, WorkerCreate, WorkerUpdate, ShiftResponse, ShiftCreate, ShiftUpdate
-from app.crud import (
+from pydantic_core import to_json
+from app.models import TimezoneSettings, Worker, WorkerCreate, WorkerUpdate, WorkerPage, WorkerBatchCreate, ShiftResponse, ShiftCreate, ShiftUpdate, ShiftPage, ShiftBatchCreate, ShiftBatchResponse, ImportJobStatus, WorkerDeletionJob, HoursReport, CoverageReport
+from app.async_crud import (
     get_timezone_setting, update_timezone_setting,
-    list_workers, create_worker, get_worker, update_worker, delete_worker,
-    list_shifts, create_shift, get_shift, update_shift, delete_shift
+    list_workers, list_workers_page, create_worker, create_workers_batch, get_workers_by_ids, get_worker, update_worker, delete_worker, validate_worker_exists,
+    count_worker_shifts, start_worker_deletion, run_worker_deletion, get_worker_deletion,
+    list_shifts, list_shifts_page, export_shifts, create_shift, create_shifts_batch, get_shift, update_shift, delete_shift,
+    hours_report, coverage_report, start_import, get_import_job, data_etag
 )
+from app.async_db import configure_threadpool, run_sync
+from app.db import MAX_BATCH_WRITE, MAX_TRANSACTION_GROUPS
+from app.crud import get_settings_cache_stats, rebuild_shift_index
+from app.etags import etag_matches
+from app.export import csv_lines, ndjson_lines
+from app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, render_metrics
+from app.profiling import ProfilingMiddleware, get_profile, profiling_allowed
+from app.tracing import TracingMiddleware
+from app.timezones import load_timezone_catalog, timezone_catalog
+from app.settings import ENV, METRICS_ENABLED, TRACING_ENABLED, PROFILING_ENABLED, SHIFT_INDEX_ENABLED, SHIFT_INDEX_WARM_ON_STARTUP, COVERAGE_MAX_SLOTS, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, MAX_WORKER_BATCH_SIZE, IMPORT_SPOOL_BYTES, WORKER_DELETE_SYNC_MAX_SHIFTS, WORKER_DELETION_STALE_SECONDS
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_threadpool()
+    load_timezone_catalog()
+    if SHIFT_INDEX_ENABLED and SHIFT_INDEX_WARM_ON_STARTUP:
+        rebuild_shift_index()
+    yield
 
-ENV = os.getenv("ENV", "development")
 
 app = FastAPI(
     title="Shift Manager API",
@@ -17,8 +40,39 @@ app = FastAPI(
     description="API for managing workers and shift scheduling with timezone support",
     docs_url="/docs" if ENV != "production" else None,
     redoc_url="/redoc" if ENV != "production" else None,
+    lifespan=lifespan,
 )
 
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+if TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+
+def etag_headers(etag: str) -> dict:
+    # no-cache lets clients keep the body but revalidate it on every request.
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=etag_headers(etag))
+
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers.update(etag_headers(etag))
+
+
+def page_response(items: List[dict], next_cursor: Optional[str], etag: str) -> Response:
+    # List items come from crud already in response-model shape (shifts carry
+    # duration_hours), so returning encoded bytes skips FastAPI revalidating
+    # every item. The body holds the same JSON values a response_model would,
+    # but it is not byte-identical: to_json writes floats without exponents
+    # (0.00001 where json.dumps writes 1e-05). response_model still documents
+    # the shape.
+    return Response(to_json({"items": items, "next_cursor": next_cursor}), media_type="application/json", headers=etag_headers(etag))
+
 
 @app.get(
     "/",
@@ -44,6 +98,67 @@ def health_check():
     return {"status": "healthy"}
 
 
+@app.get(
+    "/metrics",
+    tags=["General"],
+    summary="Metrics",
+    description="Request latency and status counts per route, and app.db call counts and latencies per operation and entity kind, in the Prometheus text exposition format",
+    response_class=Response,
+    responses={
+        200: {
+            "description": "Metrics in Prometheus text format",
+            "content": {
+                "text/plain": {
+                    "example": 'http_requests_total{method="GET",route="/shifts",status="200"} 42'
+                }
+            },
+        },
+    },
+)
+def get_metrics():
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get(
+    "/debug/profiles/{profile_id}",
+    tags=["General"],
+    summary="Get Request Profile",
+    description="Retrieves a stored request profile by the ID returned in the `X-Profile-Id` header of a request sent with `X-Profile: 1` or `?profile=1`: top functions and call tree from a stack sampler, and allocation stats from tracemalloc. Only available when PROFILING_ENABLED is set; in production it also requires `X-Admin-Token`",
+    responses={
+        200: {
+            "description": "Profile retrieved successfully",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "request": {"id": "5f0c...", "method": "GET", "path": "/shifts", "query": "profile=1", "status": 200, "duration_ms": 182.4},
+                        "sample_interval_ms": 1.0,
+                        "samples": 176,
+                        "top_functions": [{"function": "app/tzconvert.py:137(batch_from_utc)", "own_samples": 41, "total_samples": 63, "own_ms": 42.5, "total_ms": 65.3}],
+                        "call_tree": [],
+                        "allocations": {"peak_bytes": 5242880, "retained_bytes": 10240, "top_lines": []}
+                    }
+                }
+            },
+        },
+        403: {
+            "description": "Profiling is not allowed",
+        },
+        404: {
+            "description": "Profiling disabled or profile not found",
+        },
+    },
+)
+def get_request_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not profiling_allowed(x_admin_token):
+        raise HTTPException(status_code=403, detail="Profiling is not allowed")
+    profile = get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+
 @app.get(
     "/settings/timezone",
     tags=["Settings"],
@@ -60,8 +175,8 @@ def health_check():
         },
     },
 )
-def get_timezone():
-    timezone = get_timezone_setting()
+async def get_timezone():
+    timezone = await get_timezone_setting()
     return {"timezone": timezone}
 
 
@@ -89,37 +204,120 @@ def get_timezone():
         },
     },
 )
-def put_timezone(settings: TimezoneSettings):
+async def put_timezone(settings: TimezoneSettings):
     try:
-        timezone = update_timezone_setting(settings.timezone)
+        timezone = await update_timezone_setting(settings.timezone)
         return {"timezone": timezone}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get(
+    "/settings/timezones",
+    tags=["Settings"],
+    summary="List Available Timezones",
+    description="Returns every IANA timezone name accepted by the timezone setting, sorted alphabetically. Responses carry an ETag; send it back in If-None-Match to get 304 Not Modified",
+    responses={
+        200: {
+            "description": "Timezone catalog retrieved successfully",
+            "content": {
+                "application/json": {
+                    "example": {"timezones": ["Africa/Abidjan", "America/New_York", "Europe/London", "UTC"]}
+                }
+            },
+        },
+        304: {
+            "description": "Timezone catalog unchanged since the ETag in If-None-Match",
+        },
+    },
+)
+def get_timezones(if_none_match: Optional[str] = Header(None)):
+    body, etag = timezone_catalog()
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get(
+    "/settings/cache",
+    tags=["Settings"],
+    summary="Get Settings Cache Statistics",
+    description="Returns hit and miss counts for this process's settings cache. Revalidations are hits served after a version check past the TTL",
+    responses={
+        200: {
+            "description": "Cache statistics retrieved successfully",
+            "content": {
+                "application/json": {
+                    "example": {"hits": 1520, "misses": 3, "revalidations": 41, "entries": 1, "ttl_seconds": 30.0}
+                }
+            },
+        },
+    },
+)
+def get_settings_cache():
+    return get_settings_cache_stats()
+
+
 @app.get(
     "/workers",
-    response_model=List[Worker],
+    response_model=WorkerPage,
     tags=["Workers"],
-    summary="List All Workers",
-    description="Retrieves a list of all registered workers",
+    summary="List Workers",
+    description=f"Retrieves a page of registered workers. Follow `next_cursor` to fetch further pages; page size is capped at {MAX_PAGE_SIZE}. Pass `all=true` to retrieve every worker in one unpaginated response, or `ids` to look up specific workers",
     responses={
+        304: {
+            "description": "Not modified since the ETag in If-None-Match",
+        },
         200: {
-            "description": "List of workers retrieved successfully",
+            "description": "Page of workers retrieved successfully",
             "content": {
                 "application/json": {
-                    "example": [
-                        {"id": 1, "name": "John Doe"},
-                        {"id": 2, "name": "Jane Smith"}
-                    ]
+                    "example": {
+                        "items": [
+                            {"id": 1, "name": "John Doe"},
+                            {"id": 2, "name": "Jane Smith"}
+                        ],
+                        "next_cursor": "CjgSMmoOc35sb2NhbC1wcm9qZWN0chMLEgZXb3JrZXIYgICAgICAgAoMGAAgAA=="
+                    }
+                }
+            },
+        },
+        400: {
+            "description": "Invalid cursor",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Invalid cursor"}
                 }
             },
         },
     },
 )
-def get_workers():
-    workers = list_workers()
-    return workers
+async def get_workers(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, description=f"Maximum number of workers to return (capped at {MAX_PAGE_SIZE})"),
+    cursor: Optional[str] = Query(None, description="Cursor returned as `next_cursor` by the previous page"),
+    all_workers: bool = Query(False, alias="all", description="Return every worker in a single unpaginated response"),
+    ids: Optional[str] = Query(None, description=f"Comma-separated worker IDs to look up in one round trip (at most {MAX_PAGE_SIZE}); unknown IDs are omitted", examples=["1,2,3"]),
+    if_none_match: Optional[str] = Header(None),
+):
+    etag = await data_etag(["Worker"], "workers", limit, cursor, all_workers, ids, fresh=if_none_match is not None)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    if ids is not None:
+        try:
+            worker_ids = [int(worker_id) for worker_id in ids.split(",") if worker_id.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+        if len(worker_ids) > MAX_PAGE_SIZE:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_PAGE_SIZE} ids can be requested at once")
+        return page_response(await get_workers_by_ids(worker_ids), None, etag)
+    if all_workers:
+        return page_response(await list_workers(), None, etag)
+    try:
+        workers, next_cursor = await list_workers_page(min(limit, MAX_PAGE_SIZE), cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return page_response(workers, next_cursor, etag)
 
 
 @app.post(
@@ -140,8 +338,34 @@ def get_workers():
         },
     },
 )
-def post_worker(worker: WorkerCreate):
-    created = create_worker(worker.name)
+async def post_worker(worker: WorkerCreate):
+    created = await create_worker(worker.name)
+    return created
+
+
+@app.post(
+    "/workers:batch",
+    response_model=List[Worker],
+    status_code=status.HTTP_201_CREATED,
+    tags=["Workers"],
+    summary="Create Workers in Batch",
+    description=f"Creates up to {MAX_WORKER_BATCH_SIZE} workers in one request. IDs are allocated up front and the workers are written in bulk; they are returned in request order",
+    responses={
+        201: {
+            "description": "Workers created successfully",
+            "content": {
+                "application/json": {
+                    "example": [
+                        {"id": 1, "name": "John Doe"},
+                        {"id": 2, "name": "Jane Smith"}
+                    ]
+                }
+            },
+        },
+    },
+)
+async def post_workers_batch(batch: WorkerBatchCreate):
+    created = await create_workers_batch([worker.name for worker in batch.workers])
     return created
 
 
@@ -152,6 +376,9 @@ def post_worker(worker: WorkerCreate):
     summary="Get Worker by ID",
     description="Retrieves a specific worker by their ID",
     responses={
+        304: {
+            "description": "Not modified since the ETag in If-None-Match",
+        },
         200: {
             "description": "Worker retrieved successfully",
             "content": {
@@ -170,8 +397,12 @@ def post_worker(worker: WorkerCreate):
         },
     },
 )
-def get_worker_by_id(worker_id: int):
-    worker = get_worker(worker_id)
+async def get_worker_by_id(worker_id: int, response: Response, if_none_match: Optional[str] = Header(None)):
+    etag = await data_etag(["Worker"], "worker", worker_id, fresh=if_none_match is not None)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    worker = await get_worker(worker_id)
     if worker is None:
         raise HTTPException(status_code=404, detail="Worker not found")
     return worker
@@ -202,8 +433,8 @@ def get_worker_by_id(worker_id: int):
         },
     },
 )
-def put_worker(worker_id: int, worker: WorkerUpdate):
-    updated = update_worker(worker_id, worker.name)
+async def put_worker(worker_id: int, worker: WorkerUpdate):
+    updated = await update_worker(worker_id, worker.name)
     if updated is None:
         raise HTTPException(status_code=404, detail="Worker not found")
     return updated
@@ -214,10 +445,14 @@ def put_worker(worker_id: int, worker: WorkerUpdate):
     status_code=status.HTTP_204_NO_CONTENT,
     tags=["Workers"],
     summary="Delete Worker",
-    description="Deletes a worker by their ID",
+    description=f"Deletes a worker and all of their shifts. With `async=true`, or when the worker has more than {WORKER_DELETE_SYNC_MAX_SHIFTS} shifts, the worker is deleted immediately and its shifts are removed by a background job, whose progress is at `/worker-deletions/{{job_id}}`",
     responses={
         204: {
-            "description": "Worker deleted successfully",
+            "description": "Worker and shifts deleted successfully",
+        },
+        202: {
+            "description": "Worker deleted; shift cleanup continues in the background",
+            "model": WorkerDeletionJob,
         },
         404: {
             "description": "Worker not found",
@@ -229,41 +464,200 @@ def put_worker(worker_id: int, worker: WorkerUpdate):
         },
     },
 )
-def delete_worker_by_id(worker_id: int):
-    result = delete_worker(worker_id)
+async def delete_worker_by_id(
+    worker_id: int,
+    background_tasks: BackgroundTasks,
+    run_async: bool = Query(False, alias="async", description="Delete the worker's shifts in a background job and return its ID"),
+):
+    if not run_async:
+        run_async = await count_worker_shifts(worker_id, WORKER_DELETE_SYNC_MAX_SHIFTS + 1) > WORKER_DELETE_SYNC_MAX_SHIFTS
+    if run_async:
+        job = await start_worker_deletion(worker_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Worker not found")
+        background_tasks.add_task(run_worker_deletion, dict(job))
+        return JSONResponse(job, status_code=status.HTTP_202_ACCEPTED, headers={"Location": f"/worker-deletions/{job['job_id']}"})
+    result = await delete_worker(worker_id)
     if result is None:
         raise HTTPException(status_code=404, detail="Worker not found")
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
+@app.get(
+    "/workers/{worker_id}/shifts",
+    response_model=ShiftPage,
+    tags=["Workers"],
+    summary="List Worker Shifts",
+    description=f"Retrieves a page of a worker's shifts ordered by start time, optionally restricted to shifts overlapping a `from`/`to` range. Page size is capped at {MAX_PAGE_SIZE}",
+    responses={
+        304: {
+            "description": "Not modified since the ETag in If-None-Match",
+        },
+        200: {
+            "description": "Page of shifts retrieved successfully",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "items": [
+                            {
+                                "id": 1,
+                                "worker_id": 1,
+                                "start": "2024-02-10T09:00:00-05:00",
+                                "end": "2024-02-10T17:00:00-05:00",
+                                "duration_hours": 8.0
+                            }
+                        ],
+                        "next_cursor": None
+                    }
+                }
+            },
+        },
+        400: {
+            "description": "Invalid cursor or range",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Invalid ISO 8601 datetime format: yesterday"}
+                }
+            },
+        },
+        404: {
+            "description": "Worker not found",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Worker not found"}
+                }
+            },
+        },
+    },
+)
+async def get_worker_shifts(
+    worker_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, description=f"Maximum number of shifts to return (capped at {MAX_PAGE_SIZE})"),
+    cursor: Optional[str] = Query(None, description="Cursor returned as `next_cursor` by the previous page"),
+    all_shifts: bool = Query(False, alias="all", description="Return every matching shift in a single unpaginated response"),
+    start: Optional[str] = Query(None, alias="from", description="Only shifts ending after this ISO 8601 time; times without an offset use the configured timezone", examples=["2024-02-05T00:00:00"]),
+    end: Optional[str] = Query(None, alias="to", description="Only shifts starting before this ISO 8601 time; times without an offset use the configured timezone", examples=["2024-02-12T00:00:00"]),
+    if_none_match: Optional[str] = Header(None),
+):
+    etag = await data_etag(["Worker", "Shift", "Settings"], "worker_shifts", worker_id, limit, cursor, all_shifts, start, end, fresh=if_none_match is not None)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    if not await validate_worker_exists(worker_id):
+        raise HTTPException(status_code=404, detail="Worker not found")
+    return await shift_page_response(limit, cursor, all_shifts, start, end, worker_id, etag)
+
+
 @app.get(
     "/shifts",
-    response_model=List[ShiftResponse],
+    response_model=ShiftPage,
     tags=["Shifts"],
-    summary="List All Shifts",
-    description="Retrieves a list of all shifts with times in the current preferred timezone",
+    summary="List Shifts",
+    description=f"Retrieves a page of shifts with times in the current preferred timezone, optionally restricted to a worker and to shifts overlapping a `from`/`to` range (ordered by start time). Follow `next_cursor` to fetch further pages; page size is capped at {MAX_PAGE_SIZE}. Pass `all=true` to retrieve every matching shift in one unpaginated response",
     responses={
+        304: {
+            "description": "Not modified since the ETag in If-None-Match",
+        },
         200: {
-            "description": "List of shifts retrieved successfully",
+            "description": "Page of shifts retrieved successfully",
             "content": {
                 "application/json": {
-                    "example": [
-                        {
-                            "id": 1,
-                            "worker_id": 1,
-                            "start": "2024-02-10T09:00:00-05:00",
-                            "end": "2024-02-10T17:00:00-05:00",
-                            "duration_hours": 8.0
-                        }
-                    ]
+                    "example": {
+                        "items": [
+                            {
+                                "id": 1,
+                                "worker_id": 1,
+                                "start": "2024-02-10T09:00:00-05:00",
+                                "end": "2024-02-10T17:00:00-05:00",
+                                "duration_hours": 8.0
+                            }
+                        ],
+                        "next_cursor": "CjgSMmoOc35sb2NhbC1wcm9qZWN0chILEgVTaGlmdBiAgICAgICACgwYACAA"
+                    }
+                }
+            },
+        },
+        400: {
+            "description": "Invalid cursor or range",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Invalid cursor"}
                 }
             },
         },
     },
 )
-def get_shifts():
-    shifts = list_shifts()
-    return shifts
+async def get_shifts(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, description=f"Maximum number of shifts to return (capped at {MAX_PAGE_SIZE})"),
+    cursor: Optional[str] = Query(None, description="Cursor returned as `next_cursor` by the previous page"),
+    all_shifts: bool = Query(False, alias="all", description="Return every matching shift in a single unpaginated response"),
+    start: Optional[str] = Query(None, alias="from", description="Only shifts ending after this ISO 8601 time; times without an offset use the configured timezone", examples=["2024-02-05T00:00:00"]),
+    end: Optional[str] = Query(None, alias="to", description="Only shifts starting before this ISO 8601 time; times without an offset use the configured timezone", examples=["2024-02-12T00:00:00"]),
+    worker_id: Optional[int] = Query(None, description="Only shifts assigned to this worker"),
+    if_none_match: Optional[str] = Header(None),
+):
+    etag = await data_etag(["Shift", "Settings"], "shifts", limit, cursor, all_shifts, start, end, worker_id, fresh=if_none_match is not None)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return await shift_page_response(limit, cursor, all_shifts, start, end, worker_id, etag)
+
+
+async def shift_page_response(limit: int, cursor: Optional[str], all_shifts: bool, start: Optional[str], end: Optional[str], worker_id: Optional[int], etag: str) -> Response:
+    try:
+        if all_shifts:
+            return page_response(await list_shifts(start, end, worker_id), None, etag)
+        shifts, next_cursor = await list_shifts_page(min(limit, MAX_PAGE_SIZE), cursor, start, end, worker_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return page_response(shifts, next_cursor, etag)
+
+
+# Declared before /shifts/{shift_id} so "export" is not parsed as a shift ID.
+@app.get(
+    "/shifts/export",
+    tags=["Shifts"],
+    summary="Export Shifts",
+    description="Streams every shift overlapping an optional `from`/`to` range as NDJSON (one shift per line) or CSV, with times in the current preferred timezone. Rows are written page by page as they are read from the datastore, so memory use stays flat and the download starts before the query finishes",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "Shift export stream",
+            "content": {
+                "application/x-ndjson": {
+                    "example": '{"id":1,"worker_id":1,"start":"2024-02-10T09:00:00-05:00","end":"2024-02-10T17:00:00-05:00","duration_hours":8.0}\n'
+                },
+                "text/csv": {
+                    "example": "id,worker_id,start,end,duration_hours\n1,1,2024-02-10T09:00:00-05:00,2024-02-10T17:00:00-05:00,8.0\n"
+                },
+            },
+        },
+        400: {
+            "description": "Invalid range",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "`to` must be after `from`"}
+                }
+            },
+        },
+    },
+)
+async def export_shifts_stream(
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format", description="Output format"),
+    start: Optional[str] = Query(None, alias="from", description="Only shifts ending after this ISO 8601 time; times without an offset use the configured timezone", examples=["2024-02-01T00:00:00"]),
+    end: Optional[str] = Query(None, alias="to", description="Only shifts starting before this ISO 8601 time; times without an offset use the configured timezone", examples=["2024-03-01T00:00:00"]),
+):
+    try:
+        pages = await export_shifts(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if export_format == "csv":
+        body, media_type = csv_lines(pages), "text/csv"
+    else:
+        body, media_type = ndjson_lines(pages), "application/x-ndjson"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="shifts.{export_format}"'}
+    )
 
 
 @app.post(
@@ -298,14 +692,77 @@ def get_shifts():
         },
     },
 )
-def post_shift(shift: ShiftCreate):
+async def post_shift(shift: ShiftCreate):
     try:
-        created = create_shift(shift.worker_id, shift.start, shift.end)
+        created = await create_shift(shift.worker_id, shift.start, shift.end)
         return created
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@app.post(
+    "/shifts:batch",
+    response_model=ShiftBatchResponse,
+    status_code=status.HTTP_201_CREATED,
+    tags=["Shifts"],
+    summary="Create Shifts in Batch",
+    description=f"Creates many shifts in one request. Every shift is validated like POST /shifts, and overlaps are checked both against stored shifts and within the batch. In atomic mode (default) nothing is created unless all shifts are valid; otherwise valid shifts are created and failures reported per item. An atomic batch of up to {MAX_BATCH_WRITE} shifts for up to {MAX_TRANSACTION_GROUPS} workers is written in one transaction. A larger one is written in several, and shifts already written are deleted again if a later write fails, so other requests can briefly see part of it.",
+    responses={
+        201: {
+            "description": "All shifts created successfully",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "created": 1,
+                        "failed": 0,
+                        "results": [
+                            {
+                                "index": 0,
+                                "status": "created",
+                                "shift": {
+                                    "id": 1,
+                                    "worker_id": 1,
+                                    "start": "2024-02-10T09:00:00-05:00",
+                                    "end": "2024-02-10T17:00:00-05:00",
+                                    "duration_hours": 8.0
+                                },
+                                "error": None
+                            }
+                        ]
+                    }
+                }
+            },
+        },
+        200: {
+            "description": "Non-atomic batch with some shifts rejected; see per-item results",
+        },
+        400: {
+            "description": "Atomic batch rejected; no shifts were created",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "created": 0,
+                        "failed": 1,
+                        "results": [
+                            {"index": 0, "status": "failed", "shift": None, "error": "Shift overlaps with another shift in this batch"},
+                            {"index": 1, "status": "skipped", "shift": None, "error": None}
+                        ]
+                    }
+                }
+            },
+        },
+    },
+)
+async def post_shifts_batch(batch: ShiftBatchCreate, response: Response):
+    result = await create_shifts_batch(
+        [(shift.worker_id, shift.start, shift.end) for shift in batch.shifts],
+        atomic=batch.atomic
+    )
+    if result["failed"]:
+        response.status_code = status.HTTP_400_BAD_REQUEST if batch.atomic else status.HTTP_200_OK
+    return result
+
+
 @app.get(
     "/shifts/{shift_id}",
     response_model=ShiftResponse,
@@ -313,6 +770,9 @@ def post_shift(shift: ShiftCreate):
     summary="Get Shift by ID",
     description="Retrieves a specific shift by its ID with times in the current preferred timezone",
     responses={
+        304: {
+            "description": "Not modified since the ETag in If-None-Match",
+        },
         200: {
             "description": "Shift retrieved successfully",
             "content": {
@@ -337,8 +797,12 @@ def post_shift(shift: ShiftCreate):
         },
     },
 )
-def get_shift_by_id(shift_id: int):
-    shift = get_shift(shift_id)
+async def get_shift_by_id(shift_id: int, response: Response, if_none_match: Optional[str] = Header(None)):
+    etag = await data_etag(["Shift", "Settings"], "shift", shift_id, fresh=if_none_match is not None)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    shift = await get_shift(shift_id)
     if shift is None:
         raise HTTPException(status_code=404, detail="Shift not found")
     return shift
@@ -383,9 +847,9 @@ def get_shift_by_id(shift_id: int):
         },
     },
 )
-def put_shift(shift_id: int, shift: ShiftUpdate):
+async def put_shift(shift_id: int, shift: ShiftUpdate):
     try:
-        updated = update_shift(shift_id, shift.worker_id, shift.start, shift.end)
+        updated = await update_shift(shift_id, shift.worker_id, shift.start, shift.end)
         if updated is None:
             raise HTTPException(status_code=404, detail="Shift not found")
         return updated
@@ -413,8 +877,214 @@ def put_shift(shift_id: int, shift: ShiftUpdate):
         },
     },
 )
-def delete_shift_by_id(shift_id: int):
-    result = delete_shift(shift_id)
+async def delete_shift_by_id(shift_id: int):
+    result = await delete_shift(shift_id)
     if result is None:
         raise HTTPException(status_code=404, detail="Shift not found")
     return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@app.get(
+    "/reports/hours",
+    response_model=HoursReport,
+    tags=["Reports"],
+    summary="Hours per Worker",
+    description="Totals each worker's hours on shift per day, ISO week or month between `from` and `to`. Period boundaries are local midnights in the configured timezone, and shifts crossing one are split between the periods, so DST days count their real length. Responses carry an ETag; send it back in If-None-Match to get 304 Not Modified",
+    responses={
+        304: {
+            "description": "Not modified since the ETag in If-None-Match",
+        },
+        200: {
+            "description": "Hours per worker and period",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "timezone": "America/New_York",
+                        "granularity": "week",
+                        "periods": ["2024-02-05", "2024-02-12"],
+                        "workers": [
+                            {"worker_id": 1, "total_hours": 40.0, "hours": [32.0, 8.0]}
+                        ]
+                    }
+                }
+            },
+        },
+        400: {
+            "description": "Invalid range, or more periods than one report may cover",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "`to` must be after `from`"}
+                }
+            },
+        },
+    },
+)
+async def get_hours_report(
+    start: str = Query(..., alias="from", description="Start of the report as an ISO 8601 time; times without an offset use the configured timezone", examples=["2024-02-05T00:00:00"]),
+    end: str = Query(..., alias="to", description="End of the report as an ISO 8601 time; times without an offset use the configured timezone", examples=["2024-02-19T00:00:00"]),
+    granularity: Literal["day", "week", "month"] = Query("week", description="Length of each period; weeks start on Monday"),
+    worker_id: Optional[int] = Query(None, description="Only report this worker"),
+    if_none_match: Optional[str] = Header(None),
+):
+    etag = await data_etag(["Shift", "Settings"], "hours", start, end, granularity, worker_id, fresh=if_none_match is not None)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    try:
+        report = await hours_report(start, end, granularity, worker_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # A year of days for thousands of workers; skip response-model revalidation.
+    return Response(to_json(report), media_type="application/json", headers=etag_headers(etag))
+
+
+COVERAGE_BUCKETS = {"15m": 15, "30m": 30, "60m": 60}
+
+
+@app.get(
+    "/reports/coverage",
+    response_model=CoverageReport,
+    tags=["Reports"],
+    summary="Staffing Coverage",
+    description=f"Counts the workers on shift in each 15, 30 or 60 minute slot between `from` and `to`, for a staffing heatmap. Slots are counted from `from`, and a worker is counted once in a slot however many of their shifts touch it. Covers at most {COVERAGE_MAX_SLOTS} slots. Responses carry an ETag; send it back in If-None-Match to get 304 Not Modified",
+    responses={
+        304: {
+            "description": "Not modified since the ETag in If-None-Match",
+        },
+        200: {
+            "description": "Headcount per slot",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "timezone": "America/New_York",
+                        "bucket_minutes": 15,
+                        "slots": ["2024-02-10T09:00:00-05:00", "2024-02-10T09:15:00-05:00"],
+                        "headcount": [3, 4]
+                    }
+                }
+            },
+        },
+        400: {
+            "description": "Invalid range, or more slots than one report may cover",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "`to` must be after `from`"}
+                }
+            },
+        },
+    },
+)
+async def get_coverage_report(
+    start: str = Query(..., alias="from", description="Start of the first slot as an ISO 8601 time; times without an offset use the configured timezone", examples=["2024-02-10T00:00:00"]),
+    end: str = Query(..., alias="to", description="End of the report as an ISO 8601 time; times without an offset use the configured timezone", examples=["2024-02-17T00:00:00"]),
+    bucket: Literal["15m", "30m", "60m"] = Query("15m", description="Slot length"),
+    if_none_match: Optional[str] = Header(None),
+):
+    etag = await data_etag(["Shift", "Settings"], "coverage", start, end, bucket, fresh=if_none_match is not None)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    try:
+        report = await coverage_report(start, end, COVERAGE_BUCKETS[bucket])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(to_json(report), media_type="application/json", headers=etag_headers(etag))
+
+
+@app.post(
+    "/imports/{kind}",
+    tags=["Imports"],
+    summary="Import from CSV",
+    description="Imports shifts (`worker_id,start,end` columns) or workers (`name` and optional `id` columns) from a CSV request body. Rows are validated with the same rules as single creates, duplicates are skipped, and writes are pipelined in chunks. The response streams one NDJSON progress line per committed chunk, ending with a summary that lists the first rejected rows. If the upload fails partway, send the same file again with the reported `job_id` to resume from the last checkpoint",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "Import progress stream",
+            "content": {
+                "application/x-ndjson": {
+                    "example": '{"job_id":"3f2a9c0e5b7d4e1f8a6b2c9d0e1f2a3b","kind":"shifts","status":"running","rows_read":1000,"rows_committed":500,"created":498,"duplicates":1,"failed":1}\n'
+                }
+            },
+        },
+        400: {
+            "description": "Missing CSV columns or mismatched job",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "CSV is missing required columns: worker_id"}
+                }
+            },
+        },
+    },
+)
+async def post_import(
+    kind: Literal["shifts", "workers"],
+    request: Request,
+    job_id: Optional[str] = Query(None, description="Resume this import job from its last checkpoint"),
+):
+    # Spooled so a large upload goes to disk instead of memory. Once it has
+    # rolled over, every write is file I/O, so none of it runs on the event loop.
+    upload = SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES)
+    async for chunk in request.stream():
+        if chunk:
+            await run_sync(upload.write, chunk)
+    await run_sync(upload.seek, 0)
+    try:
+        events = await start_import(kind, upload, job_id)
+    except ValueError as e:
+        await run_sync(upload.close)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def progress_lines():
+        try:
+            for event in events:
+                yield json.dumps(event, separators=(",", ":")) + "\n"
+        finally:
+            upload.close()
+
+    return StreamingResponse(progress_lines(), media_type="application/x-ndjson")
+
+
+@app.get(
+    "/imports/{job_id}",
+    response_model=ImportJobStatus,
+    tags=["Imports"],
+    summary="Get Import Job",
+    description="Returns the checkpointed progress of an import job",
+    responses={
+        404: {
+            "description": "Import job not found",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Import job not found"}
+                }
+            },
+        },
+    },
+)
+async def get_import(job_id: str):
+    job = await get_import_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+
+@app.get(
+    "/worker-deletions/{job_id}",
+    response_model=WorkerDeletionJob,
+    tags=["Workers"],
+    summary="Get Worker Deletion Job",
+    description=f"Returns the progress of a background worker deletion started by `DELETE /workers/{{worker_id}}`. A running job that has not reported progress for {WORKER_DELETION_STALE_SECONDS:g} seconds is reported as failed",
+    responses={
+        404: {
+            "description": "Deletion job not found",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Deletion job not found"}
+                }
+            },
+        },
+    },
+)
+async def get_worker_deletion_job(job_id: str):
+    job = await get_worker_deletion(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Deletion job not found")
+    return job
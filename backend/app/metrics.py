@@ -0,0 +1,244 @@
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from app.settings import METRICS_ENABLED
+
+# Upper bounds in seconds. Datastore RPCs are usually single-digit
+# milliseconds, so the low end is finer than Prometheus' defaults.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{format_labels(self.label_names, labels)} {value:g}" for labels, value in values)
+        return lines
+
+
+class Histogram:
+    # Only the per-bucket count is bumped on observe; cumulative counts are
+    # worked out when /metrics is scraped.
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # One slot per bucket, one for +Inf, then the sum.
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[position] += 1
+            series[-1] += value
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            series = self._series.get(labels)
+            return int(sum(series[:-1])) if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = sorted((labels, list(series)) for labels, series in self._series.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_label = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names, labels, bucket_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, labels)} {series[-1]:.9g}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+HTTP_REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Time to serve an HTTP request, by route template.", ["method", "route"])
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP responses sent, by route template and status code.", ["method", "route", "status"])
+DB_RPC_SECONDS = Histogram("db_rpc_duration_seconds", "Time spent in app.db calls, by operation and entity kind.", ["operation", "kind"])
+DB_RPC_ERRORS = Counter("db_rpc_errors_total", "app.db calls that raised, by operation and entity kind.", ["operation", "kind"])
+
+REGISTRY = [HTTP_REQUEST_SECONDS, HTTP_REQUESTS, DB_RPC_SECONDS, DB_RPC_ERRORS]
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+_rpc_local = threading.local()
+_done = object()
+
+
+def rpc_kind(args: Tuple[Any, ...]) -> str:
+    # The entity kind is the first argument, or the kind of the first key or
+    # entity in a batch; label values stay bounded by the set of kinds.
+    if not args:
+        return ""
+    first = args[0]
+    if isinstance(first, str):
+        return first
+    if isinstance(first, (list, tuple)) and first:
+        item = first[0]
+        key = getattr(item, "key", None) or item
+        return getattr(key, "kind", "") or ""
+    return ""
+
+
+def instrument_rpc(function: Callable) -> Callable:
+    # Only the outermost app.db call is recorded, so a helper that calls
+    # another one (entity_exists -> query_projection) counts as one RPC.
+    if not METRICS_ENABLED:
+        return function
+    operation = function.__name__
+
+    def record(started: float, kind: str, failed: bool) -> None:
+        DB_RPC_SECONDS.observe(time.perf_counter() - started, operation, kind)
+        if failed:
+            DB_RPC_ERRORS.inc(operation, kind)
+
+    if inspect.isgeneratorfunction(function):
+        @functools.wraps(function)
+        def generator_wrapper(*args: Any, **kwargs: Any) -> Iterator[Any]:
+            # Each page the generator yields is timed as its own RPC.
+            iterator = function(*args, **kwargs)
+            kind = rpc_kind(args)
+            while True:
+                if getattr(_rpc_local, "active", False):
+                    item = next(iterator, _done)
+                else:
+                    _rpc_local.active = True
+                    started = time.perf_counter()
+                    try:
+                        item = next(iterator, _done)
+                    except Exception:
+                        record(started, kind, True)
+                        raise
+                    finally:
+                        _rpc_local.active = False
+                    if item is not _done:
+                        record(started, kind, False)
+                if item is _done:
+                    return
+                yield item
+
+        return generator_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if getattr(_rpc_local, "active", False):
+            return function(*args, **kwargs)
+        _rpc_local.active = True
+        started = time.perf_counter()
+        failed = False
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            _rpc_local.active = False
+            record(started, rpc_kind(args), failed)
+
+    return wrapper
+
+
+def instrument_transaction(function: Callable) -> Callable:
+    # A transaction is timed as a whole, including its commit, while the
+    # reads and writes inside it are still recorded one by one.
+    if not METRICS_ENABLED:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if getattr(_rpc_local, "active", False):
+            return function(*args, **kwargs)
+        started = time.perf_counter()
+        failed = False
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            DB_RPC_SECONDS.observe(time.perf_counter() - started, function.__name__, "")
+            if failed:
+                DB_RPC_ERRORS.inc(function.__name__, "")
+
+    return wrapper
+
+
+class MetricsMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware: no extra task per request and
+    # streamed responses are timed until their last chunk is sent, but not
+    # through the background tasks that run after it.
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = ["500"]
+        recorded = [False]
+
+        def record() -> None:
+            if recorded[0]:
+                return
+            recorded[0] = True
+            # The route template keeps label cardinality bounded; paths that
+            # matched no route share one label.
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, scope["method"], template)
+            HTTP_REQUESTS.inc(scope["method"], template, status[0])
+
+        async def send_with_status(message: dict) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            record()
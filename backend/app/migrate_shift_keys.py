@@ -0,0 +1,74 @@
+import argparse
+import json
+import sys
+from typing import Iterator
+
+from app.crud import migrate_legacy_shift_keys
+from app.db import get_entity, list_keys_page, put_entity
+from app.settings import BACKFILL_BATCH_SIZE
+
+MIGRATION_NAME = "legacy_shift_keys"
+
+
+def load_migration_state(restart: bool = False) -> dict:
+    entity = None if restart else get_entity("Backfill", MIGRATION_NAME)
+    if entity is None:
+        return {"status": "running", "cursor": None, "scanned": 0, "migrated": 0}
+    return {"status": entity["status"], "cursor": entity.get("cursor"), "scanned": entity["scanned"], "migrated": entity["migrated"]}
+
+
+def save_migration_state(state: dict) -> None:
+    put_entity("Backfill", MIGRATION_NAME, state, exclude_from_indexes=("cursor",))
+
+
+def migrate_shifts(batch_size: int = BACKFILL_BATCH_SIZE, restart: bool = False) -> Iterator[dict]:
+    # Shift keys are walked in key order, one keys-only page at a time, and the
+    # cursor is saved after every page. Moved shifts leave the page they were
+    # read from, so a page that moved any is read again from the same cursor:
+    # with offset cursors the next page would otherwise skip as many keys as
+    # were moved. After a crash the page re-read holds no moved shifts.
+    state = load_migration_state(restart)
+    if state["status"] == "completed":
+        yield dict(state)
+        return
+    state["status"] = "running"
+    save_migration_state(state)
+
+    try:
+        while True:
+            keys, cursor = list_keys_page("Shift", batch_size, state["cursor"])
+            migrated = migrate_legacy_shift_keys(keys)
+            state["migrated"] += migrated
+            if not migrated:
+                state["scanned"] += len(keys)
+                state["cursor"] = cursor
+            save_migration_state(state)
+            yield dict(state)
+            if not migrated and cursor is None:
+                break
+    except BaseException:
+        state["status"] = "failed"
+        save_migration_state(state)
+        raise
+
+    state["status"] = "completed"
+    save_migration_state(state)
+    yield dict(state)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move root-level shifts under their Worker")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE, help="Shift keys read per page")
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved checkpoint and walk every shift again")
+    args = parser.parse_args()
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    state = None
+    for state in migrate_shifts(args.batch_size, args.restart):
+        print(f"scanned {state['scanned']:,}  migrated {state['migrated']:,}", file=sys.stderr)
+    print(json.dumps({key: value for key, value in state.items() if key != "cursor"}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
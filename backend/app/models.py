@@ -1,9 +1,12 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel, Field, field_validator, computed_field
-from zoneinfo import ZoneInfo, available_timezones
+from app.settings import MAX_SHIFT_BATCH_SIZE, MAX_WORKER_BATCH_SIZE
+from app.timezones import get_zone, is_valid_timezone
 
 
+MAX_SHIFT_DURATION_HOURS = 12.0
+
 class TimezoneSettings(BaseModel):
     timezone: str = Field(
         ...,
@@ -16,10 +19,10 @@ class TimezoneSettings(BaseModel):
     def validate_timezone(cls, v: str) -> str:
         if not v or not v.strip():
             raise ValueError("Timezone cannot be empty")
-        if v not in available_timezones():
+        if not is_valid_timezone(v):
             raise ValueError(f"Invalid timezone: {v}")
         try:
-            ZoneInfo(v)
+            get_zone(v)
         except Exception:
             raise ValueError(f"Invalid timezone: {v}")
         return v
@@ -30,6 +33,15 @@ class Worker(BaseModel):
     name: str = Field(..., description="Worker's full name", examples=["John Doe"])
 
 
+class WorkerPage(BaseModel):
+    items: List[Worker] = Field(..., description="Workers on this page")
+    next_cursor: Optional[str] = Field(
+        None,
+        description="Cursor for the next page; pass it back as the `cursor` query parameter. Null when there are no more results",
+        examples=["CjgSMmoOc35sb2NhbC1wcm9qZWN0chMLEgZXb3JrZXIYgICAgICAgAoMGAAgAA=="]
+    )
+
+
 class WorkerCreate(BaseModel):
     name: str = Field(
         ...,
@@ -45,6 +57,15 @@ class WorkerCreate(BaseModel):
         return v
 
 
+class WorkerBatchCreate(BaseModel):
+    workers: List[WorkerCreate] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_WORKER_BATCH_SIZE,
+        description=f"Workers to create (at most {MAX_WORKER_BATCH_SIZE})"
+    )
+
+
 class WorkerUpdate(BaseModel):
     name: str = Field(
         ...,
@@ -107,7 +128,7 @@ class ShiftCreate(BaseModel):
                 raise ValueError("End time must be after start time")
             
             duration_hours = (end_dt - start_dt).total_seconds() / 3600
-            if duration_hours > 12.0:
+            if duration_hours > MAX_SHIFT_DURATION_HOURS:
                 raise ValueError("Shift duration cannot exceed 12 hours")
         return v
 
@@ -144,7 +165,7 @@ class ShiftUpdate(BaseModel):
                 raise ValueError("End time must be after start time")
             
             duration_hours = (end_dt - start_dt).total_seconds() / 3600
-            if duration_hours > 12.0:
+            if duration_hours > MAX_SHIFT_DURATION_HOURS:
                 raise ValueError("Shift duration cannot exceed 12 hours")
         return v
 
@@ -169,3 +190,94 @@ class ShiftResponse(BaseModel):
         start_dt = datetime.fromisoformat(self.start)
         end_dt = datetime.fromisoformat(self.end)
         return (end_dt - start_dt).total_seconds() / 3600
+
+
+class ShiftPage(BaseModel):
+    items: List[ShiftResponse] = Field(..., description="Shifts on this page")
+    next_cursor: Optional[str] = Field(
+        None,
+        description="Cursor for the next page; pass it back as the `cursor` query parameter. Null when there are no more results",
+        examples=["CjgSMmoOc35sb2NhbC1wcm9qZWN0chILEgVTaGlmdBiAgICAgICACgwYACAA"]
+    )
+
+
+class ShiftBatchCreate(BaseModel):
+    shifts: List[ShiftCreate] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_SHIFT_BATCH_SIZE,
+        description=f"Shifts to create (at most {MAX_SHIFT_BATCH_SIZE})"
+    )
+    atomic: bool = Field(
+        True,
+        description="When true, nothing is created unless every shift is valid. When false, valid shifts are created and invalid ones are reported"
+    )
+
+
+class ShiftBatchItemResult(BaseModel):
+    index: int = Field(..., description="Position of the shift in the request", examples=[0])
+    status: Literal["created", "failed", "skipped"] = Field(
+        ...,
+        description="`skipped` marks valid shifts not created because an atomic batch was rejected",
+        examples=["created"]
+    )
+    shift: Optional[ShiftResponse] = Field(None, description="The created shift")
+    error: Optional[str] = Field(None, description="Why the shift was not created", examples=["Worker not found"])
+
+
+class ShiftBatchResponse(BaseModel):
+    created: int = Field(..., description="Number of shifts created", examples=[2])
+    failed: int = Field(..., description="Number of shifts rejected", examples=[0])
+    results: List[ShiftBatchItemResult] = Field(..., description="One result per requested shift, in request order")
+
+
+class ImportRowError(BaseModel):
+    row: int = Field(..., description="1-based data row number (the header row is not counted)", examples=[42])
+    error: str = Field(..., description="Why the row was rejected", examples=["Shift duration cannot exceed 12 hours"])
+
+
+class ImportJobStatus(BaseModel):
+    job_id: str = Field(..., description="Import job ID; pass it as `job_id` to resume the import", examples=["3f2a9c0e5b7d4e1f8a6b2c9d0e1f2a3b"])
+    kind: Literal["shifts", "workers"] = Field(..., description="What the import creates")
+    status: Literal["running", "completed", "failed"] = Field(..., description="Job status")
+    rows_read: int = Field(..., description="Data rows read so far")
+    rows_committed: int = Field(..., description="Data rows fully processed; a resumed import skips this many rows")
+    created: int = Field(..., description="Entities created")
+    duplicates: int = Field(..., description="Rows skipped as duplicates")
+    failed: int = Field(..., description="Rows rejected by validation")
+    errors: List[ImportRowError] = Field(default_factory=list, description="The first rejected rows and why they were rejected")
+
+
+class WorkerDeletionJob(BaseModel):
+    job_id: str = Field(..., description="Deletion job ID", examples=["3f2a9c0e5b7d4e1f8a6b2c9d0e1f2a3b"])
+    worker_id: int = Field(..., description="ID of the deleted worker", examples=[1])
+    status: Literal["running", "completed", "failed"] = Field(..., description="Job status")
+    deleted_shifts: int = Field(..., description="The worker's shifts deleted so far")
+
+
+class WorkerHours(BaseModel):
+    worker_id: int = Field(..., description="ID of the worker", examples=[1])
+    total_hours: float = Field(..., description="Hours on shift across the whole range", examples=[40.0])
+    hours: List[float] = Field(..., description="Hours on shift in each period, aligned with `periods`", examples=[[32.0, 8.0]])
+
+
+class HoursReport(BaseModel):
+    timezone: str = Field(..., description="Timezone the period boundaries are in", examples=["America/New_York"])
+    granularity: Literal["day", "week", "month"] = Field(..., description="Length of each period; weeks start on Monday")
+    periods: List[str] = Field(
+        ...,
+        description="Local start date of each period. The first and last periods are cut off at `from` and `to`",
+        examples=[["2024-02-05", "2024-02-12"]]
+    )
+    workers: List[WorkerHours] = Field(..., description="One entry per worker with time on shift in the range, ordered by worker ID")
+
+
+class CoverageReport(BaseModel):
+    timezone: str = Field(..., description="Timezone the slot start times are in", examples=["America/New_York"])
+    bucket_minutes: int = Field(..., description="Length of each slot in minutes", examples=[15])
+    slots: List[str] = Field(
+        ...,
+        description="Start of each slot in ISO 8601 format with timezone. The last slot is cut off at `to`",
+        examples=[["2024-02-10T09:00:00-05:00", "2024-02-10T09:15:00-05:00"]]
+    )
+    headcount: List[int] = Field(..., description="Workers on shift at any point in each slot, aligned with `slots`", examples=[[3, 4]])
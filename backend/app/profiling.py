@@ -0,0 +1,244 @@
+import hmac
+import json
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from app.settings import ENV, PROFILING_ADMIN_TOKEN, PROFILING_MAX_STORED, PROFILING_SAMPLE_INTERVAL_MS, PROFILING_TOP_FUNCTIONS
+
+FunctionKey = Tuple[str, int, str]
+
+# The sampler sees every thread and tracemalloc is process-wide, so only one
+# request is profiled at a time.
+_profiling_lock = threading.Lock()
+_profiles: "OrderedDict[str, dict]" = OrderedDict()
+_profiles_lock = threading.Lock()
+
+
+def profiling_allowed(admin_token: Optional[str]) -> bool:
+    if ENV != "production":
+        return True
+    if not PROFILING_ADMIN_TOKEN or admin_token is None:
+        return False
+    # Header values arrive decoded as latin-1, which compare_digest rejects as
+    # str once they hold non-ASCII characters, so the raw bytes are compared.
+    return hmac.compare_digest(admin_token.encode("latin-1"), PROFILING_ADMIN_TOKEN.encode())
+
+
+def store_profile(profile_id: str, profile: dict) -> None:
+    with _profiles_lock:
+        _profiles[profile_id] = profile
+        while len(_profiles) > PROFILING_MAX_STORED:
+            _profiles.popitem(last=False)
+
+
+def get_profile(profile_id: str) -> Optional[dict]:
+    with _profiles_lock:
+        return _profiles.get(profile_id)
+
+
+def function_name(function: FunctionKey) -> str:
+    filename, line, name = function
+    return f"{filename}:{line}({name})" if line else name
+
+
+# Innermost frames of a thread that is only waiting, not working on the
+# request: the idle event loop and parked threadpool workers.
+IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+
+
+class StackSampler:
+    # Samples the stack of every thread at a fixed interval. Stacks are folded
+    # into a call tree, and each function's own (innermost frame) and total
+    # (anywhere on the stack) sample counts give the top functions.
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.samples = 0
+        self._root: Dict[FunctionKey, list] = {}
+        self._own: Dict[FunctionKey, int] = {}
+        self._total: Dict[FunctionKey, int] = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval_seconds):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id and not frame.f_code.co_filename.endswith(IDLE_FILES):
+                    self._add(frame)
+
+    def _add(self, frame: Any) -> None:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        self.samples += 1
+        self._own[stack[0]] = self._own.get(stack[0], 0) + 1
+        for function in set(stack):
+            self._total[function] = self._total.get(function, 0) + 1
+        children = self._root
+        for function in reversed(stack):
+            node = children.setdefault(function, [0, {}])
+            node[0] += 1
+            children = node[1]
+
+    def top_functions(self, limit: int, elapsed_ms: float) -> List[dict]:
+        milliseconds = elapsed_ms / max(self.samples, 1)
+        ranked = sorted(self._own.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [
+            {
+                "function": function_name(function),
+                "own_samples": own,
+                "total_samples": self._total[function],
+                "own_ms": round(own * milliseconds, 3),
+                "total_ms": round(self._total[function] * milliseconds, 3),
+            }
+            for function, own in ranked
+        ]
+
+    def tree(self, min_samples: int, elapsed_ms: float) -> List[dict]:
+        # Samples are often late while a thread holds the GIL, so time is
+        # apportioned by share of samples rather than counted in intervals.
+        milliseconds = elapsed_ms / max(self.samples, 1)
+
+        def nodes(children: Dict[FunctionKey, list]) -> List[dict]:
+            return [
+                {"function": function_name(function), "samples": count, "ms": round(count * milliseconds, 3), "children": nodes(grandchildren)}
+                for function, (count, grandchildren) in sorted(children.items(), key=lambda item: item[1][0], reverse=True)
+                if count >= min_samples
+            ]
+
+        return nodes(self._root)
+
+
+def allocation_stats(snapshot: tracemalloc.Snapshot, peak: int, limit: int) -> dict:
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+    lines = snapshot.statistics("lineno")
+    return {
+        "peak_bytes": peak,
+        "retained_bytes": sum(stat.size for stat in lines),
+        "top_lines": [
+            {"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "size_bytes": stat.size, "count": stat.count}
+            for stat in lines[:limit]
+        ],
+    }
+
+
+def build_profile(sampler: StackSampler, snapshot: tracemalloc.Snapshot, peak: int, request: dict) -> dict:
+    elapsed_ms = request["duration_ms"]
+    return {
+        "request": request,
+        "sample_interval_ms": PROFILING_SAMPLE_INTERVAL_MS,
+        "samples": sampler.samples,
+        "top_functions": sampler.top_functions(PROFILING_TOP_FUNCTIONS, elapsed_ms),
+        # Branches seen in under 0.5% of the samples are left out.
+        "call_tree": sampler.tree(max(1, sampler.samples // 200), elapsed_ms),
+        "allocations": allocation_stats(snapshot, peak, PROFILING_TOP_FUNCTIONS),
+    }
+
+
+def requested(scope: dict) -> bool:
+    for name, value in scope["headers"]:
+        if name == b"x-profile":
+            return value.strip().lower() in (b"1", b"true", b"yes", b"on")
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return query.get("profile", [""])[-1].lower() in ("1", "true", "yes", "on")
+
+
+def header(scope: dict, wanted: bytes) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == wanted:
+            return value.decode("latin-1")
+    return None
+
+
+async def send_json(send: Callable, status: int, body: dict) -> None:
+    payload = json.dumps(body).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+
+class ProfilingMiddleware:
+    # Only installed when PROFILING_ENABLED is set, so by default requests
+    # never pass through it; when installed, a request is profiled only if it
+    # sends `X-Profile: 1` or `?profile=1`. Profiling samples stacks rather
+    # than tracing calls: cProfile on sys.monitoring records every thread,
+    # and the waits of idle ones drown out the request's own work.
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or not requested(scope):
+            await self.app(scope, receive, send)
+            return
+        if not profiling_allowed(header(scope, b"x-admin-token")):
+            await send_json(send, 403, {"detail": "Profiling is not allowed"})
+            return
+        if not _profiling_lock.acquire(blocking=False):
+            await send_json(send, 409, {"detail": "Another request is being profiled"})
+            return
+        try:
+            await self.profile(scope, receive, send)
+        finally:
+            _profiling_lock.release()
+
+    async def profile(self, scope: dict, receive: Callable, send: Callable) -> None:
+        profile_id = uuid.uuid4().hex
+        status = [500]
+
+        async def send_with_id(message: dict) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        tracing_memory = tracemalloc.is_tracing()
+        if not tracing_memory:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        sampler = StackSampler(PROFILING_SAMPLE_INTERVAL_MS / 1000)
+        # The sampler can only run when the busy thread lets go of the GIL,
+        # which by default it does every 5 ms.
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, PROFILING_SAMPLE_INTERVAL_MS / 1000))
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop()
+            sys.setswitchinterval(switch_interval)
+            elapsed = time.perf_counter() - started
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if not tracing_memory:
+                tracemalloc.stop()
+            request = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "status": status[0],
+                "duration_ms": round(elapsed * 1000, 3),
+            }
+            store_profile(profile_id, build_profile(sampler, snapshot, peak, request))
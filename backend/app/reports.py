@@ -0,0 +1,125 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from app.timezones import get_zone
+from app.tzconvert import EPOCH, ONE_MICROSECOND
+
+
+GRANULARITIES = ("day", "week", "month")
+MICROSECONDS_PER_HOUR = 3_600_000_000
+
+
+def period_start(day: date, granularity: str) -> date:
+    if granularity == "week":
+        # ISO weeks, starting on Monday.
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_period(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day + timedelta(days=7)
+    if granularity == "month":
+        return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return day + timedelta(days=1)
+
+
+def local_midnight_utc(day: date, zone) -> datetime:
+    # A midnight skipped by a DST change resolves to the transition itself, and
+    # a repeated one to its first occurrence.
+    return datetime(day.year, day.month, day.day, tzinfo=zone).astimezone(timezone.utc)
+
+
+def bucket_periods(start_utc: datetime, end_utc: datetime, granularity: str, tz_name: str, max_buckets: int) -> Tuple[List[date], np.ndarray]:
+    # Calendar periods in tz_name covering [start_utc, end_utc): the local
+    # start date of each and the bucket edges in epoch microseconds. The outer
+    # edges are the range itself, so the first and last buckets may be partial.
+    zone = get_zone(tz_name)
+    periods = [period_start(start_utc.astimezone(zone).date(), granularity)]
+    boundaries = [start_utc]
+    while True:
+        boundary = local_midnight_utc(next_period(periods[-1], granularity), zone)
+        if boundary >= end_utc:
+            break
+        if len(periods) >= max_buckets:
+            raise ValueError(f"Range spans more than {max_buckets} {granularity} buckets; use a coarser granularity or a shorter range")
+        periods.append(next_period(periods[-1], granularity))
+        boundaries.append(boundary)
+    boundaries.append(end_utc)
+    edges = np.fromiter(((boundary - EPOCH) // ONE_MICROSECOND for boundary in boundaries), dtype=np.int64, count=len(boundaries))
+    return periods, edges
+
+
+def hours_by_bucket(worker_ids: Sequence[int], starts: np.ndarray, ends: np.ndarray, edges: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Shifts (epoch microseconds) are clipped to the outer edges and split
+    # wherever they cross an inner one. Returns the sorted distinct worker IDs
+    # and a (workers, buckets) array of hours.
+    bucket_count = len(edges) - 1
+    starts = np.maximum(np.asarray(starts, dtype=np.int64), edges[0])
+    ends = np.minimum(np.asarray(ends, dtype=np.int64), edges[-1])
+    inside = ends > starts
+    workers, worker_index = np.unique(np.asarray(worker_ids, dtype=np.int64)[inside], return_inverse=True)
+    starts, ends = starts[inside], ends[inside]
+
+    first = np.searchsorted(edges, starts, side="right") - 1
+    last = np.searchsorted(edges, ends, side="left") - 1
+    # One piece per bucket a shift touches: the shift's position repeated once
+    # per piece, and the bucket counting up from its first within each run.
+    pieces = last - first + 1
+    shift = np.repeat(np.arange(len(starts)), pieces)
+    run_offsets = np.arange(len(shift)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    bucket = first[shift] + run_offsets
+    overlap = np.minimum(ends[shift], edges[bucket + 1]) - np.maximum(starts[shift], edges[bucket])
+
+    totals = np.bincount(
+        worker_index[shift] * bucket_count + bucket,
+        weights=overlap,
+        minlength=len(workers) * bucket_count
+    )
+    return workers, totals.reshape(len(workers), bucket_count) / MICROSECONDS_PER_HOUR
+
+
+def coverage_slots(start_utc: datetime, end_utc: datetime, slot_minutes: int, max_slots: int) -> Tuple[int, int, int]:
+    # Fixed-length slots counted from start_utc, so they line up with local
+    # clock times whenever `from` does; the last slot is cut off at end_utc.
+    # Returns the origin and slot length in epoch microseconds and the count.
+    slot = slot_minutes * 60_000_000
+    origin = (start_utc - EPOCH) // ONE_MICROSECOND
+    span = (end_utc - EPOCH) // ONE_MICROSECOND - origin
+    count = -(-span // slot)
+    if count > max_slots:
+        raise ValueError(f"Range spans more than {max_slots} {slot_minutes}-minute slots; use a larger bucket or a shorter range")
+    return origin, slot, count
+
+
+def headcount_by_slot(worker_ids: Sequence[int], starts: np.ndarray, ends: np.ndarray, origin: int, slot: int, count: int) -> np.ndarray:
+    # Distinct workers on shift at any point in each slot. Each shift becomes
+    # +1 at its first slot and -1 after its last in a difference array, so the
+    # cost is a sort of the shifts plus one pass over the slots, however long
+    # the shifts are.
+    starts = np.maximum(np.asarray(starts, dtype=np.int64), origin)
+    ends = np.minimum(np.asarray(ends, dtype=np.int64), origin + count * slot)
+    inside = ends > starts
+    worker_ids = np.asarray(worker_ids, dtype=np.int64)[inside]
+    first = (starts[inside] - origin) // slot
+    last = (ends[inside] - 1 - origin) // slot
+
+    # A worker whose shift ends in the slot where their next one starts counts
+    # once there: in (worker, start) order, each shift starts after the last
+    # slot already counted for that worker. Offsetting slots by the worker's
+    # rank lets one running maximum cover every worker without resetting.
+    _, rank = np.unique(worker_ids, return_inverse=True)
+    offset = rank * (count + 1)
+    order = np.argsort(offset + first)
+    rank, offset, first, last = rank[order], offset[order], first[order], last[order]
+    counted = np.maximum.accumulate(offset + last) - offset
+    same_worker = rank[1:] == rank[:-1]
+    first[1:] = np.where(same_worker, np.maximum(first[1:], counted[:-1] + 1), first[1:])
+    kept = first <= last
+
+    changes = np.bincount(first[kept], minlength=count + 1) - np.bincount(last[kept] + 1, minlength=count + 1)
+    return np.cumsum(changes[:count])
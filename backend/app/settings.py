@@ -0,0 +1,75 @@
+import os
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+ENV = os.getenv("ENV", "development")
+
+# "datastore", "memory" (process-local, for tests and benchmarks) or "sqlite".
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "datastore")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "shift-manager.db")
+
+# Request and app.db latency histograms served on /metrics.
+METRICS_ENABLED = _env_bool("METRICS_ENABLED", True)
+# Per-request storage round trips, reported in Server-Timing and logged in
+# full for requests slower than the threshold.
+TRACING_ENABLED = _env_bool("TRACING_ENABLED", True)
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "1000"))
+# Off by default. When on, a request sending `X-Profile: 1` or `?profile=1`
+# runs under a stack sampler and tracemalloc; in production it must also send
+# `X-Admin-Token` matching PROFILING_ADMIN_TOKEN.
+PROFILING_ENABLED = _env_bool("PROFILING_ENABLED", False)
+PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN", "")
+PROFILING_MAX_STORED = int(os.getenv("PROFILING_MAX_STORED", "20"))
+PROFILING_TOP_FUNCTIONS = int(os.getenv("PROFILING_TOP_FUNCTIONS", "30"))
+PROFILING_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILING_SAMPLE_INTERVAL_MS", "1"))
+
+SHIFT_INDEX_ENABLED = _env_bool("SHIFT_INDEX_ENABLED", True)
+SHIFT_INDEX_TTL_SECONDS = float(os.getenv("SHIFT_INDEX_TTL_SECONDS", "30"))
+SHIFT_INDEX_WARM_ON_STARTUP = _env_bool("SHIFT_INDEX_WARM_ON_STARTUP", False)
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+# Periods one GET /reports/hours response may cover (three years of days).
+REPORT_MAX_BUCKETS = int(os.getenv("REPORT_MAX_BUCKETS", "1100"))
+# Slots one GET /reports/coverage response may cover (a month of 15 minutes).
+COVERAGE_MAX_SLOTS = int(os.getenv("COVERAGE_MAX_SLOTS", "3000"))
+
+SETTINGS_CACHE_TTL_SECONDS = float(os.getenv("SETTINGS_CACHE_TTL_SECONDS", "30"))
+# How long ETags sent with full responses can lag another instance's writes.
+# If-None-Match is always checked against the stored version.
+DATA_VERSION_TTL_SECONDS = float(os.getenv("DATA_VERSION_TTL_SECONDS", "5"))
+
+MAX_SHIFT_BATCH_SIZE = int(os.getenv("MAX_SHIFT_BATCH_SIZE", "5000"))
+MAX_WORKER_BATCH_SIZE = int(os.getenv("MAX_WORKER_BATCH_SIZE", "1000"))
+WORKER_DELETE_CHUNK_SIZE = int(os.getenv("WORKER_DELETE_CHUNK_SIZE", "500"))
+# Workers with more shifts than this are deleted by a background job even
+# without async=true, so the request does not run for the whole cascade.
+WORKER_DELETE_SYNC_MAX_SHIFTS = int(os.getenv("WORKER_DELETE_SYNC_MAX_SHIFTS", "2000"))
+# A running deletion job saves its progress after every chunk; one that has
+# not done so for this long died with its instance and is reported as failed.
+WORKER_DELETION_STALE_SECONDS = float(os.getenv("WORKER_DELETION_STALE_SECONDS", "300"))
+
+TRANSACTION_MAX_ATTEMPTS = int(os.getenv("TRANSACTION_MAX_ATTEMPTS", "5"))
+TRANSACTION_RETRY_DELAY_SECONDS = float(os.getenv("TRANSACTION_RETRY_DELAY_SECONDS", "0.05"))
+# Keep looking up and overlap-checking root-level Shift entities until
+# `python -m app.migrate_shift_keys` has moved them under their Worker.
+LEGACY_SHIFT_KEYS_ENABLED = _env_bool("LEGACY_SHIFT_KEYS_ENABLED", True)
+
+# Worker threads that blocking Datastore calls run on (AnyIO's default is 40).
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+IMPORT_MAX_IN_FLIGHT = int(os.getenv("IMPORT_MAX_IN_FLIGHT", "4"))
+IMPORT_MAX_REPORTED_ERRORS = int(os.getenv("IMPORT_MAX_REPORTED_ERRORS", "100"))
+IMPORT_SPOOL_BYTES = int(os.getenv("IMPORT_SPOOL_BYTES", str(8 * 1024 * 1024)))
+
+# One transaction per batch, so at most Datastore's 500 writes per commit.
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "500"))
+BACKFILL_MAX_IN_FLIGHT = int(os.getenv("BACKFILL_MAX_IN_FLIGHT", "4"))
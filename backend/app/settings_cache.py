@@ -0,0 +1,84 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class _CacheEntry:
+    def __init__(self, value: Any, version: Optional[int], checked_at: float):
+        self.value = value
+        self.version = version
+        self.checked_at = checked_at
+
+
+class SettingsCache:
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _CacheEntry] = {}
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._revalidations = 0
+
+    def get(self, name: str, load: Callable[[], Tuple[Any, Optional[int]]], load_version: Callable[[], Optional[int]]) -> Any:
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and time.monotonic() - entry.checked_at < self.ttl_seconds:
+                self._hits += 1
+                return entry.value
+            generation = self._generation
+
+        # Past the TTL, another process may have changed the value. Comparing the
+        # stored version is cheaper than reading the whole entity again.
+        if entry is not None and entry.version is not None and load_version() == entry.version:
+            with self._lock:
+                if self._entries.get(name) is entry:
+                    entry.checked_at = time.monotonic()
+                self._hits += 1
+                self._revalidations += 1
+            return entry.value
+
+        value, version = load()
+        with self._lock:
+            self._misses += 1
+            if generation == self._generation:
+                self._entries[name] = _CacheEntry(value, version, time.monotonic())
+        return value
+
+    def peek(self, name: str) -> Optional[Any]:
+        # The cached value while it is within the TTL, without any I/O.
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or time.monotonic() - entry.checked_at >= self.ttl_seconds:
+                return None
+            self._hits += 1
+            return entry.value
+
+    def set(self, name: str, value: Any, version: Optional[int]) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries[name] = _CacheEntry(value, version, time.monotonic())
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        with self._lock:
+            self._generation += 1
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+            self._revalidations = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "revalidations": self._revalidations,
+                "entries": len(self._entries),
+                "ttl_seconds": self.ttl_seconds,
+            }
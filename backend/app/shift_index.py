@@ -0,0 +1,155 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+ShiftInterval = Tuple[datetime, datetime, int]
+Window = Tuple[datetime, datetime]
+
+
+def _interval_start(interval: ShiftInterval) -> datetime:
+    return interval[0]
+
+
+class _WorkerIntervals:
+    def __init__(self, intervals: List[ShiftInterval], loaded_at: float, window: Optional[Window] = None):
+        self.intervals = intervals
+        self.loaded_at = loaded_at
+        # The range the intervals were loaded for; only checks inside it can be
+        # answered. None when the worker's whole history is loaded.
+        self.window = window
+        # Stored shifts that already overlap each other break the "ends are
+        # sorted too" property the O(log n) lookup relies on.
+        self.consistent = all(
+            intervals[i][1] <= intervals[i + 1][0] for i in range(len(intervals) - 1)
+        )
+
+
+class ShiftIntervalIndex:
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._workers: Dict[int, _WorkerIntervals] = {}
+        self._shift_workers: Dict[int, Tuple[int, datetime]] = {}
+        self._write_seq = 0
+
+    def load_token(self) -> int:
+        with self._lock:
+            return self._write_seq
+
+    def is_fresh(self, worker_id: int) -> bool:
+        with self._lock:
+            return self._fresh(worker_id)
+
+    def load_worker(self, worker_id: int, shifts: Iterable[Tuple[int, datetime, datetime]], token: int, window: Optional[Window] = None) -> bool:
+        intervals = sorted(((start, end, shift_id) for shift_id, start, end in shifts), key=_interval_start)
+        with self._lock:
+            if token != self._write_seq:
+                return False
+            self._drop_worker(worker_id)
+            self._workers[worker_id] = _WorkerIntervals(intervals, time.monotonic(), window)
+            for start, _, shift_id in intervals:
+                self._shift_workers[shift_id] = (worker_id, start)
+            return True
+
+    def rebuild(self, shifts: Iterable[Tuple[int, int, datetime, datetime]]) -> int:
+        by_worker: Dict[int, List[ShiftInterval]] = {}
+        count = 0
+        for worker_id, shift_id, start, end in shifts:
+            by_worker.setdefault(worker_id, []).append((start, end, shift_id))
+            count += 1
+        loaded_at = time.monotonic()
+        with self._lock:
+            self._workers.clear()
+            self._shift_workers.clear()
+            self._write_seq += 1
+            for worker_id, intervals in by_worker.items():
+                intervals.sort(key=_interval_start)
+                self._workers[worker_id] = _WorkerIntervals(intervals, loaded_at)
+                for start, _, shift_id in intervals:
+                    self._shift_workers[shift_id] = (worker_id, start)
+        return count
+
+    def overlaps(self, worker_id: int, start_utc: datetime, end_utc: datetime, exclude_shift_id: Optional[int] = None) -> Optional[bool]:
+        with self._lock:
+            if not self._fresh(worker_id):
+                return None
+            worker = self._workers[worker_id]
+            if not worker.consistent:
+                return None
+            if worker.window is not None and not (worker.window[0] <= start_utc and end_utc <= worker.window[1]):
+                return None
+            intervals = worker.intervals
+            position = bisect_left(intervals, end_utc, key=_interval_start)
+            # Intervals before `position` start before end_utc; since they do not
+            # overlap each other, the last one also ends last.
+            while position > 0:
+                position -= 1
+                shift_start, shift_end, shift_id = intervals[position]
+                if shift_id == exclude_shift_id:
+                    continue
+                return start_utc < shift_end and shift_start < end_utc
+            return False
+
+    def add(self, worker_id: int, shift_id: int, start_utc: datetime, end_utc: datetime) -> None:
+        with self._lock:
+            self._write_seq += 1
+            self._remove_shift(shift_id)
+            worker = self._workers.get(worker_id)
+            if worker is None:
+                return
+            intervals = worker.intervals
+            position = bisect_right(intervals, start_utc, key=_interval_start)
+            if position > 0 and intervals[position - 1][1] > start_utc:
+                worker.consistent = False
+            if position < len(intervals) and end_utc > intervals[position][0]:
+                worker.consistent = False
+            intervals.insert(position, (start_utc, end_utc, shift_id))
+            self._shift_workers[shift_id] = (worker_id, start_utc)
+
+    def remove(self, shift_id: int) -> None:
+        with self._lock:
+            self._write_seq += 1
+            self._remove_shift(shift_id)
+
+    def invalidate(self, worker_id: int) -> None:
+        with self._lock:
+            self._write_seq += 1
+            self._drop_worker(worker_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._write_seq += 1
+            self._workers.clear()
+            self._shift_workers.clear()
+
+    def _fresh(self, worker_id: int) -> bool:
+        worker = self._workers.get(worker_id)
+        if worker is None:
+            return False
+        return time.monotonic() - worker.loaded_at < self.ttl_seconds
+
+    def _drop_worker(self, worker_id: int) -> None:
+        worker = self._workers.pop(worker_id, None)
+        if worker is None:
+            return
+        for _, _, shift_id in worker.intervals:
+            self._shift_workers.pop(shift_id, None)
+
+    def _remove_shift(self, shift_id: int) -> None:
+        located = self._shift_workers.pop(shift_id, None)
+        if located is None:
+            return
+        worker_id, start_utc = located
+        worker = self._workers.get(worker_id)
+        if worker is None:
+            return
+        intervals = worker.intervals
+        position = bisect_left(intervals, start_utc, key=_interval_start)
+        while position < len(intervals) and intervals[position][0] == start_utc:
+            if intervals[position][2] == shift_id:
+                del intervals[position]
+                return
+            position += 1
@@ -0,0 +1,139 @@
+import base64
+import binascii
+import operator
+from datetime import datetime
+from typing import Any, ContextManager, Iterable, List, Optional, Protocol, Sequence, Tuple
+
+from google.cloud import datastore
+
+Filter = Tuple[str, str, Any]
+Path = Tuple[Any, ...]
+
+OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+class Storage(Protocol):
+    # Every backend hands out google.cloud.datastore Keys and Entities, so
+    # callers see the same objects whichever one is configured.
+    def key(self, *path: Any) -> datastore.Key: ...
+
+    def get_multi(self, keys: Sequence[datastore.Key]) -> List[datastore.Entity]: ...
+
+    def put_multi(self, entities: Sequence[datastore.Entity]) -> None: ...
+
+    def delete_multi(self, keys: Sequence[datastore.Key]) -> None: ...
+
+    def allocate_ids(self, kind: str, count: int) -> List[int]: ...
+
+    def reserve_ids(self, keys: Sequence[datastore.Key]) -> None: ...
+
+    def query(self, kind: str, filters: Sequence[Filter] = (), ancestor: Optional[Path] = None, key: Optional[datastore.Key] = None,
+              projection: Optional[List[str]] = None, order: Optional[List[str]] = None, distinct_on: Optional[List[str]] = None,
+              limit: Optional[int] = None, cursor: Optional[str] = None) -> Tuple[List[datastore.Entity], Optional[str]]: ...
+
+    def transaction(self) -> ContextManager: ...
+
+
+def value_sort_key(value: Any) -> Tuple[int, Any]:
+    # Datastore compares values of different types by type first.
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (3, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, datetime):
+        return (2, value)
+    return (4, value)
+
+
+def key_sort_key(key: datastore.Key) -> Tuple:
+    return path_sort_key(key.flat_path)
+
+
+def path_sort_key(path: Path) -> Tuple:
+    # Key order is element by element, with numeric IDs before names.
+    return tuple(
+        (path[position], (0, path[position + 1]) if isinstance(path[position + 1], int) else (1, path[position + 1]))
+        for position in range(0, len(path), 2)
+    )
+
+
+def is_descendant(key: datastore.Key, ancestor: Path) -> bool:
+    return key.flat_path[:len(ancestor)] == tuple(ancestor) and len(key.flat_path) > len(ancestor)
+
+
+def matches(entity: datastore.Entity, filters: Iterable[Filter]) -> bool:
+    for name, op, value in filters:
+        if name == "__key__":
+            if not OPERATORS[op](key_sort_key(entity.key), key_sort_key(value)):
+                return False
+            continue
+        # As in Datastore, an entity without the property never matches.
+        if name not in entity or not OPERATORS[op](value_sort_key(entity[name]), value_sort_key(value)):
+            return False
+    return True
+
+
+def sort_entities(entities: List[datastore.Entity], order: Optional[List[str]]) -> List[datastore.Entity]:
+    entities = sorted(entities, key=lambda entity: key_sort_key(entity.key))
+    for name in reversed(order or []):
+        descending = name.startswith("-")
+        name = name.lstrip("-")
+        if name == "__key__":
+            entities.sort(key=lambda entity: key_sort_key(entity.key), reverse=descending)
+        else:
+            entities = [entity for entity in entities if name in entity]
+            entities.sort(key=lambda entity: value_sort_key(entity[name]), reverse=descending)
+    return entities
+
+
+def finish_query(entities: List[datastore.Entity], projection: Optional[List[str]], distinct_on: Optional[List[str]],
+                 limit: Optional[int], cursor: Optional[str]) -> Tuple[List[datastore.Entity], Optional[str]]:
+    # Projection, distinct and offset pagination over already filtered and
+    # ordered entities; returns copies so callers cannot alter stored state.
+    if projection:
+        entities = [entity for entity in entities if all(name == "__key__" or name in entity for name in projection)]
+    if distinct_on:
+        seen = set()
+        distinct = []
+        for entity in entities:
+            values = tuple(value_sort_key(entity.get(name)) for name in distinct_on)
+            if values not in seen:
+                seen.add(values)
+                distinct.append(entity)
+        entities = distinct
+    offset = decode_offset(cursor) if cursor else 0
+    end = offset + limit if limit is not None else len(entities)
+    page = [project(entity, projection) for entity in entities[offset:end]]
+    return page, encode_offset(end) if end < len(entities) else None
+
+
+def project(entity: datastore.Entity, projection: Optional[List[str]]) -> datastore.Entity:
+    copy = datastore.Entity(key=entity.key, exclude_from_indexes=tuple(entity.exclude_from_indexes))
+    if projection:
+        copy.update({name: entity[name] for name in projection if name != "__key__"})
+    else:
+        copy.update(entity)
+    return copy
+
+
+def encode_offset(offset: int) -> str:
+    return base64.urlsafe_b64encode(f"offset:{offset}".encode("ascii")).decode("ascii")
+
+
+def decode_offset(cursor: str) -> int:
+    try:
+        prefix, _, offset = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("ascii").partition(":")
+        if prefix == "offset" and offset.isdigit():
+            return int(offset)
+    except (binascii.Error, UnicodeError):
+        pass
+    raise ValueError("Invalid cursor")
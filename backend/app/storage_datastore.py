@@ -0,0 +1,64 @@
+from typing import Any, ContextManager, List, Optional, Sequence, Tuple
+
+from google.api_core.exceptions import BadRequest
+from google.cloud import datastore
+
+from app.storage import Filter, Path
+
+
+class DatastoreStorage:
+    def __init__(self, project: str):
+        self.project = project
+        self._client = None
+
+    @property
+    def client(self) -> datastore.Client:
+        # Created on first use, so importing the app needs no credentials.
+        if self._client is None:
+            self._client = datastore.Client(project=self.project)
+        return self._client
+
+    def key(self, *path: Any) -> datastore.Key:
+        return datastore.Key(*path, project=self.project)
+
+    def get_multi(self, keys: Sequence[datastore.Key]) -> List[datastore.Entity]:
+        return self.client.get_multi(list(keys))
+
+    def put_multi(self, entities: Sequence[datastore.Entity]) -> None:
+        self.client.put_multi(list(entities))
+
+    def delete_multi(self, keys: Sequence[datastore.Key]) -> None:
+        self.client.delete_multi(list(keys))
+
+    def allocate_ids(self, kind: str, count: int) -> List[int]:
+        return [key.id for key in self.client.allocate_ids(self.key(kind), count)]
+
+    def reserve_ids(self, keys: Sequence[datastore.Key]) -> None:
+        self.client.reserve_ids_multi(list(keys))
+
+    def query(self, kind: str, filters: Sequence[Filter] = (), ancestor: Optional[Path] = None, key: Optional[datastore.Key] = None,
+              projection: Optional[List[str]] = None, order: Optional[List[str]] = None, distinct_on: Optional[List[str]] = None,
+              limit: Optional[int] = None, cursor: Optional[str] = None) -> Tuple[List[datastore.Entity], Optional[str]]:
+        query = self.client.query(kind=kind, ancestor=self.key(*ancestor) if ancestor else None)
+        if key is not None:
+            query.key_filter(key, "=")
+        for property_name, operator, value in filters:
+            query.add_filter(property_name, operator, value)
+        if projection:
+            query.projection = projection
+        if order:
+            query.order = order
+        if distinct_on:
+            query.distinct_on = distinct_on
+        if limit is None and cursor is None:
+            return list(query.fetch()), None
+        iterator = query.fetch(limit=limit, start_cursor=cursor.encode("ascii") if cursor else None)
+        try:
+            entities = list(next(iterator.pages))
+        except BadRequest:
+            raise ValueError("Invalid cursor")
+        next_cursor = iterator.next_page_token
+        return entities, next_cursor.decode("ascii") if next_cursor else None
+
+    def transaction(self) -> ContextManager:
+        return self.client.transaction()
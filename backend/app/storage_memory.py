@@ -0,0 +1,362 @@
+import base64
+import binascii
+import json
+import threading
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from google.cloud import datastore
+
+from app.storage import OPERATORS, Filter, Path, is_descendant, matches, path_sort_key, project, value_sort_key
+
+RANGE_OPERATORS = ("<", "<=", ">", ">=")
+
+# Sorted indexes are split into blocks of about this many entries, so a write
+# shifts one block instead of the whole list.
+BLOCK_SIZE = 1000
+
+# Below this share of the kind, a query sorts its equality or ancestor
+# candidates rather than walking the kind's ordered index.
+CANDIDATE_SORT_RATIO = 16
+
+Position = Tuple[Any, ...]
+
+
+class MemoryStorage:
+    # Entities live in per-kind dicts with an equality index on every scalar
+    # property, an ancestor index, a key-ordered index per kind and, for each
+    # property a query orders or ranges by, a (value, key) ordered index that
+    # is built on first use and kept current on every write. Cursors record
+    # the last entity's sort position, so the next page bisects to it and
+    # writes between pages neither skip nor repeat entities. Transactions hold
+    # the lock for their whole duration and apply their writes on commit.
+    def __init__(self, project: str):
+        self.project = project
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._entities: Dict[str, Dict[Path, datastore.Entity]] = {}
+        self._equal: Dict[Tuple[str, str], Dict[Any, Set[Path]]] = {}
+        self._descendants: Dict[Tuple[str, Path], Set[Path]] = {}
+        self._keys: Dict[str, _SortedIndex] = {}
+        self._ordered: Dict[Tuple[str, str], _SortedIndex] = {}
+        self._next_ids: Dict[str, int] = {}
+
+    def key(self, *path: Any) -> datastore.Key:
+        return datastore.Key(*path, project=self.project)
+
+    def get_multi(self, keys: Sequence[datastore.Key]) -> List[datastore.Entity]:
+        with self._lock:
+            found = (self._entities.get(key.kind, {}).get(key.flat_path) for key in keys)
+            return [project(entity, None) for entity in found if entity is not None]
+
+    def put_multi(self, entities: Sequence[datastore.Entity]) -> None:
+        with self._lock:
+            for entity in entities:
+                if entity.key.is_partial:
+                    entity.key = entity.key.completed_key(self.allocate_ids(entity.key.kind, 1)[0])
+            pending = getattr(self._local, "pending", None)
+            for entity in entities:
+                if pending is not None:
+                    pending[entity.key.flat_path] = (entity.key, project(entity, None))
+                else:
+                    self._store(entity.key, project(entity, None))
+
+    def delete_multi(self, keys: Sequence[datastore.Key]) -> None:
+        with self._lock:
+            pending = getattr(self._local, "pending", None)
+            for key in keys:
+                if pending is not None:
+                    pending[key.flat_path] = (key, None)
+                else:
+                    self._store(key, None)
+
+    def allocate_ids(self, kind: str, count: int) -> List[int]:
+        with self._lock:
+            first = self._next_ids.get(kind, 1)
+            self._next_ids[kind] = first + count
+            return list(range(first, first + count))
+
+    def reserve_ids(self, keys: Sequence[datastore.Key]) -> None:
+        with self._lock:
+            for key in keys:
+                self._reserve(key)
+
+    def query(self, kind: str, filters: Sequence[Filter] = (), ancestor: Optional[Path] = None, key: Optional[datastore.Key] = None,
+              projection: Optional[List[str]] = None, order: Optional[List[str]] = None, distinct_on: Optional[List[str]] = None,
+              limit: Optional[int] = None, cursor: Optional[str] = None) -> Tuple[List[datastore.Entity], Optional[str]]:
+        order = _effective_order(order, filters)
+        after = _decode_position(cursor, order) if cursor else None
+        page: List[datastore.Entity] = []
+        seen: Set[Tuple] = set()
+        with self._lock:
+            stored = self._entities.get(kind, {})
+            candidates = self._candidates(kind, filters, ancestor, key)
+            last = None
+            for _, path in self._in_order(kind, order, filters, candidates, after):
+                entity = stored[path]
+                if candidates is not None and path not in candidates:
+                    continue
+                if not matches(entity, filters) or (ancestor is not None and not is_descendant(entity.key, ancestor)):
+                    continue
+                if projection and not all(name == "__key__" or name in entity for name in projection):
+                    continue
+                if distinct_on:
+                    values = tuple(value_sort_key(entity.get(name)) for name in distinct_on)
+                    if values in seen:
+                        continue
+                    seen.add(values)
+                if limit is not None and len(page) == limit:
+                    return page, _encode_position(order, last)
+                page.append(project(entity, projection))
+                last = entity
+        return page, None
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self._lock:
+            if getattr(self._local, "pending", None) is not None:
+                yield
+                return
+            self._local.pending = {}
+            try:
+                yield
+                for key, entity in self._local.pending.values():
+                    self._store(key, entity)
+            finally:
+                self._local.pending = None
+
+    def _candidates(self, kind: str, filters: Sequence[Filter], ancestor: Optional[Path], key: Optional[datastore.Key]) -> Optional[Set[Path]]:
+        # The narrowest equality, ancestor or key match, or None when only the
+        # ordered walk can narrow the query; every filter is re-checked afterwards.
+        candidates: Optional[Set[Path]] = None
+        if key is not None:
+            candidates = {key.flat_path}
+        if ancestor is not None:
+            candidates = self._intersect(candidates, self._descendants.get((kind, tuple(ancestor)), set()))
+        for name, op, value in filters:
+            if op == "=" and name != "__key__":
+                candidates = self._intersect(candidates, self._equal.get((kind, name), {}).get(value_sort_key(value), set()))
+        return candidates
+
+    def _intersect(self, candidates: Optional[Set[Path]], paths: Set[Path]) -> Set[Path]:
+        return set(paths) if candidates is None else candidates & paths
+
+    def _in_order(self, kind: str, order: List[str], filters: Sequence[Filter], candidates: Optional[Set[Path]],
+                  after: Optional[Position]) -> Iterator[Tuple[Position, Path]]:
+        stored = self._entities.get(kind, {})
+        few = candidates is not None and len(candidates) * CANDIDATE_SORT_RATIO <= len(stored)
+        if few or len(order) > 1 or (order and order[0].startswith("-")):
+            return self._sorted_candidates(kind, order, candidates, after)
+        if not order:
+            return self._walk(self._keys.get(kind, _SortedIndex()), 1, after, after, [])
+        index = self._ordered.get((kind, order[0]))
+        if index is None:
+            index = self._ordered[(kind, order[0])] = _SortedIndex(sorted(
+                (value_sort_key(entity[order[0]]), path_sort_key(path), path)
+                for path, entity in stored.items() if _is_indexed(entity, order[0])
+            ))
+        lower = [(value_sort_key(value),) for name, op, value in filters if name == order[0] and op in (">", ">=")]
+        upper = [(op, value_sort_key(value)) for name, op, value in filters if name == order[0] and op in ("<", "<=")]
+        start = max(lower + ([after] if after is not None else []), default=None)
+        return self._walk(index, 2, start, after, upper)
+
+    def _walk(self, index: "_SortedIndex", width: int, start: Optional[Position], after: Optional[Position],
+              upper: List[Tuple[str, Any]]) -> Iterator[Tuple[Position, Path]]:
+        # Ordered index items are the sort position followed by the path.
+        for item in index.iter_from(start):
+            position = item[:width]
+            if after is not None and position <= after:
+                continue
+            if not all(OPERATORS[op](position[0], bound) for op, bound in upper):
+                return
+            yield position, item[width]
+
+    def _sorted_candidates(self, kind: str, order: List[str], candidates: Optional[Set[Path]],
+                           after: Optional[Position]) -> Iterator[Tuple[Position, Path]]:
+        stored = self._entities.get(kind, {})
+        positioned = []
+        for path in stored if candidates is None else candidates:
+            entity = stored.get(path)
+            position = _entity_position(entity, order) if entity is not None else None
+            if position is not None:
+                positioned.append((position, path))
+        positioned.sort(key=lambda item: item[0])
+        start = bisect_right(positioned, after, key=lambda item: item[0]) if after is not None else 0
+        return iter(positioned[start:])
+
+    def _store(self, key: datastore.Key, entity: Optional[datastore.Entity]) -> None:
+        stored = self._entities.setdefault(key.kind, {})
+        previous = stored.pop(key.flat_path, None)
+        if previous is not None:
+            self._unindex(previous)
+        if entity is not None:
+            stored[key.flat_path] = entity
+            self._index(entity)
+            self._reserve(key)
+
+    def _index(self, entity: datastore.Entity) -> None:
+        path = entity.key.flat_path
+        kind, order_key = path[-2], path_sort_key(path)
+        for name, value in entity.items():
+            if _indexable(value) and name not in entity.exclude_from_indexes:
+                self._equal.setdefault((kind, name), {}).setdefault(value_sort_key(value), set()).add(path)
+                if (kind, name) in self._ordered:
+                    self._ordered[(kind, name)].add((value_sort_key(value), order_key, path))
+        for end in range(2, len(path), 2):
+            self._descendants.setdefault((kind, path[:end]), set()).add(path)
+        self._keys.setdefault(kind, _SortedIndex()).add((order_key, path))
+
+    def _unindex(self, entity: datastore.Entity) -> None:
+        path = entity.key.flat_path
+        kind, order_key = path[-2], path_sort_key(path)
+        for name, value in entity.items():
+            if _indexable(value) and name not in entity.exclude_from_indexes:
+                self._equal.get((kind, name), {}).get(value_sort_key(value), set()).discard(path)
+                if (kind, name) in self._ordered:
+                    self._ordered[(kind, name)].discard((value_sort_key(value), order_key, path))
+        for end in range(2, len(path), 2):
+            self._descendants.get((kind, path[:end]), set()).discard(path)
+        self._keys[kind].discard((order_key, path))
+
+    def _reserve(self, key: datastore.Key) -> None:
+        # Explicitly used IDs are never handed out by allocate_ids.
+        if isinstance(key.id, int) and key.id >= self._next_ids.get(key.kind, 1):
+            self._next_ids[key.kind] = key.id + 1
+
+
+class _SortedIndex:
+    # A sorted list kept as blocks of at most 2 * BLOCK_SIZE items plus the
+    # largest item of each block, so add and discard bisect twice and move
+    # one block's worth of items.
+    def __init__(self, items: Iterable[Any] = ()):
+        items = list(items)
+        self._blocks = [items[start:start + BLOCK_SIZE] for start in range(0, len(items), BLOCK_SIZE)]
+        self._maxes = [block[-1] for block in self._blocks]
+
+    def add(self, item: Any) -> None:
+        if not self._blocks:
+            self._blocks.append([item])
+            self._maxes.append(item)
+            return
+        position = min(bisect_left(self._maxes, item), len(self._blocks) - 1)
+        block = self._blocks[position]
+        insort(block, item)
+        self._maxes[position] = block[-1]
+        if len(block) > 2 * BLOCK_SIZE:
+            self._blocks[position:position + 1] = [block[:BLOCK_SIZE], block[BLOCK_SIZE:]]
+            self._maxes[position:position + 1] = [block[BLOCK_SIZE - 1], block[-1]]
+
+    def discard(self, item: Any) -> None:
+        position = bisect_left(self._maxes, item)
+        if position == len(self._blocks):
+            return
+        block = self._blocks[position]
+        offset = bisect_left(block, item)
+        if offset == len(block) or block[offset] != item:
+            return
+        del block[offset]
+        if block:
+            self._maxes[position] = block[-1]
+        else:
+            del self._blocks[position]
+            del self._maxes[position]
+
+    def iter_from(self, start: Optional[Any]) -> Iterator[Any]:
+        # Items from the first one not less than start, in order.
+        position, offset = 0, 0
+        if start is not None:
+            position = bisect_left(self._maxes, start)
+            if position == len(self._blocks):
+                return
+            offset = bisect_left(self._blocks[position], start)
+        for block in self._blocks[position:]:
+            yield from block[offset:]
+            offset = 0
+
+
+class _Descending:
+    # Inverts the comparison of a sort value for descending order.
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __eq__(self, other: Any) -> bool:
+        return self.value == other.value
+
+    def __lt__(self, other: Any) -> bool:
+        return other.value < self.value
+
+    def __le__(self, other: Any) -> bool:
+        return other.value <= self.value
+
+
+def _entity_position(entity: datastore.Entity, order: List[str]) -> Optional[Position]:
+    # The order values followed by the key, which breaks ties as in
+    # Datastore; None when the entity has an ordered property unindexed.
+    values = []
+    for name in order:
+        bare = name.lstrip("-")
+        if bare != "__key__" and not _is_indexed(entity, bare):
+            return None
+        values.append(None if bare == "__key__" else entity[bare])
+    return _position(order, values, entity.key.flat_path)
+
+
+def _position(order: List[str], values: List[Any], path: Path) -> Position:
+    key = path_sort_key(path)
+    parts = []
+    for name, value in zip(order, values):
+        descending = name.startswith("-")
+        part = key if name in ("__key__", "-__key__") else value_sort_key(value)
+        parts.append(_Descending(part) if descending else part)
+    parts.append(key)
+    return tuple(parts)
+
+
+def _encode_position(order: List[str], entity: datastore.Entity) -> str:
+    values = [None if name.lstrip("-") == "__key__" else _encode_value(entity[name.lstrip("-")]) for name in order]
+    data = {"order": order, "values": values, "path": list(entity.key.flat_path)}
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+def _decode_position(cursor: str, order: List[str]) -> Position:
+    # A cursor only resumes the query shape it came from.
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        if data["order"] == order and len(data["values"]) == len(order) and data["path"]:
+            path = tuple(data["path"])
+            if len(path) % 2 == 0 and all(isinstance(kind, str) for kind in path[::2]):
+                return _position(order, [_decode_value(value) for value in data["values"]], path)
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError, AttributeError):
+        pass
+    raise ValueError("Invalid cursor")
+
+
+def _encode_value(value: Any) -> Any:
+    return {"datetime": value.isoformat()} if isinstance(value, datetime) else value
+
+
+def _decode_value(value: Any) -> Any:
+    return datetime.fromisoformat(value["datetime"]) if isinstance(value, dict) else value
+
+
+def _effective_order(order: Optional[List[str]], filters: Sequence[Filter]) -> List[str]:
+    order = list(order or [])
+    if not order:
+        # As in Datastore, an inequality filter orders results by its property.
+        order = [name for name, op, _ in filters if op in RANGE_OPERATORS and name != "__key__"][:1]
+    while order and order[-1] == "__key__":
+        # Ascending key order already breaks every tie.
+        order.pop()
+    return order
+
+
+def _is_indexed(entity: datastore.Entity, name: str) -> bool:
+    return name in entity and _indexable(entity[name]) and name not in entity.exclude_from_indexes
+
+
+def _indexable(value: Any) -> bool:
+    return value is None or isinstance(value, (int, float, str, bool, datetime))
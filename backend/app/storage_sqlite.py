@@ -0,0 +1,213 @@
+import json
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+from google.cloud import datastore
+
+from app.storage import OPERATORS, Filter, Path, decode_offset, encode_offset, finish_query, project
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+PROPERTY_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# Entities are stored as JSON, with expression indexes on the properties that
+# the shift queries filter and order on. `path` encodes the key so that text
+# order is Datastore key order and an entity group is a contiguous range.
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS entities (
+        path TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        key_path TEXT NOT NULL,
+        data TEXT NOT NULL,
+        datetimes TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS entities_kind_path ON entities (kind, path)",
+    "CREATE INDEX IF NOT EXISTS entities_worker_start ON entities (kind, json_extract(data, '$.worker_id'), json_extract(data, '$.start_utc'))",
+    "CREATE INDEX IF NOT EXISTS entities_start ON entities (kind, json_extract(data, '$.start_utc'))",
+    "CREATE INDEX IF NOT EXISTS entities_shift_id ON entities (kind, json_extract(data, '$.shift_id'))",
+    "CREATE TABLE IF NOT EXISTS id_counters (kind TEXT PRIMARY KEY, next_id INTEGER NOT NULL)",
+]
+
+
+def encode_path(flat_path: Path) -> str:
+    # Zero-padded IDs sort numerically and before names ('#' < '~').
+    parts = []
+    for position in range(0, len(flat_path), 2):
+        kind, identifier = flat_path[position], flat_path[position + 1]
+        parts.append(f"{kind}:#{identifier:020d}" if isinstance(identifier, int) else f"{kind}:~{identifier}")
+    return "/".join(parts)
+
+
+def encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return (value - EPOCH) // ONE_MICROSECOND
+    return value
+
+
+def property_expression(name: str) -> str:
+    if not PROPERTY_NAME.match(name):
+        raise ValueError(f"Unsupported property name: {name}")
+    # Written out literally so SQLite can match it to an expression index.
+    return f"json_extract(data, '$.{name}')"
+
+
+class SqliteStorage:
+    # One connection shared by every thread behind a lock; a transaction
+    # holds the lock from BEGIN to COMMIT, so transactions never conflict.
+    def __init__(self, project: str, path: str):
+        self.project = project
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self._connection.execute(statement)
+
+    def key(self, *path: Any) -> datastore.Key:
+        return datastore.Key(*path, project=self.project)
+
+    def get_multi(self, keys: Sequence[datastore.Key]) -> List[datastore.Entity]:
+        paths = [encode_path(key.flat_path) for key in keys]
+        entities = []
+        with self._lock:
+            for offset in range(0, len(paths), 500):
+                chunk = paths[offset:offset + 500]
+                rows = self._connection.execute(
+                    f"SELECT key_path, data, datetimes FROM entities WHERE path IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                entities.extend(self._decode(row) for row in rows)
+        return entities
+
+    def put_multi(self, entities: Sequence[datastore.Entity]) -> None:
+        with self._write():
+            for entity in entities:
+                if entity.key.is_partial:
+                    entity.key = entity.key.completed_key(self.allocate_ids(entity.key.kind, 1)[0])
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO entities (path, kind, key_path, data, datetimes) VALUES (?, ?, ?, ?, ?)",
+                [self._encode(entity) for entity in entities]
+            )
+            self.reserve_ids([entity.key for entity in entities])
+
+    def delete_multi(self, keys: Sequence[datastore.Key]) -> None:
+        with self._write():
+            self._connection.executemany("DELETE FROM entities WHERE path = ?", [(encode_path(key.flat_path),) for key in keys])
+
+    def allocate_ids(self, kind: str, count: int) -> List[int]:
+        with self._write():
+            row = self._connection.execute("SELECT next_id FROM id_counters WHERE kind = ?", (kind,)).fetchone()
+            first = row[0] if row else 1
+            self._connection.execute(
+                "INSERT INTO id_counters (kind, next_id) VALUES (?, ?) ON CONFLICT (kind) DO UPDATE SET next_id = excluded.next_id",
+                (kind, first + count)
+            )
+        return list(range(first, first + count))
+
+    def reserve_ids(self, keys: Sequence[datastore.Key]) -> None:
+        highest = {}
+        for key in keys:
+            if isinstance(key.id, int):
+                highest[key.kind] = max(highest.get(key.kind, 0), key.id)
+        with self._write():
+            self._connection.executemany(
+                "INSERT INTO id_counters (kind, next_id) VALUES (?, ?) "
+                "ON CONFLICT (kind) DO UPDATE SET next_id = max(next_id, excluded.next_id)",
+                [(kind, entity_id + 1) for kind, entity_id in highest.items()]
+            )
+
+    def query(self, kind: str, filters: Sequence[Filter] = (), ancestor: Optional[Path] = None, key: Optional[datastore.Key] = None,
+              projection: Optional[List[str]] = None, order: Optional[List[str]] = None, distinct_on: Optional[List[str]] = None,
+              limit: Optional[int] = None, cursor: Optional[str] = None) -> Tuple[List[datastore.Entity], Optional[str]]:
+        conditions = ["kind = ?"]
+        parameters: List[Any] = [kind]
+        if key is not None:
+            conditions.append("path = ?")
+            parameters.append(encode_path(key.flat_path))
+        if ancestor is not None:
+            prefix = encode_path(tuple(ancestor))
+            conditions.append("path > ? AND path < ?")
+            parameters.extend([prefix + "/", prefix + "0"])
+        for name, op, value in filters:
+            if op not in OPERATORS:
+                raise ValueError(f"Unsupported operator: {op}")
+            if name == "__key__":
+                conditions.append(f"path {op} ?")
+                parameters.append(encode_path(value.flat_path))
+            elif value is None and op in ("=", "!="):
+                property_expression(name)
+                conditions.append(f"json_type(data, '$.{name}') {op} 'null'")
+            else:
+                conditions.append(f"{property_expression(name)} {op} ?")
+                parameters.append(encode_value(value))
+        ordering = []
+        for name in order or []:
+            direction = " DESC" if name.startswith("-") else ""
+            name = name.lstrip("-")
+            if name == "__key__":
+                ordering.append("path" + direction)
+            else:
+                # Datastore leaves out entities without the ordered property.
+                conditions.append(f"{property_expression(name)} IS NOT NULL")
+                ordering.append(property_expression(name) + direction)
+        ordering.append("path")
+        sql = f"SELECT key_path, data, datetimes FROM entities WHERE {' AND '.join(conditions)} ORDER BY {', '.join(ordering)}"
+
+        if projection or distinct_on or limit is None:
+            with self._lock:
+                rows = self._connection.execute(sql, parameters).fetchall()
+            return finish_query([self._decode(row) for row in rows], projection, distinct_on, limit, cursor)
+        offset = decode_offset(cursor) if cursor else 0
+        with self._lock:
+            rows = self._connection.execute(sql + " LIMIT ? OFFSET ?", parameters + [limit + 1, offset]).fetchall()
+        page = [self._decode(row) for row in rows[:limit]]
+        return page, encode_offset(offset + limit) if len(rows) > limit else None
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self._lock:
+            if getattr(self._local, "in_transaction", False):
+                yield
+                return
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._local.in_transaction = True
+            try:
+                yield
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            else:
+                self._connection.execute("COMMIT")
+            finally:
+                self._local.in_transaction = False
+
+    @contextmanager
+    def _write(self) -> Iterator[None]:
+        # Batches outside a transaction still commit once, not once per row.
+        with self.transaction():
+            yield
+
+    def _encode(self, entity: datastore.Entity) -> Tuple[str, str, str, str, str]:
+        data = {name: encode_value(value) for name, value in entity.items()}
+        datetimes = [name for name, value in entity.items() if isinstance(value, datetime)]
+        return (
+            encode_path(entity.key.flat_path),
+            entity.key.kind,
+            json.dumps(entity.key.flat_path),
+            json.dumps(data),
+            json.dumps(datetimes),
+        )
+
+    def _decode(self, row: Tuple[str, str, str]) -> datastore.Entity:
+        key_path, data, datetimes = row
+        entity = datastore.Entity(key=self.key(*json.loads(key_path)))
+        values = json.loads(data)
+        for name in json.loads(datetimes):
+            values[name] = EPOCH + timedelta(microseconds=values[name])
+        entity.update(values)
+        return entity
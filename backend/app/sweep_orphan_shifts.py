@@ -0,0 +1,19 @@
+import argparse
+
+from app.crud import sweep_orphan_shifts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Delete shifts whose worker no longer exists")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the orphaned shifts")
+    args = parser.parse_args()
+
+    swept = sweep_orphan_shifts(dry_run=args.dry_run)
+    for worker_id, count in sorted(swept.items()):
+        print(f"worker {worker_id}: {count} shifts")
+    verb = "Found" if args.dry_run else "Deleted"
+    print(f"{verb} {sum(swept.values())} orphaned shifts of {len(swept)} deleted workers")
+
+
+if __name__ == "__main__":
+    main()
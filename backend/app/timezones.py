@@ -0,0 +1,36 @@
+import hashlib
+import json
+from functools import lru_cache
+from typing import FrozenSet, Tuple
+from zoneinfo import ZoneInfo, available_timezones
+
+
+@lru_cache(maxsize=1)
+def timezone_names() -> FrozenSet[str]:
+    return frozenset(available_timezones())
+
+
+@lru_cache(maxsize=1)
+def sorted_timezone_names() -> Tuple[str, ...]:
+    return tuple(sorted(timezone_names()))
+
+
+def is_valid_timezone(name: str) -> bool:
+    return name in timezone_names()
+
+
+@lru_cache(maxsize=None)
+def get_zone(name: str) -> ZoneInfo:
+    return ZoneInfo(name)
+
+
+@lru_cache(maxsize=1)
+def timezone_catalog() -> Tuple[bytes, str]:
+    body = json.dumps({"timezones": list(sorted_timezone_names())}, separators=(",", ":")).encode("utf-8")
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    return body, etag
+
+
+def load_timezone_catalog() -> int:
+    timezone_catalog()
+    return len(timezone_names())
@@ -0,0 +1,169 @@
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+from app.metrics import rpc_kind
+from app.settings import SLOW_REQUEST_THRESHOLD_MS
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTrace:
+    # Appended to from the threadpool too: AnyIO copies the request's context
+    # into worker threads, so they all see this same object.
+    def __init__(self):
+        self.rpcs: List[Tuple[str, str, float]] = []
+        self.closed = False
+
+    def add(self, operation: str, kind: str, seconds: float) -> None:
+        # Background tasks still run in the request's context once the
+        # response is sent; their round trips are not part of it.
+        if not self.closed:
+            self.rpcs.append((operation, kind, seconds))
+
+    def count(self) -> int:
+        return len(self.rpcs)
+
+    def seconds(self) -> float:
+        return sum(seconds for _, _, seconds in self.rpcs)
+
+    def breakdown(self) -> List[dict]:
+        return [{"operation": operation, "kind": kind, "ms": round(seconds * 1000, 3)} for operation, kind, seconds in self.rpcs]
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def traced(operation: str, kind: str) -> Iterator[None]:
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(operation, kind, time.perf_counter() - started)
+
+
+class TracedStorage:
+    # Wraps the configured storage so that every round trip it makes is added
+    # to the current request's trace. Outside a request it only forwards.
+    def __init__(self, storage: Any):
+        self.storage = storage
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.storage, name)
+
+    def key(self, *path: Any) -> Any:
+        return self.storage.key(*path)
+
+    def get_multi(self, keys: Sequence[Any]) -> List[Any]:
+        with traced("get", rpc_kind((keys,))):
+            return self.storage.get_multi(keys)
+
+    def put_multi(self, entities: Sequence[Any]) -> None:
+        with traced("put", rpc_kind((entities,))):
+            self.storage.put_multi(entities)
+
+    def delete_multi(self, keys: Sequence[Any]) -> None:
+        with traced("delete", rpc_kind((keys,))):
+            self.storage.delete_multi(keys)
+
+    def allocate_ids(self, kind: str, count: int) -> List[int]:
+        with traced("allocate_ids", kind):
+            return self.storage.allocate_ids(kind, count)
+
+    def reserve_ids(self, keys: Sequence[Any]) -> None:
+        with traced("reserve_ids", rpc_kind((keys,))):
+            self.storage.reserve_ids(keys)
+
+    def query(self, kind: str, *args: Any, **kwargs: Any) -> Tuple[List[Any], Optional[str]]:
+        with traced("query", kind):
+            return self.storage.query(kind, *args, **kwargs)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        # Beginning and committing are round trips of their own on Datastore.
+        transaction = self.storage.transaction()
+        with traced("begin_transaction", ""):
+            transaction.__enter__()
+        try:
+            yield
+        except BaseException:
+            if not transaction.__exit__(*sys.exc_info()):
+                raise
+        else:
+            with traced("commit", ""):
+                transaction.__exit__(None, None, None)
+
+
+def server_timing(trace: RequestTrace, elapsed: float) -> str:
+    return f'db;desc="{trace.count()} round trips";dur={trace.seconds() * 1000:.2f}, total;dur={elapsed * 1000:.2f}'
+
+
+def log_slow_request(scope: dict, status: int, elapsed: float, trace: RequestTrace) -> None:
+    route = scope.get("route")
+    logger.warning(json.dumps({
+        "event": "slow_request",
+        "method": scope["method"],
+        "route": getattr(route, "path", None),
+        "path": scope["path"],
+        "status": status,
+        "duration_ms": round(elapsed * 1000, 3),
+        "threshold_ms": SLOW_REQUEST_THRESHOLD_MS,
+        "rpc_count": trace.count(),
+        "rpc_ms": round(trace.seconds() * 1000, 3),
+        "rpcs": trace.breakdown(),
+    }))
+
+
+class TracingMiddleware:
+    def __init__(self, app: Callable, threshold_ms: float = SLOW_REQUEST_THRESHOLD_MS):
+        self.app = app
+        self.threshold_ms = threshold_ms
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        started = time.perf_counter()
+        status = [500]
+
+        def finish() -> None:
+            # The span ends with the response's last body chunk, before any
+            # background tasks run, or when the app raises without one.
+            if trace.closed:
+                return
+            trace.closed = True
+            elapsed = time.perf_counter() - started
+            if elapsed * 1000 >= self.threshold_ms:
+                log_slow_request(scope, status[0], elapsed, trace)
+
+        async def send_with_timing(message: dict) -> None:
+            # Headers go out before a streamed body, so the header covers the
+            # work done up to that point; the slow log covers all of it.
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                timing = server_timing(trace, time.perf_counter() - started).encode("latin-1")
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", timing)]}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            finish()
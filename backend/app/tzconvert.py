@@ -0,0 +1,146 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.timezones import get_zone
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ONE_SECOND = timedelta(seconds=1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+# Below this size the fixed cost of the array pipeline outweighs the savings.
+MIN_BATCH_SIZE = 32
+
+# Offsets are tabulated in chunks of ~194 days, probing every 3 hours and
+# bisecting to the exact second wherever the offset changes. ZoneInfo has no
+# public way to list its transitions, so this is the one limitation: a zone
+# that changes offset and changes back within one probe interval looks
+# unchanged and both transitions are missed. Several changes to different
+# offsets inside one interval are each found, since probing resumes from the
+# first change. The closest transitions in tzdata are days apart.
+_CHUNK_SECONDS = 1 << 24
+_PROBE_SECONDS = 3 * 3600
+_MIN_PROBE = (datetime.min.replace(tzinfo=timezone.utc) - EPOCH) // ONE_SECOND + 86400
+_MAX_PROBE = (datetime.max.replace(tzinfo=timezone.utc) - EPOCH) // ONE_SECOND - 86400
+
+
+def _offset_at(zone, ts: int) -> int:
+    ts = min(max(ts, _MIN_PROBE), _MAX_PROBE)
+    return datetime.fromtimestamp(ts, zone).utcoffset() // ONE_SECOND
+
+
+def _offset_suffix(offset: int) -> str:
+    return datetime(2000, 1, 1, tzinfo=timezone(timedelta(seconds=offset))).isoformat()[19:]
+
+
+def _compute_chunk(zone, chunk: int) -> Tuple[List[int], List[int]]:
+    start = chunk * _CHUNK_SECONDS
+    end = start + _CHUNK_SECONDS
+    previous_offset = _offset_at(zone, start)
+    times = [start]
+    offsets = [previous_offset]
+    probe = start
+    while probe < end:
+        next_probe = min(probe + _PROBE_SECONDS, end)
+        offset = _offset_at(zone, next_probe)
+        if offset != previous_offset:
+            low, high = probe, next_probe
+            while high - low > 1:
+                middle = (low + high) // 2
+                if _offset_at(zone, middle) == previous_offset:
+                    low = middle
+                else:
+                    high = middle
+            # Another change may follow before next_probe, so the offset is
+            # read at the transition and probing resumes from there.
+            offset = _offset_at(zone, high)
+            if high < end:
+                times.append(high)
+                offsets.append(offset)
+            previous_offset = offset
+            next_probe = high
+        probe = next_probe
+    return times, offsets
+
+
+class ZoneOffsetTable:
+    def __init__(self, tz_name: str):
+        self.zone = get_zone(tz_name)
+        self._lock = threading.Lock()
+        self._chunks: Dict[int, Tuple[List[int], List[int]]] = {}
+        self._suffixes: Dict[int, str] = {}
+
+    def transitions(self, chunks: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        times: List[int] = []
+        offsets: List[int] = []
+        for chunk in chunks:
+            with self._lock:
+                cached = self._chunks.get(chunk)
+            if cached is None:
+                cached = _compute_chunk(self.zone, chunk)
+                with self._lock:
+                    self._chunks[chunk] = cached
+            times.extend(cached[0])
+            offsets.extend(cached[1])
+        return np.array(times, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+    def offsets(self, seconds: np.ndarray) -> np.ndarray:
+        chunks = np.unique(seconds // _CHUNK_SECONDS).tolist()
+        times, offsets = self.transitions(chunks)
+        return offsets[np.searchsorted(times, seconds, side="right") - 1]
+
+    def suffix(self, offset: int) -> str:
+        suffix = self._suffixes.get(offset)
+        if suffix is None:
+            suffix = self._suffixes[offset] = _offset_suffix(offset)
+        return suffix
+
+
+_tables: Dict[str, ZoneOffsetTable] = {}
+_tables_lock = threading.Lock()
+
+
+def get_offset_table(tz_name: str) -> ZoneOffsetTable:
+    table = _tables.get(tz_name)
+    if table is None:
+        with _tables_lock:
+            table = _tables.get(tz_name)
+            if table is None:
+                table = _tables[tz_name] = ZoneOffsetTable(tz_name)
+    return table
+
+
+def epoch_microseconds(datetimes: Sequence[datetime]) -> np.ndarray:
+    # Naive values are read as system local time, as datetime.astimezone does.
+    values = (
+        ((dt if dt.tzinfo is not None else dt.astimezone(timezone.utc)) - EPOCH) // ONE_MICROSECOND
+        for dt in datetimes
+    )
+    return np.fromiter(values, dtype=np.int64, count=len(datetimes))
+
+
+def batch_from_epoch(seconds: Sequence[int], tz_name: str, microseconds: Optional[Sequence[int]] = None) -> List[str]:
+    seconds = np.asarray(seconds, dtype=np.int64)
+    if seconds.size == 0:
+        return []
+    table = get_offset_table(tz_name)
+    offsets = table.offsets(seconds)
+    local = seconds + offsets
+    formatted = np.datetime_as_string(local.astype("datetime64[s]"), unit="s").astype(object)
+    if microseconds is not None:
+        microseconds = np.asarray(microseconds, dtype=np.int64)
+        fractional = microseconds != 0
+        if fractional.any():
+            local_us = local[fractional] * 1_000_000 + microseconds[fractional]
+            formatted[fractional] = np.datetime_as_string(local_us.astype("datetime64[us]"), unit="us")
+    unique_offsets, inverse = np.unique(offsets, return_inverse=True)
+    suffixes = np.array([table.suffix(offset) for offset in unique_offsets.tolist()], dtype=object)
+    return (formatted + suffixes[inverse]).tolist()
+
+
+def batch_from_utc(datetimes: Sequence[datetime], tz_name: str) -> List[str]:
+    seconds, microseconds = np.divmod(epoch_microseconds(datetimes), 1_000_000)
+    return batch_from_epoch(seconds, tz_name, microseconds)
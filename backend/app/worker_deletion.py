@@ -0,0 +1,57 @@
+import time
+import uuid
+from typing import Optional
+
+from app.crud import delete_worker, delete_worker_shifts
+from app.db import get_entity, put_entity
+from app.settings import WORKER_DELETION_STALE_SECONDS
+
+
+def new_deletion_state(worker_id: int) -> dict:
+    return {"job_id": uuid.uuid4().hex, "worker_id": worker_id, "status": "running", "deleted_shifts": 0}
+
+
+def load_deletion_state(job_id: str) -> Optional[dict]:
+    entity = get_entity("WorkerDeletionJob", job_id)
+    if entity is None:
+        return None
+    state = {"job_id": job_id, "worker_id": entity["worker_id"], "status": entity["status"], "deleted_shifts": entity["deleted_shifts"]}
+    # A job whose instance died stops saving its heartbeat but stays
+    # "running"; it is failed here so callers stop waiting on it. Its
+    # remaining shifts are picked up by `python -m app.sweep_orphan_shifts`.
+    if state["status"] == "running" and time.time() - entity.get("heartbeat", 0) > WORKER_DELETION_STALE_SECONDS:
+        state["status"] = "failed"
+        save_deletion_state(state)
+    return state
+
+
+def save_deletion_state(state: dict) -> None:
+    data = {key: value for key, value in state.items() if key != "job_id"}
+    data["heartbeat"] = time.time()
+    put_entity("WorkerDeletionJob", state["job_id"], data)
+
+
+def start_worker_deletion(worker_id: int) -> Optional[dict]:
+    # The worker itself is deleted before the job is handed back, so it is
+    # already gone (and can take no new shifts) while its shifts are removed.
+    if delete_worker(worker_id, cascade=False) is None:
+        return None
+    state = new_deletion_state(worker_id)
+    save_deletion_state(state)
+    return state
+
+
+def run_worker_deletion(state: dict) -> dict:
+    # Shifts left behind by a job that died part-way are picked up by
+    # `python -m app.sweep_orphan_shifts`.
+    try:
+        for deleted in delete_worker_shifts(state["worker_id"]):
+            state["deleted_shifts"] += deleted
+            save_deletion_state(state)
+    except BaseException:
+        state["status"] = "failed"
+        save_deletion_state(state)
+        raise
+    state["status"] = "completed"
+    save_deletion_state(state)
+    return state
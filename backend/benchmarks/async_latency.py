@@ -0,0 +1,185 @@
+"""p50/p99 latency of the blocking crud path vs the async crud path.
+
+Datastore is replaced by an in-memory store that sleeps for a fixed latency on
+every RPC, so the numbers reflect how many round trips each request waits on
+in sequence and how the threadpool copes with concurrency, not Datastore
+itself. "sync" calls app.crud on the threadpool exactly as the old `def`
+endpoints did; "async" calls app.async_crud as the endpoints do now.
+
+Run from backend/:
+
+    uv run python -m benchmarks.async_latency --requests 2000 --concurrency 64
+"""
+import argparse
+import asyncio
+import itertools
+import threading
+import time
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from unittest.mock import patch
+
+import numpy as np
+from anyio import to_thread
+from google.cloud import datastore
+
+from app import async_crud, crud
+from app.async_db import configure_threadpool
+
+PROJECT = "benchmark"
+
+
+class SlowStore:
+    def __init__(self, latency_seconds: float):
+        self.latency_seconds = latency_seconds
+        self._lock = threading.Lock()
+        self._entities: Dict[Tuple, datastore.Entity] = {}
+        self._by_property: Dict[Tuple[str, str, Any], datastore.Key] = {}
+        self._ids = itertools.count(1)
+
+    def rpc(self) -> None:
+        time.sleep(self.latency_seconds)
+
+    def key(self, kind: str, entity_id: int, parent: Optional[Tuple[str, int]] = None) -> datastore.Key:
+        return datastore.Key(*(list(parent or ()) + [kind, entity_id]), project=PROJECT)
+
+    def get_entity(self, kind: str, key_name: str) -> Optional[Any]:
+        self.rpc()
+        return None
+
+    def get_entity_projection(self, kind: str, key_name: str, properties: List[str]) -> Optional[Any]:
+        self.rpc()
+        return None
+
+    def put_entity(self, kind: str, key_name: str, data: dict, exclude_from_indexes=()) -> Any:
+        self.rpc()
+        entity = datastore.Entity(key=datastore.Key(kind, key_name, project=PROJECT))
+        entity.update(data)
+        return entity
+
+    def entity_exists(self, kind: str, entity_id: int, parent=None) -> bool:
+        self.rpc()
+        with self._lock:
+            return self.key(kind, entity_id, parent).flat_path in self._entities
+
+    def get_entity_by_id(self, kind: str, entity_id: int, parent=None) -> Optional[Any]:
+        self.rpc()
+        with self._lock:
+            return self._entities.get(self.key(kind, entity_id, parent).flat_path)
+
+    def put_entity_by_id(self, kind: str, entity_id: int, data: dict, parent=None) -> Any:
+        entity = datastore.Entity(key=self.key(kind, entity_id, parent))
+        entity.update(data)
+        with self._lock:
+            self._entities[entity.key.flat_path] = entity
+            for property_name, value in data.items():
+                self._by_property[(kind, property_name, value)] = entity.key
+        return entity
+
+    def query_entities(self, kind: str, filters, projection=None, order=None, ancestor=None) -> List[Any]:
+        self.rpc()
+        return []
+
+    def find_entity_key(self, kind: str, property_name: str, property_value: Any) -> Optional[Any]:
+        self.rpc()
+        with self._lock:
+            return self._by_property.get((kind, property_name, property_value))
+
+    def allocate_ids(self, kind: str, count: int) -> List[int]:
+        self.rpc()
+        with self._lock:
+            return [next(self._ids) for _ in range(count)]
+
+    def run_in_transaction(self, operation: Callable[[], Any]) -> Any:
+        result = operation()
+        self.rpc()  # commit
+        return result
+
+    def seed_worker(self, worker_id: int) -> None:
+        self.put_entity_by_id("Worker", worker_id, {"name": f"Worker {worker_id}"})
+
+    def patches(self) -> ExitStack:
+        stack = ExitStack()
+        for name in ("get_entity", "get_entity_projection", "put_entity", "entity_exists", "get_entity_by_id", "put_entity_by_id",
+                     "query_entities", "find_entity_key", "allocate_ids", "run_in_transaction"):
+            stack.enter_context(patch(f"app.crud.{name}", getattr(self, name)))
+            stack.enter_context(patch(f"app.db.{name}", getattr(self, name)))
+        return stack
+
+
+def percentiles(samples: List[float]) -> dict:
+    values = np.array(samples) * 1000
+    return {"p50_ms": round(float(np.percentile(values, 50)), 2), "p99_ms": round(float(np.percentile(values, 99)), 2)}
+
+
+async def measure(requests: int, concurrency: int, call: Callable[[int], Any]) -> List[float]:
+    latencies: List[float] = []
+    numbers = iter(range(requests))
+
+    async def client() -> None:
+        for number in numbers:
+            started = time.perf_counter()
+            await call(number)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies
+
+
+def shift_times(number: int) -> Tuple[str, str]:
+    # One hour slots that never overlap, so every create succeeds.
+    start = 1_700_000_000 + number * 7200
+    return (
+        time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(start)),
+        time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(start + 3600)),
+    )
+
+
+async def run(args: argparse.Namespace) -> None:
+    configure_threadpool(args.threadpool)
+    store = SlowStore(args.latency_ms / 1000)
+    store.seed_worker(1)
+
+    async def sync_create(number: int) -> dict:
+        return await to_thread.run_sync(crud.create_shift, 1, *shift_times(number))
+
+    async def async_create(number: int) -> dict:
+        return await async_crud.create_shift(1, *shift_times(args.requests + number))
+
+    created: List[int] = []
+
+    async def sync_get(number: int) -> dict:
+        return await to_thread.run_sync(crud.get_shift, created[number % len(created)])
+
+    async def async_get(number: int) -> dict:
+        return await async_crud.get_shift(created[number % len(created)])
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent clients, "
+          f"{args.latency_ms} ms per RPC, threadpool of {args.threadpool}, settings TTL {args.settings_ttl} s")
+    with store.patches(), patch("app.crud.SHIFT_INDEX_ENABLED", False), patch("app.crud._settings_cache.ttl_seconds", args.settings_ttl):
+        for operation, sync_call, async_call in (
+            ("create_shift", sync_create, async_create),
+            ("get_shift", sync_get, async_get),
+        ):
+            if operation == "get_shift":
+                created.extend(entity.key.id for entity in store._entities.values() if entity.kind == "Shift")
+            crud._settings_cache.invalidate()
+            before = percentiles(await measure(args.requests, args.concurrency, sync_call))
+            crud._settings_cache.invalidate()
+            after = percentiles(await measure(args.requests, args.concurrency, async_call))
+            print(f"{operation:>13}  sync  p50 {before['p50_ms']:8.2f} ms  p99 {before['p99_ms']:8.2f} ms")
+            print(f"{operation:>13}  async p50 {after['p50_ms']:8.2f} ms  p99 {after['p99_ms']:8.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--threadpool", type=int, default=40)
+    parser.add_argument("--settings-ttl", type=float, default=30.0, help="Settings cache TTL; 0 reads the timezone on every request")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
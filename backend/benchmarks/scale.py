@@ -0,0 +1,245 @@
+"""Throughput, p50/p95/p99 latency and peak memory of the shift hot paths.
+
+Each scale seeds a fresh local store (see STORAGE_BACKEND) with synthetic
+workers and shifts: every worker has a home timezone and a history of one
+shift a day on most days, starting at a local morning hour, so shifts cross
+UTC midnight and DST changes the way real rosters do. The crud functions are
+then called directly and the endpoints through TestClient, and the results
+are written to a JSON file that can be diffed across commits.
+
+Peak memory is measured with tracemalloc in a separate, shorter pass so the
+latency numbers are not slowed down by allocation tracing.
+
+Run from backend/:
+
+    uv run python -m benchmarks.scale --scales 10000 100000 1000000 --output bench.json
+    uv run python -m benchmarks.scale --backend sqlite --scales 100000
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app import crud, db
+from app.main import app
+from app.tzconvert import get_zone
+
+PROJECT = "benchmark"
+TIMEZONE = "America/New_York"
+ZONES = ["America/New_York", "America/Los_Angeles", "Europe/London", "Asia/Manila", "Australia/Sydney"]
+SHIFTS_PER_WORKER = 250
+HISTORY_START = date(2022, 1, 1)
+PAGE_SIZE = 100
+
+
+def create_storage(backend: str, directory: str) -> Any:
+    if backend == "sqlite":
+        from app.storage_sqlite import SqliteStorage
+        return SqliteStorage(PROJECT, os.path.join(directory, f"scale-{time.time_ns()}.db"))
+    return db.create_storage(backend)
+
+
+def worker_history(rng: random.Random, worker_id: int, count: int) -> List[Tuple[datetime, datetime]]:
+    zone = get_zone(ZONES[worker_id % len(ZONES)])
+    day = HISTORY_START + timedelta(days=rng.randrange(365))
+    shifts = []
+    while len(shifts) < count:
+        if rng.random() < 0.75:
+            start = datetime(day.year, day.month, day.day, rng.randrange(5, 15), rng.choice((0, 15, 30, 45)), tzinfo=zone)
+            end = start + timedelta(hours=rng.randrange(4, 11), minutes=rng.choice((0, 30)))
+            shifts.append((start.astimezone(timezone.utc), end.astimezone(timezone.utc)))
+        day += timedelta(days=1)
+    return shifts
+
+
+def seed(scale: int, rng: random.Random) -> Dict[int, List[Tuple[int, datetime, datetime]]]:
+    # Written straight through db in write-sized batches; going through
+    # create_shift would make seeding 1M shifts the slowest part of the run.
+    worker_count = max(1, scale // SHIFTS_PER_WORKER)
+    worker_ids = db.allocate_ids("Worker", worker_count)
+    db.put_entities_by_ids("Worker", [(worker_id, {"name": f"Worker {worker_id}"}) for worker_id in worker_ids])
+    shift_ids = iter(db.allocate_ids("Shift", scale))
+    histories = {}
+    remaining = scale
+    for position, worker_id in enumerate(worker_ids):
+        count = remaining // (worker_count - position)
+        remaining -= count
+        histories[worker_id] = [(next(shift_ids), start, end) for start, end in worker_history(rng, worker_id, count)]
+        items = [
+            (crud.worker_parent(worker_id), shift_id, crud.shift_data(worker_id, shift_id, start, end))
+            for shift_id, start, end in histories[worker_id]
+        ]
+        db.put_entities_with_parents("Shift", items, exclude_from_indexes=crud.SHIFT_UNINDEXED_PROPERTIES)
+    crud.update_timezone_setting(TIMEZONE)
+    return histories
+
+
+def summarize(samples: List[float], elapsed: float) -> dict:
+    latencies = np.array(samples) * 1000
+    return {
+        "iterations": len(samples),
+        "throughput_per_s": round(len(samples) / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+    }
+
+
+def measure(operation: Callable[[int], Any], iterations: int, max_seconds: float) -> dict:
+    samples = []
+    started = time.perf_counter()
+    for number in range(iterations):
+        call_started = time.perf_counter()
+        operation(number)
+        samples.append(time.perf_counter() - call_started)
+        if time.perf_counter() - started > max_seconds:
+            break
+    result = summarize(samples, time.perf_counter() - started)
+    tracemalloc.start()
+    for number in range(min(len(samples), 20)):
+        operation(iterations + number)
+    result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result
+
+
+def cases(histories: Dict[int, List[Tuple[int, datetime, datetime]]], client: TestClient, rng: random.Random) -> List[Tuple[str, str, Callable[[int], Any]]]:
+    worker_ids = list(histories)
+    shifts = [shift for history in histories.values() for shift in history]
+    shift_workers = {shift_id: worker_id for worker_id, history in histories.items() for shift_id, _, _ in history}
+    picks = [rng.randrange(len(shifts)) for _ in range(1000)]
+    worker_picks = [rng.choice(worker_ids) for _ in range(1000)]
+    # Each new shift goes after the end of its worker's history, one day apart.
+    next_slot = {worker_id: max(end for _, _, end in history) + timedelta(days=1) for worker_id, history in histories.items()}
+
+    def pick_shift(number: int) -> Tuple[int, datetime, datetime]:
+        return shifts[picks[number % len(picks)]]
+
+    def pick_worker(number: int) -> int:
+        return worker_picks[number % len(worker_picks)]
+
+    def week_around(number: int) -> Tuple[str, str]:
+        _, start, _ = pick_shift(number)
+        return (start - timedelta(days=3)).isoformat(), (start + timedelta(days=4)).isoformat()
+
+    # A year of history, the span the hours report is sized for.
+    report_range = (HISTORY_START.isoformat(), (HISTORY_START + timedelta(days=365)).isoformat())
+
+    def coverage_week(number: int) -> Tuple[str, str]:
+        _, start, _ = pick_shift(number)
+        day = start.date() - timedelta(days=3)
+        return day.isoformat(), (day + timedelta(days=7)).isoformat()
+
+    def new_slot(number: int) -> Tuple[int, str, str]:
+        worker_id = pick_worker(number)
+        start = next_slot[worker_id]
+        next_slot[worker_id] = start + timedelta(days=1)
+        return worker_id, start.isoformat(), (start + timedelta(hours=8)).isoformat()
+
+    def overlap(number: int) -> bool:
+        shift_id, start, end = pick_shift(number)
+        worker_id = shift_workers[shift_id]
+        return crud.precheck_shift_overlap(worker_id, start + timedelta(hours=1), end + timedelta(hours=1), exclude_shift_id=shift_id)
+
+    def get(path: str, **params: Any) -> None:
+        response = client.get(path, params=params)
+        assert response.status_code == 200, response.text
+
+    def post(path: str, body: dict) -> None:
+        response = client.post(path, json=body)
+        assert response.status_code == 201, response.text
+
+    return [
+        ("crud", "list_shifts_page", lambda number: crud.list_shifts_page(PAGE_SIZE)),
+        ("crud", "list_shifts_page_range", lambda number: crud.list_shifts_page(PAGE_SIZE, None, *week_around(number))),
+        ("crud", "list_shifts_worker", lambda number: crud.list_shifts(worker_id=pick_worker(number))),
+        ("crud", "precheck_shift_overlap", overlap),
+        ("crud", "hours_report_week", lambda number: crud.hours_report(*report_range, "week")),
+        ("crud", "coverage_report_week", lambda number: crud.coverage_report(*coverage_week(number), 15)),
+        ("crud", "get_shift", lambda number: crud.get_shift(pick_shift(number)[0])),
+        ("crud", "create_shift", lambda number: crud.create_shift(*new_slot(number))),
+        ("api", "GET /shifts", lambda number: get("/shifts", limit=PAGE_SIZE)),
+        ("api", "GET /shifts?from&to", lambda number: get("/shifts", limit=PAGE_SIZE, **dict(zip(("from", "to"), week_around(number))))),
+        ("api", "GET /workers/{id}/shifts", lambda number: get(f"/workers/{pick_worker(number)}/shifts", limit=PAGE_SIZE)),
+        ("api", "GET /reports/hours", lambda number: get("/reports/hours", granularity="day", **dict(zip(("from", "to"), report_range)))),
+        ("api", "GET /reports/coverage", lambda number: get("/reports/coverage", bucket="15m", **dict(zip(("from", "to"), coverage_week(number))))),
+        ("api", "GET /shifts/{id}", lambda number: get(f"/shifts/{pick_shift(number)[0]}")),
+        ("api", "POST /shifts", lambda number: post("/shifts", dict(zip(("worker_id", "start", "end"), new_slot(number))))),
+    ]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scale(scale: int, args: argparse.Namespace, directory: str) -> dict:
+    rng = random.Random(args.seed)
+    db.set_storage(create_storage(args.backend, directory))
+    crud._shift_index.clear()
+    crud._settings_cache.invalidate()
+    crud._data_versions.invalidate()
+
+    started = time.perf_counter()
+    histories = seed(scale, rng)
+    seeded = {"shifts": scale, "workers": len(histories), "seconds": round(time.perf_counter() - started, 2)}
+    print(f"seeded {scale} shifts for {len(histories)} workers in {seeded['seconds']} s")
+
+    results = []
+    with TestClient(app) as client:
+        for target, operation, call in cases(histories, client, rng):
+            result = {"target": target, "operation": operation, **measure(call, args.iterations, args.max_seconds)}
+            results.append(result)
+            print(f"{scale:>8} {target:>4} {operation:<26} {result['throughput_per_s']:>10.1f}/s "
+                  f"p50 {result['p50_ms']:9.3f} p95 {result['p95_ms']:9.3f} p99 {result['p99_ms']:9.3f} ms "
+                  f"peak {result['peak_memory_bytes'] / 1e6:8.2f} MB")
+    db.set_storage(None)
+    return {"scale": scale, "seed": seeded, "results": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--backend", choices=["memory", "sqlite", "datastore"], default="memory")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--max-seconds", type=float, default=10.0, help="Stop an operation early once it has run this long")
+    parser.add_argument("--seed", type=int, default=20240210)
+    parser.add_argument("--output", default="benchmark-results.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        scales = [run_scale(scale, args, directory) for scale in args.scales]
+
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "backend": args.backend,
+        "iterations": args.iterations,
+        "seed": args.seed,
+        # ru_maxrss is in kilobytes on Linux.
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "scales": scales,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Time spent turning a list of shift records into the GET /shifts body.
+
+"model" is what FastAPI does for a route with response_model=ShiftPage:
+validate every record into ShiftResponse (parsing both ISO strings again for
+duration_hours) and dump the model to JSON. "fast" is the path the list
+endpoints take now: records already carry duration_hours and are encoded
+directly. Both produce the same bytes, which is checked before timing.
+
+Run from backend/:
+
+    uv run python -m benchmarks.serialization --sizes 100 500 10000
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List
+
+import numpy as np
+from fastapi.routing import APIRoute
+from google.cloud import datastore
+
+from app import crud
+from app.main import app, page_response
+
+TIMEZONE = "America/New_York"
+
+
+def make_entities(count: int) -> List[datastore.Entity]:
+    start = datetime(2024, 1, 1, 8, tzinfo=timezone.utc)
+    entities = []
+    for shift_id in range(1, count + 1):
+        entity = datastore.Entity(key=datastore.Key("Worker", shift_id % 50 + 1, "Shift", shift_id, project="benchmark"))
+        shift_start = start + timedelta(hours=7 * shift_id)
+        entity.update({
+            "worker_id": shift_id % 50 + 1,
+            "start_utc": shift_start,
+            "end_utc": shift_start + timedelta(hours=4 + shift_id % 8, minutes=15 * (shift_id % 4)),
+        })
+        entities.append(entity)
+    return entities
+
+
+def model_body(field, records: List[dict]) -> bytes:
+    # The steps fastapi.routing.serialize_response takes for a response_model.
+    value, errors = field.validate({"items": records, "next_cursor": None}, {}, loc=("response",))
+    assert not errors
+    return field.serialize_json(value)
+
+
+def timed(function: Callable[[], bytes], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    field = next(route.response_field for route in app.routes if isinstance(route, APIRoute) and route.path == "/shifts")
+    print(f"{'records':>8} {'model p50 ms':>13} {'fast p50 ms':>12} {'speedup':>8}")
+    for size in args.sizes:
+        items = crud.shifts_to_dicts(make_entities(size), TIMEZONE)
+        # The records the endpoints returned before, without duration_hours.
+        records = [{key: value for key, value in item.items() if key != "duration_hours"} for item in items]
+        encode_model = lambda: model_body(field, records)
+        encode_fast = lambda: page_response(items, None, '"etag"').body
+        assert encode_model() == encode_fast(), "fast path changed the response body"
+        model = np.median(timed(encode_model, args.repeat)) * 1000
+        fast = np.median(timed(encode_fast, args.repeat)) * 1000
+        print(f"{size:>8} {model:>13.2f} {fast:>12.2f} {model / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import pytest
+from unittest.mock import patch
+
+from app import crud
+
+
+@pytest.fixture(autouse=True)
+def reset_shift_index():
+    crud._shift_index.clear()
+    yield
+    crud._shift_index.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_settings_cache():
+    crud._settings_cache.invalidate()
+    crud._settings_cache.reset_stats()
+    yield
+    crud._settings_cache.invalidate()
+
+
+@pytest.fixture(autouse=True)
+def data_versions():
+    # Data versions live in Datastore; tests keep them in a dict starting from
+    # version 0 and get the save mock to assert which kinds a write bumped.
+    crud._data_versions.invalidate()
+    stored = {}
+
+    def load_data_version(kind):
+        version = stored.get(kind)
+        return (0, None) if version is None else (version, version)
+
+    with patch("app.crud.load_data_version", side_effect=load_data_version), patch("app.crud.save_data_version", side_effect=stored.__setitem__) as save_data_version:
+        yield save_data_version
+    crud._data_versions.invalidate()
@@ -0,0 +1,157 @@
+import threading
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+def make_shift_entity(shift_id, worker_id, start_utc, end_utc):
+    entity = MagicMock()
+    entity.key.id = shift_id
+    entity.__getitem__ = lambda self, key: {
+        "worker_id": worker_id,
+        "start_utc": start_utc,
+        "end_utc": end_utc
+    }[key]
+    return entity
+
+
+def concurrent(barrier, result):
+    # Each call blocks until all parties arrive, so the test only passes if
+    # the calls are in flight at the same time.
+    def call(*args, **kwargs):
+        barrier.wait(timeout=5)
+        return result
+    return call
+
+
+@pytest.mark.asyncio
+@patch("app.crud.write_new_shift")
+@patch("app.crud.get_timezone_setting")
+@patch("app.db.allocate_ids")
+@patch("app.crud.precheck_shift_overlap")
+async def test_create_shift_runs_independent_rpcs_concurrently(mock_precheck, mock_allocate_ids, mock_get_tz, mock_write):
+    from app.async_crud import create_shift
+
+    barrier = threading.Barrier(3)
+    mock_precheck.side_effect = concurrent(barrier, False)
+    mock_allocate_ids.side_effect = concurrent(barrier, [7])
+    mock_get_tz.side_effect = concurrent(barrier, "UTC")
+    mock_write.return_value = make_shift_entity(
+        7, 1, datetime(2024, 2, 10, 9, tzinfo=timezone.utc), datetime(2024, 2, 10, 17, tzinfo=timezone.utc)
+    )
+
+    shift = await create_shift(1, "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00")
+
+    assert shift == {"id": 7, "worker_id": 1, "start": "2024-02-10T09:00:00+00:00", "end": "2024-02-10T17:00:00+00:00", "duration_hours": 8.0}
+    mock_write.assert_called_once_with(
+        1, 7, datetime(2024, 2, 10, 9, tzinfo=timezone.utc), datetime(2024, 2, 10, 17, tzinfo=timezone.utc)
+    )
+
+
+@pytest.mark.asyncio
+@patch("app.crud.write_new_shift")
+@patch("app.crud.reject_precheck_overlap")
+@patch("app.crud.get_timezone_setting")
+@patch("app.db.allocate_ids")
+@patch("app.crud.precheck_shift_overlap")
+async def test_create_shift_precheck_overlap(mock_precheck, mock_allocate_ids, mock_get_tz, mock_reject, mock_write):
+    from app.async_crud import create_shift
+
+    mock_precheck.return_value = True
+    mock_allocate_ids.return_value = [7]
+    mock_get_tz.return_value = "UTC"
+    mock_reject.side_effect = ValueError("Shift overlaps with existing shift for this worker")
+
+    with pytest.raises(ValueError, match="overlaps"):
+        await create_shift(1, "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00")
+    mock_write.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("app.db.get_entity_by_id")
+@patch("app.crud.get_timezone_setting")
+@patch("app.crud.locate_shift")
+async def test_get_shift_reads_settings_while_locating(mock_locate, mock_get_tz, mock_get_entity):
+    from app.async_crud import get_shift
+
+    barrier = threading.Barrier(2)
+    mock_locate.side_effect = concurrent(barrier, (True, ("Worker", 1)))
+    mock_get_tz.side_effect = concurrent(barrier, "America/New_York")
+    mock_get_entity.return_value = make_shift_entity(
+        5, 1, datetime(2024, 2, 10, 14, tzinfo=timezone.utc), datetime(2024, 2, 10, 22, tzinfo=timezone.utc)
+    )
+
+    shift = await get_shift(5)
+
+    assert shift["start"] == "2024-02-10T09:00:00-05:00"
+    mock_get_entity.assert_called_once_with("Shift", 5, parent=("Worker", 1))
+
+
+@pytest.mark.asyncio
+@patch("app.async_crud.run_sync")
+async def test_cached_timezone_setting_skips_threadpool(mock_run_sync):
+    from app import crud
+    from app.async_crud import get_timezone_setting
+
+    crud._settings_cache.set("timezone", "Europe/London", 1)
+
+    assert await get_timezone_setting() == "Europe/London"
+    mock_run_sync.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("app.crud.find_shift_entities_page")
+@patch("app.crud.get_timezone_setting")
+async def test_list_shifts_page_resolves_naive_range_in_configured_timezone(mock_get_tz, mock_find_page):
+    from app.async_crud import list_shifts_page
+
+    mock_get_tz.return_value = "America/New_York"
+    mock_find_page.return_value = ([], None)
+
+    assert await list_shifts_page(10, None, "2024-02-10T00:00:00", "2024-02-11T00:00:00", 3) == ([], None)
+    mock_find_page.assert_called_once_with(
+        10, None, datetime(2024, 2, 10, 5, tzinfo=timezone.utc), datetime(2024, 2, 11, 5, tzinfo=timezone.utc), 3
+    )
+
+
+@pytest.mark.asyncio
+@patch("app.crud.update_worker")
+@patch("app.crud.create_worker")
+async def test_worker_writes_delegate_to_crud(mock_create_worker, mock_update_worker):
+    from app.async_crud import create_worker, update_worker
+
+    mock_create_worker.return_value = {"id": 1, "name": "Alice"}
+    mock_update_worker.return_value = None
+
+    assert await create_worker("Alice") == {"id": 1, "name": "Alice"}
+    assert await update_worker(2, "Bob") is None
+    mock_create_worker.assert_called_once_with("Alice")
+    mock_update_worker.assert_called_once_with(2, "Bob")
+
+
+@pytest.mark.asyncio
+@patch("app.crud.shifts_to_dicts")
+@patch("app.crud.find_shift_entities_page")
+@patch("app.crud.get_timezone_setting")
+async def test_list_shifts_page_converts_off_the_event_loop(mock_get_tz, mock_find_page, mock_shifts_to_dicts):
+    from app.async_crud import list_shifts_page
+
+    loop_thread = threading.get_ident()
+    mock_get_tz.return_value = "UTC"
+    mock_find_page.return_value = ([], "next")
+    mock_shifts_to_dicts.side_effect = lambda entities, timezone_setting: [threading.get_ident()]
+
+    converted_on, next_cursor = await list_shifts_page(10)
+    assert converted_on != [loop_thread]
+    assert next_cursor == "next"
+
+
+def test_configure_threadpool():
+    from anyio import to_thread
+    from anyio.from_thread import start_blocking_portal
+    from app.async_db import configure_threadpool
+
+    with start_blocking_portal() as portal:
+        portal.call(configure_threadpool, 8)
+        assert portal.call(lambda: to_thread.current_default_thread_limiter().total_tokens) == 8
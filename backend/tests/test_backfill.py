@@ -0,0 +1,100 @@
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pytest
+from google.cloud import datastore
+
+
+def shift_entity(shift_id, **data):
+    entity = datastore.Entity(key=datastore.Key("Worker", 1, "Shift", shift_id, project="test"))
+    entity.update({
+        "worker_id": 1,
+        "shift_id": shift_id,
+        "start_utc": datetime(2024, 2, 10, 9, 0, tzinfo=timezone.utc),
+        "end_utc": datetime(2024, 2, 10, 17, 30, 0, 500000, tzinfo=timezone.utc),
+    })
+    entity.update(data)
+    return entity
+
+
+def _run_operation(operation):
+    return operation()
+
+
+@patch("app.crud.put_entities")
+@patch("app.crud.get_entities_by_keys")
+@patch("app.crud.run_in_transaction", side_effect=_run_operation)
+def test_backfill_batch_rewrites_only_stale_shifts(mock_run_in_transaction, mock_get_entities, mock_put_entities):
+    from app.crud import backfill_shift_time_fields
+
+    current = shift_entity(2, duration_seconds=30600.5)
+    stale = shift_entity(1)
+    mock_get_entities.return_value = [stale, current]
+
+    assert backfill_shift_time_fields([stale.key, current.key]) == 1
+    mock_run_in_transaction.assert_called_once()
+    mock_put_entities.assert_called_once_with([stale])
+    assert stale["duration_seconds"] == 30600.5
+    assert "duration_seconds" in stale.exclude_from_indexes
+
+
+@patch("app.backfill_shift_fields.backfill_shift_time_fields")
+@patch("app.backfill_shift_fields.list_keys_page")
+@patch("app.backfill_shift_fields.put_entity")
+@patch("app.backfill_shift_fields.get_entity")
+def test_backfill_checkpoints_cursor_in_key_order(mock_get_entity, mock_put_entity, mock_list_keys_page, mock_backfill_batch):
+    from app.backfill_shift_fields import backfill_shifts
+
+    mock_get_entity.return_value = None
+    mock_list_keys_page.side_effect = [(["k1", "k2"], "c1"), (["k3", "k4"], "c2"), (["k5"], None)]
+    mock_backfill_batch.side_effect = lambda keys: len(keys) - 1
+
+    events = list(backfill_shifts(batch_size=2, max_in_flight=2))
+
+    assert [event["cursor"] for event in events] == ["c1", "c2", None, None]
+    assert events[-1] == {"status": "completed", "cursor": None, "scanned": 5, "updated": 2}
+    assert [call.args[2] for call in mock_list_keys_page.call_args_list] == [None, "c1", "c2"]
+    assert mock_put_entity.call_args.args[:2] == ("Backfill", "shift_time_fields")
+
+
+@patch("app.backfill_shift_fields.backfill_shift_time_fields")
+@patch("app.backfill_shift_fields.list_keys_page")
+@patch("app.backfill_shift_fields.put_entity")
+@patch("app.backfill_shift_fields.get_entity")
+def test_backfill_resumes_from_saved_cursor(mock_get_entity, mock_put_entity, mock_list_keys_page, mock_backfill_batch):
+    from app.backfill_shift_fields import backfill_shifts
+
+    mock_get_entity.return_value = {"status": "failed", "cursor": "c1", "scanned": 2, "updated": 2}
+    mock_list_keys_page.side_effect = [(["k3"], None)]
+    mock_backfill_batch.return_value = 1
+
+    events = list(backfill_shifts(batch_size=2, max_in_flight=1))
+
+    mock_list_keys_page.assert_called_once_with("Shift", 2, "c1")
+    assert events[-1] == {"status": "completed", "cursor": None, "scanned": 3, "updated": 3}
+
+
+@patch("app.backfill_shift_fields.backfill_shift_time_fields")
+@patch("app.backfill_shift_fields.list_keys_page")
+@patch("app.backfill_shift_fields.put_entity")
+@patch("app.backfill_shift_fields.get_entity")
+def test_backfill_failure_keeps_last_committed_cursor(mock_get_entity, mock_put_entity, mock_list_keys_page, mock_backfill_batch):
+    from app.backfill_shift_fields import backfill_shifts
+
+    mock_get_entity.return_value = None
+    mock_list_keys_page.side_effect = [(["k1"], "c1"), (["k2"], "c2")]
+
+    def rewrite(keys):
+        if keys == ["k2"]:
+            raise RuntimeError("datastore unavailable")
+        return 1
+
+    mock_backfill_batch.side_effect = rewrite
+
+    with pytest.raises(RuntimeError):
+        list(backfill_shifts(batch_size=1, max_in_flight=1))
+
+    saved = mock_put_entity.call_args.args[2]
+    assert saved["status"] == "failed"
+    assert saved["cursor"] == "c1"
+    assert saved["scanned"] == 1
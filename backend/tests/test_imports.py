@@ -0,0 +1,298 @@
+import io
+import json
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def memory_storage():
+    from app import db
+    from app.storage_memory import MemoryStorage
+
+    db.set_storage(MemoryStorage("test"))
+    yield
+    db.set_storage(None)
+
+
+def csv_stream(text):
+    return io.BytesIO(text.encode("utf-8"))
+
+
+def utc(day, hour):
+    return datetime(2024, 2, day, hour, tzinfo=timezone.utc)
+
+
+def write_all(worker_id, rows):
+    return len(rows), []
+
+
+def stored_shift(start_utc, end_utc):
+    entity = MagicMock()
+    entity.__getitem__ = lambda self, key: {"start_utc": start_utc, "end_utc": end_utc}[key]
+    return entity
+
+
+SHIFTS_CSV = """worker_id,start,end
+1,2024-02-10T09:00:00+00:00,2024-02-10T17:00:00+00:00
+1,2024-02-10T09:00:00+00:00,2024-02-10T17:00:00+00:00
+1,2024-02-10T16:00:00+00:00,2024-02-10T20:00:00+00:00
+1,2024-02-11T08:00:00+00:00,2024-02-11T21:00:00+00:00
+2,2024-02-10T09:00:00+00:00,2024-02-10T17:00:00+00:00
+3,2024-02-10T09:00:00+00:00,2024-02-10T17:00:00+00:00
+1,2024-02-12T09:00:00+00:00,2024-02-12T17:00:00+00:00
+1,not-a-date,2024-02-12T17:00:00+00:00
+"""
+
+
+@patch("app.importer.put_entity")
+@patch("app.importer.write_worker_shifts")
+@patch("app.importer.allocate_ids")
+@patch("app.importer.find_overlap_candidates")
+@patch("app.importer.get_entities_by_ids")
+@patch("app.importer.get_entity")
+def test_import_shifts_validates_and_dedupes(mock_get_job, mock_get_workers, mock_find_overlaps, mock_allocate_ids, mock_put_shifts, mock_put_checkpoint):
+    from app.importer import start_import
+
+    mock_get_job.return_value = None
+    mock_get_workers.side_effect = lambda kind, ids: {worker_id: MagicMock() for worker_id in ids if worker_id in (1, 2)}
+    # Worker 1 already has the 12 February shift from an earlier run.
+    mock_find_overlaps.side_effect = lambda worker_id, start, end: [stored_shift(utc(12, 9), utc(12, 17))] if worker_id == 1 else []
+    mock_allocate_ids.side_effect = lambda kind, count: list(range(100, 100 + count))
+    mock_put_shifts.side_effect = write_all
+
+    events = list(start_import("shifts", csv_stream(SHIFTS_CSV), job_id="job-1"))
+
+    summary = events[-1]
+    assert summary["status"] == "completed"
+    assert (summary["rows_read"], summary["rows_committed"]) == (8, 8)
+    assert (summary["created"], summary["duplicates"], summary["failed"]) == (2, 2, 4)
+    assert summary["errors"] == [
+        {"row": 3, "error": "Shift overlaps with existing shift for this worker"},
+        {"row": 4, "error": "Shift duration cannot exceed 12 hours"},
+        {"row": 6, "error": "Worker not found"},
+        {"row": 8, "error": "Invalid ISO 8601 datetime format: not-a-date"},
+    ]
+    written = [(call.args[0], [(shift_id, start_utc) for shift_id, start_utc, _, _ in call.args[1]]) for call in mock_put_shifts.call_args_list]
+    assert written == [(1, [(100, utc(10, 9))]), (2, [(101, utc(10, 9))])]
+    assert mock_put_checkpoint.call_args.args[:2] == ("ImportJob", "job-1")
+
+
+@patch("app.importer.put_entity")
+@patch("app.importer.write_worker_shifts")
+@patch("app.importer.allocate_ids")
+@patch("app.importer.find_overlap_candidates")
+@patch("app.importer.get_entities_by_ids")
+def test_import_shifts_checks_rows_still_in_flight(mock_get_workers, mock_find_overlaps, mock_allocate_ids, mock_put_shifts, mock_put_checkpoint):
+    from app.importer import start_import
+
+    mock_get_workers.return_value = {1: MagicMock()}
+    mock_find_overlaps.return_value = []
+    mock_allocate_ids.side_effect = lambda kind, count: list(range(100, 100 + count))
+    mock_put_shifts.side_effect = write_all
+
+    events = list(start_import("shifts", csv_stream(SHIFTS_CSV.splitlines()[0] + "\n" + "\n".join([SHIFTS_CSV.splitlines()[1]] * 3) + "\n"), chunk_size=1, max_in_flight=3))
+
+    assert (events[-1]["created"], events[-1]["duplicates"]) == (1, 2)
+    assert [event["rows_committed"] for event in events] == [1, 2, 3, 3]
+
+
+@patch("app.importer.put_entity")
+@patch("app.importer.write_worker_shifts")
+@patch("app.importer.allocate_ids")
+@patch("app.importer.find_overlap_candidates")
+@patch("app.importer.get_entities_by_ids")
+@patch("app.importer.get_entity")
+def test_import_resumes_from_checkpoint(mock_get_job, mock_get_workers, mock_find_overlaps, mock_allocate_ids, mock_put_shifts, mock_put_checkpoint):
+    from app.importer import start_import
+
+    job = {"kind": "shifts", "status": "failed", "rows_read": 7, "rows_committed": 6, "created": 2, "duplicates": 1, "failed": 3, "errors_json": "[]"}
+    mock_get_job.return_value = MagicMock(**{"__getitem__.side_effect": job.__getitem__, "get.side_effect": job.get})
+    mock_get_workers.return_value = {1: MagicMock()}
+    mock_find_overlaps.return_value = []
+    mock_allocate_ids.side_effect = lambda kind, count: list(range(100, 100 + count))
+    mock_put_shifts.side_effect = write_all
+
+    events = list(start_import("shifts", csv_stream(SHIFTS_CSV), job_id="job-1"))
+
+    assert events[-1]["rows_committed"] == 8
+    assert (events[-1]["created"], events[-1]["failed"]) == (3, 4)
+    assert len(mock_put_shifts.call_args.args[1]) == 1
+
+
+@patch("app.importer.put_entity")
+@patch("app.importer.write_worker_shifts")
+@patch("app.importer.allocate_ids")
+@patch("app.importer.find_overlap_candidates")
+@patch("app.importer.get_entities_by_ids")
+@patch("app.importer.get_entity")
+def test_import_checkpoint_stops_at_failed_chunk(mock_get_job, mock_get_workers, mock_find_overlaps, mock_allocate_ids, mock_put_shifts, mock_put_checkpoint):
+    from app.importer import start_import
+
+    mock_get_job.return_value = None
+    mock_get_workers.return_value = {1: MagicMock()}
+    mock_find_overlaps.return_value = []
+    mock_allocate_ids.side_effect = lambda kind, count: list(range(100, 100 + count))
+
+    def put_shifts(worker_id, rows):
+        if rows[0][1].day == 11:
+            raise RuntimeError("datastore unavailable")
+        return len(rows), []
+
+    mock_put_shifts.side_effect = put_shifts
+    text = "worker_id,start,end\n" + "".join(
+        f"1,2024-02-{day}T09:00:00+00:00,2024-02-{day}T17:00:00+00:00\n" for day in (10, 11, 12)
+    )
+
+    with pytest.raises(RuntimeError):
+        list(start_import("shifts", csv_stream(text), job_id="job-1", chunk_size=1, max_in_flight=2))
+
+    saved = mock_put_checkpoint.call_args.args[2]
+    assert saved["status"] == "failed"
+    assert saved["rows_committed"] == 1
+
+
+def test_import_workers(memory_storage):
+    from app import crud
+    from app.importer import start_import
+
+    text = "id,name\n5,Alice\n5,Alice\n,Bob\nx,Carol\n6,  \n"
+
+    summary = list(start_import("workers", csv_stream(text)))[-1]
+
+    assert (summary["created"], summary["duplicates"], summary["failed"]) == (2, 1, 2)
+    workers = crud.list_workers()
+    assert [(worker["id"], worker["name"]) for worker in workers][0] == (5, "Alice")
+    assert [worker["name"] for worker in workers] == ["Alice", "Bob"]
+    # IDs given in the file are never handed out again.
+    assert workers[1]["id"] > 5
+
+
+def test_resumed_worker_import_does_not_duplicate_rows_without_ids(memory_storage):
+    from app import crud, db
+    from app.importer import load_import_state, run_import, save_import_state, start_import
+
+    text = "id,name\n,Bob\n7,Carol\n,Dave\n"
+    with patch("app.importer.WorkerImportChunks.finish"):
+        list(start_import("workers", csv_stream(text), job_id="job-1", chunk_size=2))
+    assert len(crud.list_workers()) == 3
+
+    # The job crashed after writing its rows but before the checkpoint moved.
+    state = load_import_state("job-1")
+    state.update({"status": "failed", "rows_committed": 0, "created": 0})
+    save_import_state(state)
+    summary = list(start_import("workers", csv_stream(text), job_id="job-1", chunk_size=2))[-1]
+
+    assert (summary["created"], summary["duplicates"], summary["failed"]) == (0, 3, 0)
+    assert sorted(worker["name"] for worker in crud.list_workers()) == ["Bob", "Carol", "Dave"]
+    # Once the job completes, the IDs it recorded for its rows are deleted.
+    assert db.query_keys("ImportRow", [("job_id", "=", "job-1")]) == []
+
+    # Another job is a new import, so its rows without IDs are new workers.
+    list(start_import("workers", csv_stream(text), job_id="job-2"))
+    assert sorted(worker["name"] for worker in crud.list_workers()) == ["Bob", "Bob", "Carol", "Dave", "Dave"]
+
+
+def test_import_reports_ids_taken_by_other_workers(memory_storage):
+    from app import crud
+    from app.importer import start_import
+
+    alice = crud.create_worker("Alice")
+
+    summary = list(start_import("workers", csv_stream(f"id,name\n{alice['id']},Mallory\n")))[-1]
+
+    assert (summary["created"], summary["failed"]) == (0, 1)
+    assert summary["errors"] == [{"row": 1, "error": f"Worker {alice['id']} already exists"}]
+    assert crud.get_worker(alice["id"])["name"] == "Alice"
+
+
+def test_import_rechecks_overlaps_where_the_shifts_are_written(memory_storage):
+    from app import crud
+    from app.importer import start_import
+
+    worker = crud.create_worker("Alice")
+    text = f"worker_id,start,end\n{worker['id']},2024-02-10T09:00:00+00:00,2024-02-10T17:00:00+00:00\n{worker['id']},2024-02-11T09:00:00+00:00,2024-02-11T17:00:00+00:00\n"
+    # A concurrent write takes the 10 February slot after the chunk was checked.
+    with patch("app.importer.find_overlap_candidates", return_value=[]):
+        crud.create_shift(worker["id"], "2024-02-10T12:00:00+00:00", "2024-02-10T13:00:00+00:00")
+        summary = list(start_import("shifts", csv_stream(text)))[-1]
+
+    assert (summary["created"], summary["failed"]) == (1, 1)
+    assert summary["errors"] == [{"row": 1, "error": "Shift overlaps with existing shift for this worker"}]
+    assert [shift["start"][:10] for shift in crud.list_shifts(worker_id=worker["id"])] == ["2024-02-10", "2024-02-11"]
+
+
+def test_import_missing_columns():
+    from app.importer import start_import
+
+    with pytest.raises(ValueError, match="missing required columns: end"):
+        start_import("shifts", csv_stream("worker_id,start\n1,2024-02-10T09:00:00+00:00\n"))
+
+
+@patch("app.main.start_import")
+def test_post_import_streams_progress(mock_start_import):
+    events = [
+        {"job_id": "job-1", "kind": "shifts", "status": "running", "rows_committed": 500},
+        {"job_id": "job-1", "kind": "shifts", "status": "completed", "rows_committed": 700, "errors": []},
+    ]
+    uploaded = []
+
+    def start(kind, stream, job_id):
+        uploaded.append(stream.read())
+        return iter(events)
+
+    mock_start_import.side_effect = start
+    response = client.post("/imports/shifts?job_id=job-1", content=b"worker_id,start,end\n", headers={"Content-Type": "text/csv"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == events
+    assert uploaded == [b"worker_id,start,end\n"]
+    assert mock_start_import.call_args.args[2] == "job-1"
+
+
+@patch("app.main.start_import")
+def test_post_import_spools_the_upload_off_the_event_loop(mock_start_import):
+    from app.async_db import run_sync
+
+    mock_start_import.return_value = iter([{"job_id": "job-1", "kind": "shifts", "status": "completed", "errors": []}])
+    with patch("app.main.run_sync", wraps=run_sync) as mock_run_sync:
+        response = client.post("/imports/shifts", content=b"worker_id,start,end\n", headers={"Content-Type": "text/csv"})
+
+    assert response.status_code == 200
+    assert [call.args[0].__name__ for call in mock_run_sync.call_args_list] == ["write", "seek"]
+
+
+def test_post_import_missing_columns():
+    response = client.post("/imports/shifts", content=b"worker_id,start\n", headers={"Content-Type": "text/csv"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "CSV is missing required columns: end"
+
+
+def test_post_import_unknown_kind():
+    response = client.post("/imports/teams", content=b"name\n", headers={"Content-Type": "text/csv"})
+    assert response.status_code == 422
+
+
+@patch("app.main.get_import_job")
+def test_get_import_job(mock_get_import_job):
+    mock_get_import_job.return_value = {
+        "job_id": "job-1", "kind": "workers", "status": "completed", "rows_read": 3, "rows_committed": 3,
+        "created": 2, "duplicates": 1, "failed": 0, "errors": []
+    }
+    response = client.get("/imports/job-1")
+    assert response.status_code == 200
+    assert response.json()["created"] == 2
+
+
+@patch("app.main.get_import_job")
+def test_get_import_job_not_found(mock_get_import_job):
+    mock_get_import_job.return_value = None
+    response = client.get("/imports/missing")
+    assert response.status_code == 404
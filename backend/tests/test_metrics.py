@@ -0,0 +1,111 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+
+client = TestClient(app)
+
+
+def test_metrics_count_requests_by_route_template():
+    from app.metrics import HTTP_REQUEST_SECONDS, HTTP_REQUESTS
+
+    before = HTTP_REQUESTS.value("GET", "/workers/{worker_id}", "404")
+    timed_before = HTTP_REQUEST_SECONDS.count("GET", "/workers/{worker_id}")
+
+    with patch("app.main.get_worker", return_value=None):
+        assert client.get("/workers/7").status_code == 404
+        assert client.get("/workers/8").status_code == 404
+
+    assert HTTP_REQUESTS.value("GET", "/workers/{worker_id}", "404") == before + 2
+    assert HTTP_REQUEST_SECONDS.count("GET", "/workers/{worker_id}") == timed_before + 2
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    client.get("/health")
+    client.get("/no-such-route")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE http_request_duration_seconds histogram" in response.text
+    assert 'http_requests_total{method="GET",route="/health",status="200"}' in response.text
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"}' in response.text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/health",le="+Inf"}' in response.text
+
+
+def test_histogram_renders_cumulative_buckets():
+    from app.metrics import Histogram
+
+    histogram = Histogram("rpc_seconds", "RPC time.", ["operation"], buckets=(0.01, 0.1))
+    for value in (0.005, 0.05, 0.05, 2.0):
+        histogram.observe(value, 'get "x"')
+
+    assert histogram.render()[2:] == [
+        'rpc_seconds_bucket{operation="get \\"x\\"",le="0.01"} 1',
+        'rpc_seconds_bucket{operation="get \\"x\\"",le="0.1"} 3',
+        'rpc_seconds_bucket{operation="get \\"x\\"",le="+Inf"} 4',
+        'rpc_seconds_sum{operation="get \\"x\\""} 2.105',
+        'rpc_seconds_count{operation="get \\"x\\""} 4',
+    ]
+
+
+def test_db_calls_are_recorded_once_by_operation_and_kind():
+    from app import db
+    from app.metrics import DB_RPC_ERRORS, DB_RPC_SECONDS
+    from app.storage_memory import MemoryStorage
+
+    db.set_storage(MemoryStorage("test"))
+    try:
+        exists_before = DB_RPC_SECONDS.count("entity_exists", "Worker")
+        projection_before = DB_RPC_SECONDS.count("query_projection", "Worker")
+        pages_before = DB_RPC_SECONDS.count("iter_entity_pages", "Worker")
+
+        db.put_entities_by_ids("Worker", [(1, {"name": "Alice"}), (2, {"name": "Bob"})])
+        assert db.entity_exists("Worker", 1) is True
+        assert len(list(db.iter_entity_pages("Worker", 1))) == 2
+
+        assert DB_RPC_SECONDS.count("entity_exists", "Worker") == exists_before + 1
+        # query_projection ran inside entity_exists, so it is not counted again.
+        assert DB_RPC_SECONDS.count("query_projection", "Worker") == projection_before
+        assert DB_RPC_SECONDS.count("iter_entity_pages", "Worker") == pages_before + 2
+
+        errors_before = DB_RPC_ERRORS.value("list_entities_page", "Worker")
+        with pytest.raises(ValueError):
+            db.list_entities_page("Worker", 1, "not a cursor!")
+        assert DB_RPC_ERRORS.value("list_entities_page", "Worker") == errors_before + 1
+    finally:
+        db.set_storage(None)
+
+
+def test_request_is_timed_until_its_last_body_chunk_not_its_background_tasks():
+    import asyncio
+
+    from app.metrics import MetricsMiddleware
+
+    calls = []
+
+    async def endpoint(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"a", "more_body": True})
+        calls.append(observe.call_count)
+        await send({"type": "http.response.body", "body": b"b"})
+        calls.append(observe.call_count)
+        # Background tasks run here, after the response is complete.
+        await asyncio.sleep(0.2)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "POST", "path": "/imports", "headers": []}
+    with patch("app.metrics.HTTP_REQUEST_SECONDS.observe") as observe, patch("app.metrics.HTTP_REQUESTS.inc") as inc:
+        asyncio.run(MetricsMiddleware(endpoint)(scope, receive, send))
+
+    assert calls == [0, 1]
+    assert observe.call_count == 1
+    assert observe.call_args.args[0] < 0.2
+    inc.assert_called_once_with("POST", "unmatched", "200")
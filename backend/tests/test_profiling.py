@@ -0,0 +1,105 @@
+import time
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.profiling import ProfilingMiddleware
+
+profiled_app = FastAPI()
+profiled_app.add_middleware(ProfilingMiddleware)
+
+
+def build_rows(count):
+    # Long enough for the stack sampler to see it.
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+    return [{"id": number, "label": f"row {number}"} for number in range(count)]
+
+
+@profiled_app.get("/rows")
+def rows():
+    return build_rows(2000)
+
+
+client = TestClient(profiled_app)
+
+
+def test_profiled_request_stores_call_tree_and_allocations():
+    from app.profiling import get_profile
+
+    response = client.get("/rows", headers={"X-Profile": "1"})
+
+    assert response.status_code == 200
+    assert len(response.json()) == 2000
+    profile = get_profile(response.headers["x-profile-id"])
+    assert profile["request"]["path"] == "/rows"
+    assert profile["request"]["status"] == 200
+    assert profile["samples"] > 0
+    assert any("(build_rows)" in entry["function"] for entry in profile["top_functions"])
+
+    def names(nodes):
+        for node in nodes:
+            yield node["function"]
+            yield from names(node["children"])
+
+    assert any("(build_rows)" in name for name in names(profile["call_tree"]))
+    assert profile["allocations"]["peak_bytes"] > 0
+    assert profile["allocations"]["top_lines"]
+
+
+def test_query_flag_also_profiles_and_plain_requests_are_untouched():
+    assert "x-profile-id" in client.get("/rows?profile=1").headers
+    assert "x-profile-id" not in client.get("/rows").headers
+    assert "x-profile-id" not in client.get("/rows", headers={"X-Profile": "0"}).headers
+
+
+@patch("app.profiling.PROFILING_ADMIN_TOKEN", "s3cret")
+@patch("app.profiling.ENV", "production")
+def test_production_requires_the_admin_token():
+    assert client.get("/rows", headers={"X-Profile": "1"}).status_code == 403
+    assert client.get("/rows", headers={"X-Profile": "1", "X-Admin-Token": "wrong"}).status_code == 403
+    # Unprofiled requests are served as usual.
+    assert client.get("/rows").status_code == 200
+
+    response = client.get("/rows", headers={"X-Profile": "1", "X-Admin-Token": "s3cret"})
+    assert response.status_code == 200
+    assert "x-profile-id" in response.headers
+
+
+@patch("app.profiling.PROFILING_ADMIN_TOKEN", "s3cret")
+@patch("app.profiling.ENV", "production")
+def test_non_ascii_admin_token_is_forbidden():
+    from app.main import app
+
+    assert client.get("/rows", headers={"X-Profile": "1", "X-Admin-Token": "s3crét".encode("utf-8")}).status_code == 403
+    assert client.get("/rows", headers={"X-Profile": "1", "X-Admin-Token": "s3crét".encode("latin-1")}).status_code == 403
+    with patch("app.main.PROFILING_ENABLED", True):
+        response = TestClient(app).get("/debug/profiles/missing", headers={"X-Admin-Token": "s3crét".encode("utf-8")})
+    assert response.status_code == 403
+
+
+@patch("app.profiling.ENV", "production")
+def test_production_without_configured_token_never_profiles():
+    assert client.get("/rows", headers={"X-Profile": "1", "X-Admin-Token": ""}).status_code == 403
+
+
+def test_profiling_middleware_is_not_installed_by_default():
+    from app.main import app
+
+    assert all(middleware.cls is not ProfilingMiddleware for middleware in app.user_middleware)
+
+
+def test_get_profile_endpoint():
+    from app.main import app
+
+    main_client = TestClient(app)
+    profile_id = client.get("/rows", headers={"X-Profile": "1"}).headers["x-profile-id"]
+
+    assert main_client.get(f"/debug/profiles/{profile_id}").status_code == 404
+    with patch("app.main.PROFILING_ENABLED", True):
+        response = main_client.get(f"/debug/profiles/{profile_id}")
+        assert response.status_code == 200
+        assert response.json()["request"]["id"] == profile_id
+        assert main_client.get("/debug/profiles/missing").status_code == 404
@@ -0,0 +1,222 @@
+import random
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.reports import bucket_periods, coverage_slots, headcount_by_slot, hours_by_bucket, next_period
+from app.timezones import get_zone
+from app.tzconvert import EPOCH, ONE_MICROSECOND
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def memory_storage():
+    from app import db
+    from app.storage_memory import MemoryStorage
+
+    db.set_storage(MemoryStorage("test"))
+    yield
+    db.set_storage(None)
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def microseconds(dt):
+    return (dt - EPOCH) // ONE_MICROSECOND
+
+
+def test_day_periods_follow_local_midnights_across_dst():
+    # New York springs forward on 2024-03-10, so that day is 23 hours long.
+    periods, edges = bucket_periods(utc(2024, 3, 9, 5), utc(2024, 3, 12, 4), "day", "America/New_York", 100)
+    assert periods == [date(2024, 3, 9), date(2024, 3, 10), date(2024, 3, 11)]
+    assert edges.tolist() == [microseconds(dt) for dt in (utc(2024, 3, 9, 5), utc(2024, 3, 10, 5), utc(2024, 3, 11, 4), utc(2024, 3, 12, 4))]
+
+
+def test_week_and_month_periods_are_cut_at_the_range():
+    periods, edges = bucket_periods(utc(2024, 2, 7, 12), utc(2024, 2, 20), "week", "UTC", 100)
+    assert periods == [date(2024, 2, 5), date(2024, 2, 12), date(2024, 2, 19)]
+    assert edges[0] == microseconds(utc(2024, 2, 7, 12))
+    assert edges[-1] == microseconds(utc(2024, 2, 20))
+
+    periods, _ = bucket_periods(utc(2024, 11, 15), utc(2025, 2, 1), "month", "UTC", 100)
+    assert periods == [date(2024, 11, 1), date(2024, 12, 1), date(2025, 1, 1)]
+
+
+def test_too_many_periods_is_rejected():
+    with pytest.raises(ValueError, match="more than 10 day buckets"):
+        bucket_periods(utc(2024, 1, 1), utc(2024, 2, 1), "day", "UTC", 10)
+
+
+def test_shift_crossing_midnight_is_split_between_days():
+    _, edges = bucket_periods(utc(2024, 2, 10, 5), utc(2024, 2, 12, 5), "day", "America/New_York", 100)
+    # 20:00 to 04:00 New York time.
+    workers, hours = hours_by_bucket([7], [microseconds(utc(2024, 2, 11, 1))], [microseconds(utc(2024, 2, 11, 9))], edges)
+    assert workers.tolist() == [7]
+    assert hours.tolist() == [[4.0, 4.0]]
+
+
+def test_shifts_are_clipped_to_the_range():
+    _, edges = bucket_periods(utc(2024, 2, 10, 12), utc(2024, 2, 10, 14), "day", "UTC", 100)
+    workers, hours = hours_by_bucket(
+        [1, 2],
+        [microseconds(utc(2024, 2, 10, 9)), microseconds(utc(2024, 2, 10, 14))],
+        [microseconds(utc(2024, 2, 10, 17)), microseconds(utc(2024, 2, 10, 20))],
+        edges
+    )
+    assert workers.tolist() == [1]
+    assert hours.tolist() == [[2.0]]
+
+
+def test_hours_match_a_minute_by_minute_walk():
+    # Every shift walked one minute at a time, attributing each minute to the
+    # local date it falls on.
+    tz_name = "Europe/London"
+    zone = get_zone(tz_name)
+    rng = random.Random(42)
+    start_utc, end_utc = utc(2024, 3, 20), utc(2024, 11, 10)
+    shifts = []
+    for _ in range(300):
+        start = start_utc + timedelta(minutes=rng.randrange(-600, 340_000))
+        shifts.append((rng.randrange(1, 6), start, start + timedelta(minutes=rng.randrange(1, 720))))
+
+    periods, edges = bucket_periods(start_utc, end_utc, "week", tz_name, 100)
+    workers, hours = hours_by_bucket(
+        [worker_id for worker_id, _, _ in shifts],
+        np.array([microseconds(start) for _, start, _ in shifts]),
+        np.array([microseconds(end) for _, _, end in shifts]),
+        edges
+    )
+
+    expected = {}
+    for worker_id, start, end in shifts:
+        minute = max(start, start_utc)
+        while minute < min(end, end_utc):
+            day = minute.astimezone(zone).date()
+            period = next(position for position, period in enumerate(periods) if period <= day < next_period(period, "week"))
+            expected[worker_id, period] = expected.get((worker_id, period), 0) + 1 / 60
+            minute += timedelta(minutes=1)
+
+    for row, worker_id in enumerate(workers.tolist()):
+        for position in range(len(periods)):
+            assert hours[row, position] == pytest.approx(expected.get((worker_id, position), 0))
+
+
+def test_hours_report_endpoint(memory_storage):
+    from app import crud
+
+    crud.update_timezone_setting("America/New_York")
+    alice = crud.create_worker("Alice")
+    bob = crud.create_worker("Bob")
+    crud.create_shift(alice["id"], "2024-03-09T22:00:00-05:00", "2024-03-10T06:00:00-04:00")
+    crud.create_shift(bob["id"], "2024-03-11T09:00:00-04:00", "2024-03-11T17:00:00-04:00")
+
+    response = client.get("/reports/hours", params={"from": "2024-03-09T00:00:00", "to": "2024-03-12T00:00:00", "granularity": "day"})
+    assert response.status_code == 200
+    assert response.json() == {
+        "timezone": "America/New_York",
+        "granularity": "day",
+        "periods": ["2024-03-09", "2024-03-10", "2024-03-11"],
+        "workers": [
+            # 22:00 to 06:00 local is only 7 hours on the night clocks go forward.
+            {"worker_id": alice["id"], "total_hours": 7.0, "hours": [2.0, 5.0, 0.0]},
+            {"worker_id": bob["id"], "total_hours": 8.0, "hours": [0.0, 0.0, 8.0]},
+        ]
+    }
+
+    cached = client.get("/reports/hours", params={"from": "2024-03-09T00:00:00", "to": "2024-03-12T00:00:00", "granularity": "day"}, headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+
+    single = client.get("/reports/hours", params={"from": "2024-03-09T00:00:00", "to": "2024-03-12T00:00:00", "worker_id": bob["id"]})
+    assert single.json()["periods"] == ["2024-03-04", "2024-03-11"]
+    assert single.json()["workers"] == [{"worker_id": bob["id"], "total_hours": 8.0, "hours": [0.0, 8.0]}]
+
+
+def test_hours_report_rejects_bad_ranges(memory_storage):
+    response = client.get("/reports/hours", params={"from": "2024-03-12T00:00:00", "to": "2024-03-09T00:00:00"})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "`to` must be after `from`"}
+
+    response = client.get("/reports/hours", params={"from": "2000-01-01T00:00:00", "to": "2024-01-01T00:00:00", "granularity": "day"})
+    assert response.status_code == 400
+    assert "coarser granularity" in response.json()["detail"]
+
+
+def test_coverage_slots_cut_the_last_slot_at_the_range():
+    origin, slot, count = coverage_slots(utc(2024, 2, 10, 9), utc(2024, 2, 10, 10, 20), 15, 100)
+    assert (origin, slot, count) == (microseconds(utc(2024, 2, 10, 9)), 15 * 60_000_000, 6)
+
+    with pytest.raises(ValueError, match="more than 5 15-minute slots"):
+        coverage_slots(utc(2024, 2, 10, 9), utc(2024, 2, 10, 10, 20), 15, 5)
+
+
+def test_headcount_counts_back_to_back_shifts_once():
+    origin, slot, count = coverage_slots(utc(2024, 2, 10, 8), utc(2024, 2, 10, 12), 60, 100)
+    headcount = headcount_by_slot(
+        [1, 1, 2],
+        [microseconds(dt) for dt in (utc(2024, 2, 10, 8, 30), utc(2024, 2, 10, 9, 40), utc(2024, 2, 10, 9))],
+        [microseconds(dt) for dt in (utc(2024, 2, 10, 9, 20), utc(2024, 2, 10, 10, 0), utc(2024, 2, 10, 13))],
+        origin, slot, count
+    )
+    # Worker 1 is in 08:00 and, across both shifts, once in 09:00; a shift
+    # ending exactly at 10:00 does not reach the 10:00 slot.
+    assert headcount.tolist() == [1, 2, 1, 1]
+
+
+def test_headcount_matches_a_slot_by_slot_count():
+    rng = random.Random(7)
+    start_utc, end_utc = utc(2024, 3, 1), utc(2024, 3, 8, 5)
+    shifts = []
+    for worker_id in range(1, 40):
+        cursor = start_utc - timedelta(hours=10)
+        while cursor < end_utc:
+            start = cursor + timedelta(minutes=rng.randrange(0, 600))
+            end = start + timedelta(minutes=rng.randrange(5, 720))
+            shifts.append((worker_id, start, end))
+            cursor = end
+
+    origin, slot, count = coverage_slots(start_utc, end_utc, 30, 1000)
+    headcount = headcount_by_slot(
+        [worker_id for worker_id, _, _ in shifts],
+        np.array([microseconds(start) for _, start, _ in shifts]),
+        np.array([microseconds(end) for _, _, end in shifts]),
+        origin, slot, count
+    )
+
+    expected = []
+    for position in range(count):
+        slot_start = start_utc + timedelta(minutes=30 * position)
+        slot_end = min(slot_start + timedelta(minutes=30), end_utc)
+        expected.append(len({worker_id for worker_id, start, end in shifts if start < slot_end and slot_start < end}))
+    assert headcount.tolist() == expected
+
+
+def test_coverage_report_endpoint(memory_storage):
+    from app import crud
+
+    crud.update_timezone_setting("America/New_York")
+    alice = crud.create_worker("Alice")
+    bob = crud.create_worker("Bob")
+    crud.create_shift(alice["id"], "2024-02-10T09:00:00-05:00", "2024-02-10T09:45:00-05:00")
+    crud.create_shift(bob["id"], "2024-02-10T09:20:00-05:00", "2024-02-10T12:00:00-05:00")
+
+    params = {"from": "2024-02-10T09:00:00", "to": "2024-02-10T10:30:00", "bucket": "30m"}
+    response = client.get("/reports/coverage", params=params)
+    assert response.status_code == 200
+    assert response.json() == {
+        "timezone": "America/New_York",
+        "bucket_minutes": 30,
+        "slots": ["2024-02-10T09:00:00-05:00", "2024-02-10T09:30:00-05:00", "2024-02-10T10:00:00-05:00"],
+        "headcount": [2, 2, 1]
+    }
+
+    cached = client.get("/reports/coverage", params=params, headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+
+    response = client.get("/reports/coverage", params={"from": "2024-01-01T00:00:00", "to": "2024-03-01T00:00:00"})
+    assert response.status_code == 400
+    assert "larger bucket" in response.json()["detail"]
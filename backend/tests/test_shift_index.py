@@ -0,0 +1,224 @@
+from datetime import datetime, timezone
+from unittest.mock import patch, MagicMock
+
+import pytest
+from app.shift_index import ShiftIntervalIndex
+
+
+def utc(hour, minute=0, day=10):
+    return datetime(2024, 2, day, hour, minute, 0, tzinfo=timezone.utc)
+
+
+def make_shift_entity(shift_id, worker_id, start, end, parent=None):
+    entity = MagicMock()
+    entity.key.id = shift_id
+    entity.key.parent = parent
+    entity.__getitem__ = lambda self, key: {
+        "worker_id": worker_id,
+        "start_utc": start,
+        "end_utc": end
+    }[key]
+    return entity
+
+
+def loaded_index(shifts, worker_id=1, ttl_seconds=60):
+    index = ShiftIntervalIndex(ttl_seconds=ttl_seconds)
+    index.load_worker(worker_id, shifts, index.load_token())
+    return index
+
+
+def test_unloaded_worker_is_not_answered():
+    index = ShiftIntervalIndex(ttl_seconds=60)
+    assert index.overlaps(1, utc(9), utc(17)) is None
+
+
+def test_overlap_detection():
+    index = loaded_index([(1, utc(9), utc(12)), (2, utc(14), utc(18))])
+    assert index.overlaps(1, utc(11), utc(13)) is True
+    assert index.overlaps(1, utc(13), utc(15)) is True
+    assert index.overlaps(1, utc(8), utc(20)) is True
+    assert index.overlaps(1, utc(12), utc(14)) is False
+    assert index.overlaps(1, utc(18), utc(20)) is False
+    assert index.overlaps(1, utc(5), utc(9)) is False
+
+
+def test_overlap_excludes_shift_being_updated():
+    index = loaded_index([(1, utc(9), utc(12)), (2, utc(14), utc(18))])
+    assert index.overlaps(1, utc(15), utc(17), exclude_shift_id=2) is False
+    assert index.overlaps(1, utc(11), utc(17), exclude_shift_id=2) is True
+
+
+def test_add_update_and_remove_keep_index_current():
+    index = loaded_index([(1, utc(9), utc(12))])
+    index.add(1, 2, utc(14), utc(18))
+    assert index.overlaps(1, utc(15), utc(16)) is True
+
+    index.add(1, 2, utc(19), utc(21))
+    assert index.overlaps(1, utc(15), utc(16)) is False
+    assert index.overlaps(1, utc(20), utc(22)) is True
+
+    index.remove(2)
+    assert index.overlaps(1, utc(20), utc(22)) is False
+
+
+def test_stale_worker_is_not_answered():
+    index = loaded_index([(1, utc(9), utc(12))], ttl_seconds=0)
+    assert index.overlaps(1, utc(10), utc(11)) is None
+
+
+def test_load_discarded_after_concurrent_write():
+    index = ShiftIntervalIndex(ttl_seconds=60)
+    token = index.load_token()
+    index.add(1, 5, utc(9), utc(12))
+    assert index.load_worker(1, [], token) is False
+    assert index.overlaps(1, utc(10), utc(11)) is None
+
+
+def test_overlapping_stored_shifts_fall_back():
+    index = loaded_index([(1, utc(9), utc(17)), (2, utc(10), utc(11))])
+    assert index.overlaps(1, utc(12), utc(13)) is None
+
+
+def test_rebuild_groups_shifts_by_worker():
+    index = ShiftIntervalIndex(ttl_seconds=60)
+    count = index.rebuild([
+        (1, 10, utc(9), utc(12)),
+        (2, 11, utc(9), utc(12)),
+    ])
+    assert count == 2
+    assert index.overlaps(1, utc(10), utc(11)) is True
+    assert index.overlaps(3, utc(10), utc(11)) is None
+
+
+@patch("app.crud.query_entities")
+def test_precheck_shift_overlap_caches_the_bounded_window(mock_query_entities):
+    from datetime import timedelta
+    from app.crud import precheck_shift_overlap
+
+    mock_query_entities.return_value = [make_shift_entity(1, 1, utc(14), utc(18))]
+
+    assert precheck_shift_overlap(1, utc(13), utc(23)) is True
+    mock_query_entities.assert_called_once_with("Shift", [
+        ("worker_id", "=", 1),
+        ("start_utc", ">", utc(13) - timedelta(hours=12)),
+        ("start_utc", "<", utc(23)),
+    ], projection=["start_utc", "end_utc"])
+
+    # Inside the loaded window a miss is answered by the index on its own...
+    assert precheck_shift_overlap(1, utc(19), utc(23)) is False
+    assert mock_query_entities.call_count == 1
+
+    # ...while a hit is confirmed with a fresh read.
+    assert precheck_shift_overlap(1, utc(15), utc(16)) is True
+    assert mock_query_entities.call_count == 2
+
+    # Outside it, another bounded query is needed.
+    assert precheck_shift_overlap(1, utc(10), utc(12)) is False
+    assert mock_query_entities.call_count == 3
+
+
+def test_windowed_worker_only_answers_inside_its_window():
+    index = ShiftIntervalIndex(ttl_seconds=60)
+    index.load_worker(1, [(1, utc(14), utc(18))], index.load_token(), window=(utc(12), utc(20)))
+    assert index.overlaps(1, utc(13), utc(15)) is True
+    assert index.overlaps(1, utc(18), utc(20)) is False
+    assert index.overlaps(1, utc(11), utc(13)) is None
+    assert index.overlaps(1, utc(19), utc(21)) is None
+
+
+@patch("app.crud.SHIFT_INDEX_ENABLED", False)
+@patch("app.crud.query_entities")
+def test_precheck_without_index_reads_legacy_shifts(mock_query_entities):
+    from datetime import timedelta
+    from app.crud import precheck_shift_overlap
+
+    mock_query_entities.return_value = [make_shift_entity(1, 1, utc(14), utc(18))]
+
+    assert precheck_shift_overlap(1, utc(17), utc(20)) is True
+    mock_query_entities.assert_called_once_with("Shift", [
+        ("worker_id", "=", 1),
+        ("start_utc", ">", utc(17) - timedelta(hours=12)),
+        ("start_utc", "<", utc(20)),
+    ], projection=["start_utc", "end_utc"])
+
+    # Overlaps inside the worker's entity group are left to the write transaction.
+    mock_query_entities.return_value = [make_shift_entity(1, 1, utc(14), utc(18), parent=MagicMock())]
+    assert precheck_shift_overlap(1, utc(17), utc(20)) is False
+
+
+@patch("app.crud.SHIFT_INDEX_ENABLED", False)
+@patch("app.crud.query_entities")
+def test_precheck_shift_overlap_projected_integer_timestamps(mock_query_entities):
+    from app.crud import precheck_shift_overlap
+
+    start_us = int(utc(14).timestamp()) * 1_000_000
+    end_us = int(utc(18).timestamp()) * 1_000_000
+    mock_query_entities.return_value = [make_shift_entity(1, 1, start_us, end_us)]
+
+    assert precheck_shift_overlap(1, utc(17), utc(20)) is True
+    assert precheck_shift_overlap(1, utc(18), utc(20)) is False
+    assert precheck_shift_overlap(1, utc(17), utc(20), exclude_shift_id=1) is False
+
+
+@patch("app.crud.get_timezone_setting")
+@patch("app.crud.run_in_transaction")
+@patch("app.crud.allocate_ids")
+@patch("app.crud.put_entity_by_id")
+@patch("app.crud.query_entities")
+@patch("app.crud.get_entity_by_id")
+def test_create_shift_updates_index(mock_get_entity, mock_query_entities, mock_put_entity, mock_allocate_ids, mock_run_in_transaction, mock_get_tz):
+    from app.crud import _shift_index, create_shift
+
+    mock_get_tz.return_value = "UTC"
+    mock_get_entity.return_value = MagicMock()
+    mock_query_entities.return_value = []
+    mock_allocate_ids.return_value = [7]
+    mock_run_in_transaction.side_effect = lambda operation: operation()
+    mock_put_entity.return_value = make_shift_entity(7, 1, utc(9), utc(17))
+
+    create_shift(1, "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00")
+
+    assert _shift_index.overlaps(1, utc(10), utc(12)) is True
+
+
+def test_stale_index_hit_does_not_reject_a_free_slot():
+    from app import crud, db
+    from app.storage_memory import MemoryStorage
+
+    db.set_storage(MemoryStorage("test"))
+    try:
+        worker = crud.create_worker("Alice")
+        shift = crud.create_shift(worker["id"], "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00")
+        assert crud.precheck_shift_overlap(worker["id"], utc(10), utc(12)) is True
+
+        # Another instance deletes the shift; this process's index still has it.
+        db.delete_entity("Shift", shift["id"], parent=crud.worker_parent(worker["id"]))
+
+        created = crud.create_shift(worker["id"], "2024-02-10T10:00:00+00:00", "2024-02-10T12:00:00+00:00")
+        assert created["worker_id"] == worker["id"]
+    finally:
+        db.set_storage(None)
+
+
+def test_index_hits_are_rejected_early_and_misses_by_the_transaction():
+    from app import crud, db
+    from app.storage_memory import MemoryStorage
+
+    db.set_storage(MemoryStorage("test"))
+    try:
+        worker = crud.create_worker("Alice")
+        crud.create_shift(worker["id"], "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00")
+        crud.rebuild_shift_index()
+        assert crud.precheck_shift_overlap(worker["id"], utc(10), utc(12)) is True
+
+        # Another instance writes a shift this process's index has not seen.
+        db.put_entity_by_id("Shift", 99, crud.shift_data(worker["id"], 99, utc(18), utc(20)), parent=crud.worker_parent(worker["id"]))
+        assert crud.precheck_shift_overlap(worker["id"], utc(19), utc(21)) is False
+        with patch("app.crud.write_new_shift", wraps=crud.write_new_shift) as write_new_shift:
+            for start, end in [("10:00", "12:00"), ("19:00", "21:00")]:
+                with pytest.raises(ValueError, match="overlaps"):
+                    crud.create_shift(worker["id"], f"2024-02-10T{start}:00+00:00", f"2024-02-10T{end}:00+00:00")
+        # Only the miss reached the write transaction.
+        assert write_new_shift.call_count == 1
+    finally:
+        db.set_storage(None)
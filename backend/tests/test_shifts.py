@@ -5,39 +5,213 @@ from app.main import app
 client = TestClient(app)
 
 
-@patch("app.main.list_shifts")
-def test_get_shifts_empty(mock_list_shifts):
-    mock_list_shifts.return_value = []
+@patch("app.main.list_shifts_page")
+def test_get_shifts_empty(mock_list_shifts_page):
+    mock_list_shifts_page.return_value = ([], None)
     response = client.get("/shifts")
     assert response.status_code == 200
-    assert response.json() == []
+    assert response.json() == {"items": [], "next_cursor": None}
 
 
-@patch("app.main.list_shifts")
-def test_get_shifts_multiple(mock_list_shifts):
-    mock_list_shifts.return_value = [
+@patch("app.main.list_shifts_page")
+def test_get_shifts_multiple(mock_list_shifts_page):
+    mock_list_shifts_page.return_value = ([
         {
             "id": 1,
             "worker_id": 1,
             "start": "2024-02-10T09:00:00-05:00",
-            "end": "2024-02-10T17:00:00-05:00"
+            "end": "2024-02-10T17:00:00-05:00",
+            "duration_hours": 8.0
         },
         {
             "id": 2,
             "worker_id": 2,
             "start": "2024-02-11T10:00:00-05:00",
-            "end": "2024-02-11T18:00:00-05:00"
+            "end": "2024-02-11T18:00:00-05:00",
+            "duration_hours": 8.0
         }
-    ]
+    ], "next-page")
     response = client.get("/shifts")
     assert response.status_code == 200
     data = response.json()
-    assert len(data) == 2
-    assert data[0]["id"] == 1
-    assert data[0]["worker_id"] == 1
-    assert data[0]["start"] == "2024-02-10T09:00:00-05:00"
-    assert data[0]["end"] == "2024-02-10T17:00:00-05:00"
-    assert data[0]["duration_hours"] == 8.0
+    assert data["next_cursor"] == "next-page"
+    items = data["items"]
+    assert len(items) == 2
+    assert items[0]["id"] == 1
+    assert items[0]["worker_id"] == 1
+    assert items[0]["start"] == "2024-02-10T09:00:00-05:00"
+    assert items[0]["end"] == "2024-02-10T17:00:00-05:00"
+    assert items[0]["duration_hours"] == 8.0
+
+
+@patch("app.crud.find_shift_entities_page")
+@patch("app.async_crud.get_timezone_setting")
+def test_get_shifts_body_matches_response_model(mock_get_tz, mock_find_page):
+    from datetime import datetime, timedelta, timezone
+    from google.cloud import datastore
+    from app.models import ShiftPage
+
+    mock_get_tz.return_value = "America/New_York"
+    start = datetime(2024, 3, 9, 20, 0, tzinfo=timezone.utc)
+    entities = []
+    for shift_id in range(1, 41):
+        entity = datastore.Entity(key=datastore.Key("Worker", 1, "Shift", shift_id, project="test"))
+        entity.update({
+            "worker_id": 1,
+            "start_utc": start + timedelta(hours=shift_id),
+            "end_utc": start + timedelta(hours=shift_id, minutes=20, microseconds=shift_id),
+        })
+        entities.append(entity)
+
+    # Both the per-shift and the batched timezone conversion paths.
+    for count in (3, 40):
+        mock_find_page.return_value = (entities[:count], "ñext")
+        response = client.get("/shifts")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        expected = ShiftPage.model_validate(response.json()).model_dump_json().encode()
+        assert response.content == expected
+        assert response.json()["items"][0]["duration_hours"] == timedelta(minutes=20, microseconds=1).total_seconds() / 3600
+
+
+def test_list_endpoints_keep_response_model_schema():
+    paths = app.openapi()["paths"]
+    for path, model in [("/shifts", "ShiftPage"), ("/workers/{worker_id}/shifts", "ShiftPage"), ("/workers", "WorkerPage")]:
+        schema = paths[path]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+        assert schema == {"$ref": f"#/components/schemas/{model}"}
+
+
+@patch("app.main.list_shifts_page")
+def test_get_shifts_passes_limit_and_cursor(mock_list_shifts_page):
+    mock_list_shifts_page.return_value = ([], None)
+    response = client.get("/shifts?limit=25&cursor=abc")
+    assert response.status_code == 200
+    mock_list_shifts_page.assert_called_once_with(25, "abc", None, None, None)
+
+
+@patch("app.main.list_shifts_page")
+def test_get_shifts_limit_capped(mock_list_shifts_page):
+    from app.settings import MAX_PAGE_SIZE
+
+    mock_list_shifts_page.return_value = ([], None)
+    response = client.get(f"/shifts?limit={MAX_PAGE_SIZE + 1000}")
+    assert response.status_code == 200
+    mock_list_shifts_page.assert_called_once_with(MAX_PAGE_SIZE, None, None, None, None)
+
+
+def test_get_shifts_zero_limit():
+    response = client.get("/shifts?limit=0")
+    assert response.status_code == 422
+
+
+@patch("app.main.list_shifts_page")
+def test_get_shifts_invalid_cursor(mock_list_shifts_page):
+    mock_list_shifts_page.side_effect = ValueError("Invalid cursor")
+    response = client.get("/shifts?cursor=%%%")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+@patch("app.main.list_shifts_page")
+@patch("app.main.list_shifts")
+def test_get_shifts_all_opt_in(mock_list_shifts, mock_list_shifts_page):
+    mock_list_shifts.return_value = [
+        {
+            "id": 1,
+            "worker_id": 1,
+            "start": "2024-02-10T09:00:00-05:00",
+            "end": "2024-02-10T17:00:00-05:00",
+            "duration_hours": 8.0
+        }
+    ]
+    response = client.get("/shifts?all=true")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["next_cursor"] is None
+    assert len(data["items"]) == 1
+    mock_list_shifts_page.assert_not_called()
+
+
+@patch("app.main.list_shifts_page")
+def test_get_shifts_with_filters(mock_list_shifts_page):
+    mock_list_shifts_page.return_value = ([], None)
+    response = client.get("/shifts?from=2024-02-05T00:00:00&to=2024-02-12T00:00:00&worker_id=3")
+    assert response.status_code == 200
+    mock_list_shifts_page.assert_called_once_with(
+        100, None, "2024-02-05T00:00:00", "2024-02-12T00:00:00", 3
+    )
+
+
+@patch("app.crud.get_timezone_setting")
+def test_get_shifts_invalid_range(mock_get_tz):
+    mock_get_tz.return_value = "UTC"
+    response = client.get("/shifts?from=yesterday")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid ISO 8601 datetime format: yesterday"
+
+    response = client.get("/shifts?from=2024-02-12T00:00:00&to=2024-02-05T00:00:00")
+    assert response.status_code == 400
+
+
+@patch("app.crud.get_timezone_setting")
+@patch("app.crud.list_entities_page")
+def test_list_shifts_page_range_query(mock_list_entities_page, mock_get_tz):
+    from datetime import datetime, timezone
+    from app.crud import list_shifts_page
+
+    mock_get_tz.return_value = "America/New_York"
+
+    def make_entity(shift_id, start, end):
+        entity = MagicMock()
+        entity.key.id = shift_id
+        entity.__getitem__ = lambda self, key: {
+            "worker_id": 1,
+            "start_utc": start,
+            "end_utc": end
+        }[key]
+        return entity
+
+    mock_list_entities_page.return_value = ([
+        make_entity(1, datetime(2024, 2, 4, 20, 0, tzinfo=timezone.utc), datetime(2024, 2, 5, 4, 0, tzinfo=timezone.utc)),
+        make_entity(2, datetime(2024, 2, 5, 14, 0, tzinfo=timezone.utc), datetime(2024, 2, 5, 22, 0, tzinfo=timezone.utc)),
+    ], None)
+
+    shifts, next_cursor = list_shifts_page(50, None, "2024-02-05T00:00:00", "2024-02-12T00:00:00-05:00", 1)
+
+    assert [shift["id"] for shift in shifts] == [2]
+    assert next_cursor is None
+    mock_list_entities_page.assert_called_once_with("Shift", 50, None, filters=[
+        ("worker_id", "=", 1),
+        ("start_utc", ">", datetime(2024, 2, 4, 17, 0, tzinfo=timezone.utc)),
+        ("start_utc", "<", datetime(2024, 2, 12, 5, 0, tzinfo=timezone.utc)),
+    ], order=["start_utc"])
+
+
+@patch("app.main.list_shifts_page")
+@patch("app.main.validate_worker_exists")
+def test_get_worker_shifts(mock_validate_worker, mock_list_shifts_page):
+    mock_validate_worker.return_value = True
+    mock_list_shifts_page.return_value = ([
+        {
+            "id": 1,
+            "worker_id": 4,
+            "start": "2024-02-10T09:00:00-05:00",
+            "end": "2024-02-10T17:00:00-05:00",
+            "duration_hours": 8.0
+        }
+    ], None)
+    response = client.get("/workers/4/shifts?from=2024-02-10")
+    assert response.status_code == 200
+    assert response.json()["items"][0]["worker_id"] == 4
+    mock_list_shifts_page.assert_called_once_with(100, None, "2024-02-10", None, 4)
+
+
+@patch("app.main.validate_worker_exists")
+def test_get_worker_shifts_nonexistent_worker(mock_validate_worker):
+    mock_validate_worker.return_value = False
+    response = client.get("/workers/999/shifts")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Worker not found"
 
 
 @patch("app.main.create_shift")
@@ -136,6 +310,39 @@ def test_get_shift_existing(mock_get_shift):
     mock_get_shift.assert_called_once_with(1)
 
 
+@patch("app.main.get_shift")
+def test_get_shift_not_modified(mock_get_shift):
+    mock_get_shift.return_value = {
+        "id": 1,
+        "worker_id": 1,
+        "start": "2024-02-10T09:00:00-05:00",
+        "end": "2024-02-10T17:00:00-05:00"
+    }
+    etag = client.get("/shifts/1").headers["etag"]
+    response = client.get("/shifts/1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    mock_get_shift.assert_called_once_with(1)
+    assert client.get("/shifts/2").headers["etag"] != etag
+
+
+@patch("app.crud.put_entity")
+@patch("app.main.get_shift")
+def test_get_shift_etag_changes_with_timezone(mock_get_shift, mock_put_entity, data_versions):
+    from app import crud
+
+    mock_get_shift.return_value = {
+        "id": 1,
+        "worker_id": 1,
+        "start": "2024-02-10T09:00:00-05:00",
+        "end": "2024-02-10T17:00:00-05:00"
+    }
+    etag = client.get("/shifts/1").headers["etag"]
+    crud.update_timezone_setting("Europe/London")
+    data_versions.assert_called_once()
+    assert data_versions.call_args.args[0] == "Settings"
+    assert client.get("/shifts/1", headers={"If-None-Match": etag}).headers["etag"] != etag
+
+
 @patch("app.main.get_shift")
 def test_get_shift_nonexistent(mock_get_shift):
     mock_get_shift.return_value = None
@@ -210,10 +417,12 @@ def test_delete_shift_nonexistent(mock_delete_shift):
 
 @patch("app.crud.get_timezone_setting")
 @patch("app.crud.get_entity_by_id")
-def test_timezone_conversion_storage_and_retrieval(mock_get_entity, mock_get_tz):
+@patch("app.crud.find_shift_parent")
+def test_timezone_conversion_storage_and_retrieval(mock_find_parent, mock_get_entity, mock_get_tz):
     from datetime import datetime, timezone
     from app.crud import get_shift
     
+    mock_find_parent.return_value = ("Worker", 1)
     mock_get_tz.return_value = "America/New_York"
     
     mock_entity = MagicMock()
@@ -233,10 +442,12 @@ def test_timezone_conversion_storage_and_retrieval(mock_get_entity, mock_get_tz)
 
 @patch("app.crud.get_timezone_setting")
 @patch("app.crud.get_entity_by_id")
-def test_timezone_change_affects_retrieval(mock_get_entity, mock_get_tz):
+@patch("app.crud.find_shift_parent")
+def test_timezone_change_affects_retrieval(mock_find_parent, mock_get_entity, mock_get_tz):
     from datetime import datetime, timezone
     from app.crud import get_shift
     
+    mock_find_parent.return_value = ("Worker", 1)
     mock_entity = MagicMock()
     mock_entity.key.id = 1
     mock_entity.__getitem__ = lambda self, key: {
@@ -253,10 +464,10 @@ def test_timezone_change_affects_retrieval(mock_get_entity, mock_get_tz):
     assert shift["end"] == "2024-02-10T22:00:00+00:00"
 
 
-@patch("app.crud.list_entities_by_property")
+@patch("app.crud.query_entities")
 def test_multiple_shifts_per_day_non_overlapping(mock_list_entities):
     from datetime import datetime, timezone
-    from app.crud import check_shift_overlap
+    from app.crud import precheck_shift_overlap
     
     mock_shift1 = MagicMock()
     mock_shift1.key.id = 1
@@ -267,7 +478,7 @@ def test_multiple_shifts_per_day_non_overlapping(mock_list_entities):
     
     mock_list_entities.return_value = [mock_shift1]
     
-    overlap = check_shift_overlap(
+    overlap = precheck_shift_overlap(
         1,
         datetime(2024, 2, 10, 19, 0, 0, tzinfo=timezone.utc),
         datetime(2024, 2, 10, 23, 0, 0, tzinfo=timezone.utc)
@@ -497,3 +708,512 @@ def test_delete_shift_negative_id(mock_delete_shift):
     mock_delete_shift.return_value = None
     response = client.delete("/shifts/-1")
     assert response.status_code == 404
+
+
+@patch("app.main.create_shifts_batch")
+def test_post_shifts_batch_valid(mock_create_batch):
+    mock_create_batch.return_value = {
+        "created": 1,
+        "failed": 0,
+        "results": [
+            {
+                "index": 0,
+                "status": "created",
+                "shift": {
+                    "id": 1,
+                    "worker_id": 1,
+                    "start": "2024-02-10T09:00:00-05:00",
+                    "end": "2024-02-10T17:00:00-05:00"
+                },
+                "error": None
+            }
+        ]
+    }
+    response = client.post("/shifts:batch", json={"shifts": [{
+        "worker_id": 1,
+        "start": "2024-02-10T09:00:00-05:00",
+        "end": "2024-02-10T17:00:00-05:00"
+    }]})
+    assert response.status_code == 201
+    assert response.json()["results"][0]["shift"]["duration_hours"] == 8.0
+    mock_create_batch.assert_called_once_with(
+        [(1, "2024-02-10T09:00:00-05:00", "2024-02-10T17:00:00-05:00")], atomic=True
+    )
+
+
+@patch("app.main.create_shifts_batch")
+def test_post_shifts_batch_atomic_rejected(mock_create_batch):
+    mock_create_batch.return_value = {
+        "created": 0,
+        "failed": 1,
+        "results": [{"index": 0, "status": "failed", "shift": None, "error": "Worker not found"}]
+    }
+    response = client.post("/shifts:batch", json={"shifts": [{
+        "worker_id": 99,
+        "start": "2024-02-10T09:00:00-05:00",
+        "end": "2024-02-10T17:00:00-05:00"
+    }]})
+    assert response.status_code == 400
+    assert response.json()["results"][0]["error"] == "Worker not found"
+
+
+def test_post_shifts_batch_invalid_item():
+    response = client.post("/shifts:batch", json={"shifts": [{
+        "worker_id": 1,
+        "start": "2024-02-10T09:00:00-05:00",
+        "end": "2024-02-11T09:00:00-05:00"
+    }]})
+    assert response.status_code == 422
+
+
+def test_post_shifts_batch_empty():
+    response = client.post("/shifts:batch", json={"shifts": []})
+    assert response.status_code == 422
+
+
+def _assign_keys(kind, items, parent=None, exclude_from_indexes=()):
+    entities = []
+    for shift_id, data in items:
+        entity = MagicMock()
+        entity.key.id = shift_id
+        entity.__getitem__ = lambda self, key, data=data: data[key]
+        entities.append(entity)
+    return entities
+
+
+def _run_operation(operation):
+    return operation()
+
+
+@patch("app.crud.get_timezone_setting")
+@patch("app.crud.run_in_transaction")
+@patch("app.crud.allocate_ids")
+@patch("app.crud.put_entities_by_ids")
+@patch("app.crud.query_entities")
+@patch("app.crud.get_entity_by_id", return_value=MagicMock())
+@patch("app.crud.get_entities_by_ids")
+def test_create_shifts_batch_best_effort(mock_get_entities, mock_get_worker, mock_query_entities, mock_put_entities, mock_allocate_ids, mock_run_in_transaction, mock_get_tz):
+    from datetime import datetime, timezone
+    from app.crud import create_shifts_batch
+
+    mock_get_tz.return_value = "UTC"
+    mock_allocate_ids.side_effect = lambda kind, count: list(range(100, 100 + count))
+    mock_run_in_transaction.side_effect = _run_operation
+    mock_get_entities.return_value = {1: MagicMock(), 2: MagicMock()}
+    stored = MagicMock()
+    stored.key.id = 50
+    stored.__getitem__ = lambda self, key: {
+        "start_utc": datetime(2024, 2, 12, 9, 0, tzinfo=timezone.utc),
+        "end_utc": datetime(2024, 2, 12, 17, 0, tzinfo=timezone.utc)
+    }[key]
+
+    def query(kind, filters, projection=None, ancestor=None):
+        worker_id = ancestor[1] if ancestor else filters[0][2]
+        return [stored] if worker_id == 1 else []
+
+    mock_query_entities.side_effect = query
+    mock_put_entities.side_effect = _assign_keys
+
+    result = create_shifts_batch([
+        (1, "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00"),
+        (1, "2024-02-10T16:00:00+00:00", "2024-02-10T20:00:00+00:00"),
+        (1, "2024-02-12T12:00:00+00:00", "2024-02-12T20:00:00+00:00"),
+        (2, "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00"),
+        (3, "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00"),
+    ], atomic=False)
+
+    assert result["created"] == 2
+    assert result["failed"] == 3
+    statuses = [(item["status"], item["error"]) for item in result["results"]]
+    assert statuses == [
+        ("created", None),
+        ("failed", "Shift overlaps with another shift in this batch"),
+        ("failed", "Shift overlaps with existing shift for this worker"),
+        ("created", None),
+        ("failed", "Worker not found"),
+    ]
+    assert result["results"][0]["shift"]["start"] == "2024-02-10T09:00:00+00:00"
+    assert result["results"][3]["shift"]["worker_id"] == 2
+    assert mock_put_entities.call_count == 2
+    assert mock_put_entities.call_args_list[0].kwargs["parent"] == ("Worker", 1)
+    assert mock_put_entities.call_args_list[1].kwargs["parent"] == ("Worker", 2)
+
+
+@patch("app.crud.put_entities_by_ids")
+@patch("app.crud.query_entities")
+@patch("app.crud.get_entities_by_ids")
+def test_create_shifts_batch_atomic_writes_nothing_on_conflict(mock_get_entities, mock_query_entities, mock_put_entities):
+    from app.crud import create_shifts_batch
+
+    mock_get_entities.return_value = {1: MagicMock()}
+    mock_query_entities.return_value = []
+
+    result = create_shifts_batch([
+        (1, "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00"),
+        (1, "2024-02-10T12:00:00+00:00", "2024-02-10T13:00:00+00:00"),
+        (1, "2024-02-11T09:00:00+00:00", "2024-02-11T17:00:00+00:00"),
+    ], atomic=True)
+
+    assert result["created"] == 0
+    assert [item["status"] for item in result["results"]] == ["skipped", "failed", "skipped"]
+    mock_put_entities.assert_not_called()
+
+
+@patch("app.crud.delete_entities")
+@patch("app.crud.run_in_transaction")
+@patch("app.crud.allocate_ids")
+@patch("app.crud.put_entities_by_ids")
+@patch("app.crud.query_entities")
+@patch("app.crud.get_entities_by_ids")
+def test_create_shifts_batch_atomic_concurrent_conflict(mock_get_entities, mock_query_entities, mock_put_entities, mock_allocate_ids, mock_run_in_transaction, mock_delete_entities):
+    from datetime import datetime, timezone
+    from app.crud import create_shifts_batch
+
+    mock_get_entities.return_value = {1: MagicMock(), 2: MagicMock()}
+    mock_allocate_ids.return_value = [100, 101]
+    mock_run_in_transaction.side_effect = _run_operation
+    mock_put_entities.side_effect = _assign_keys
+    concurrent = MagicMock()
+    concurrent.key.id = 60
+    concurrent.__getitem__ = lambda self, key: {
+        "start_utc": datetime(2024, 2, 10, 8, 0, tzinfo=timezone.utc),
+        "end_utc": datetime(2024, 2, 10, 10, 0, tzinfo=timezone.utc)
+    }[key]
+
+    def query(kind, filters, projection=None, ancestor=None):
+        # Worker 2 gained a shift between the pre-check and its transaction.
+        return [concurrent] if ancestor == ("Worker", 2) else []
+
+    mock_query_entities.side_effect = query
+
+    result = create_shifts_batch([
+        (1, "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00"),
+        (2, "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00"),
+    ], atomic=True)
+
+    assert result["created"] == 0
+    assert [item["status"] for item in result["results"]] == ["skipped", "failed"]
+    # The whole batch shares one transaction, so nothing was written to undo.
+    mock_run_in_transaction.assert_called_once()
+    mock_put_entities.assert_not_called()
+    mock_delete_entities.assert_not_called()
+
+
+@patch("app.crud.MAX_TRANSACTION_GROUPS", 1)
+@patch("app.crud.delete_entities")
+@patch("app.crud.run_in_transaction")
+@patch("app.crud.allocate_ids")
+@patch("app.crud.put_entities_by_ids")
+@patch("app.crud.query_entities")
+@patch("app.crud.get_entity_by_id", return_value=MagicMock())
+@patch("app.crud.get_entities_by_ids")
+def test_create_shifts_batch_too_large_for_one_transaction_undoes_written_chunks(mock_get_entities, mock_get_worker, mock_query_entities, mock_put_entities, mock_allocate_ids, mock_run_in_transaction, mock_delete_entities):
+    from datetime import datetime, timezone
+    from app.crud import create_shifts_batch
+
+    mock_get_entities.return_value = {1: MagicMock(), 2: MagicMock()}
+    mock_allocate_ids.return_value = [100, 101]
+    mock_run_in_transaction.side_effect = _run_operation
+    mock_put_entities.side_effect = _assign_keys
+    concurrent = MagicMock()
+    concurrent.key.id = 60
+    concurrent.__getitem__ = lambda self, key: {
+        "start_utc": datetime(2024, 2, 10, 8, 0, tzinfo=timezone.utc),
+        "end_utc": datetime(2024, 2, 10, 10, 0, tzinfo=timezone.utc)
+    }[key]
+
+    def query(kind, filters, projection=None, ancestor=None):
+        # Worker 2 gained a shift between the pre-check and its transaction.
+        return [concurrent] if ancestor == ("Worker", 2) else []
+
+    mock_query_entities.side_effect = query
+
+    result = create_shifts_batch([
+        (1, "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00"),
+        (2, "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00"),
+    ], atomic=True)
+
+    assert result["created"] == 0
+    assert [item["status"] for item in result["results"]] == ["skipped", "failed"]
+    mock_delete_entities.assert_called_once_with("Shift", [100], parent=("Worker", 1))
+
+
+@patch("app.crud.get_timezone_setting")
+@patch("app.crud.run_in_transaction")
+@patch("app.crud.put_entity_by_id")
+@patch("app.crud.allocate_ids")
+@patch("app.crud.query_entities")
+@patch("app.crud.get_entity_by_id")
+def test_create_shift_writes_under_worker_in_transaction(mock_get_entity, mock_query_entities, mock_allocate_ids, mock_put_entity, mock_run_in_transaction, mock_get_tz):
+    from datetime import datetime, timezone
+    from app.crud import create_shift
+
+    mock_get_tz.return_value = "UTC"
+    mock_get_entity.return_value = MagicMock()
+    mock_query_entities.return_value = []
+    mock_allocate_ids.return_value = [7]
+    mock_run_in_transaction.side_effect = _run_operation
+    mock_put_entity.side_effect = lambda kind, shift_id, data, parent=None, exclude_from_indexes=(): _assign_keys(kind, [(shift_id, data)])[0]
+
+    shift = create_shift(1, "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00")
+
+    assert shift["id"] == 7
+    mock_put_entity.assert_called_once_with("Shift", 7, {
+        "worker_id": 1,
+        "shift_id": 7,
+        "start_utc": datetime(2024, 2, 10, 9, 0, tzinfo=timezone.utc),
+        "end_utc": datetime(2024, 2, 10, 17, 0, tzinfo=timezone.utc),
+        "duration_seconds": 28800.0
+    }, parent=("Worker", 1), exclude_from_indexes=("duration_seconds",))
+    assert mock_query_entities.call_args.kwargs["ancestor"] == ("Worker", 1)
+    mock_run_in_transaction.assert_called_once()
+
+
+@patch("app.crud.run_in_transaction")
+@patch("app.crud.put_entity_by_id")
+@patch("app.crud.allocate_ids")
+@patch("app.crud.query_entities")
+@patch("app.crud.get_entity_by_id")
+def test_create_shift_rejects_overlap_seen_in_transaction(mock_get_entity, mock_query_entities, mock_allocate_ids, mock_put_entity, mock_run_in_transaction):
+    import pytest
+    from datetime import datetime, timezone
+    from app.crud import create_shift
+
+    mock_get_entity.return_value = MagicMock()
+    mock_allocate_ids.return_value = [7]
+    mock_run_in_transaction.side_effect = _run_operation
+    concurrent = MagicMock()
+    concurrent.key.id = 8
+    concurrent.__getitem__ = lambda self, key: {
+        "start_utc": datetime(2024, 2, 10, 12, 0, tzinfo=timezone.utc),
+        "end_utc": datetime(2024, 2, 10, 18, 0, tzinfo=timezone.utc)
+    }[key]
+    mock_query_entities.side_effect = lambda kind, filters, projection=None, ancestor=None: [concurrent] if ancestor else []
+
+    with pytest.raises(ValueError, match="overlaps"):
+        create_shift(1, "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00")
+    mock_put_entity.assert_not_called()
+
+
+@patch("app.crud.get_timezone_setting")
+@patch("app.crud.run_in_transaction")
+@patch("app.crud.put_entity_by_id")
+@patch("app.crud.delete_entity")
+@patch("app.crud.query_entities")
+@patch("app.crud.get_entity_by_id")
+@patch("app.crud.find_shift_parent")
+def test_update_shift_moves_key_to_new_worker(mock_find_parent, mock_get_entity, mock_query_entities, mock_delete_entity, mock_put_entity, mock_run_in_transaction, mock_get_tz):
+    from app.crud import update_shift
+
+    mock_get_tz.return_value = "UTC"
+    mock_find_parent.return_value = ("Worker", 1)
+    mock_get_entity.return_value = MagicMock()
+    mock_query_entities.return_value = []
+    mock_run_in_transaction.side_effect = _run_operation
+    mock_put_entity.side_effect = lambda kind, shift_id, data, parent=None, exclude_from_indexes=(): _assign_keys(kind, [(shift_id, data)])[0]
+
+    shift = update_shift(5, 2, "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00")
+
+    assert shift["worker_id"] == 2
+    mock_delete_entity.assert_called_once_with("Shift", 5, parent=("Worker", 1))
+    assert mock_put_entity.call_args.kwargs["parent"] == ("Worker", 2)
+
+
+@patch("app.crud.run_in_transaction")
+@patch("app.crud.get_entity_by_id")
+@patch("app.crud.delete_entity")
+@patch("app.crud.entity_exists")
+@patch("app.crud.find_shift_parent")
+def test_delete_shift_is_a_single_write(mock_find_parent, mock_exists, mock_delete_entity, mock_get_entity, mock_run_in_transaction):
+    from app.crud import delete_shift
+
+    mock_find_parent.return_value = ("Worker", 1)
+
+    assert delete_shift(5) is True
+    mock_delete_entity.assert_called_once_with("Shift", 5, parent=("Worker", 1))
+    mock_exists.assert_not_called()
+    mock_get_entity.assert_not_called()
+    mock_run_in_transaction.assert_not_called()
+
+
+@patch("app.crud.delete_entity")
+@patch("app.crud.entity_exists")
+@patch("app.crud.find_shift_parent")
+def test_delete_shift_checks_legacy_key_only_by_key(mock_find_parent, mock_exists, mock_delete_entity):
+    from app.crud import delete_shift
+
+    mock_find_parent.return_value = None
+    mock_exists.return_value = False
+    assert delete_shift(5) is None
+    mock_exists.assert_called_once_with("Shift", 5)
+    mock_delete_entity.assert_not_called()
+
+    mock_exists.return_value = True
+    assert delete_shift(5) is True
+    mock_delete_entity.assert_called_once_with("Shift", 5, parent=None)
+
+
+@patch("app.crud.LEGACY_SHIFT_KEYS_ENABLED", False)
+@patch("app.crud.get_entity_by_id")
+@patch("app.crud.find_shift_parent")
+def test_get_shift_without_legacy_keys(mock_find_parent, mock_get_entity):
+    from app.crud import get_shift
+
+    mock_find_parent.return_value = None
+
+    assert get_shift(5) is None
+    mock_get_entity.assert_not_called()
+
+
+@patch("app.crud.bump_data_version")
+@patch("app.crud.run_in_transaction")
+@patch("app.crud.delete_keys")
+@patch("app.crud.put_entities_with_parents")
+@patch("app.crud.get_entities_by_keys")
+def test_migrate_legacy_shift_keys(mock_get_entities, mock_put_entities, mock_delete_keys, mock_run_in_transaction, mock_bump):
+    from datetime import datetime, timezone
+    from app.crud import migrate_legacy_shift_keys
+
+    data = {
+        "worker_id": 3,
+        "start_utc": datetime(2024, 2, 10, 9, 0, tzinfo=timezone.utc),
+        "end_utc": datetime(2024, 2, 10, 17, 0, tzinfo=timezone.utc)
+    }
+    legacy = MagicMock()
+    legacy.key.id = 5
+    legacy.key.parent = None
+    legacy.__getitem__ = lambda self, key: data[key]
+    migrated = MagicMock()
+    migrated.key.id = 6
+    mock_get_entities.return_value = [legacy]
+    mock_run_in_transaction.side_effect = _run_operation
+
+    assert migrate_legacy_shift_keys([legacy.key, migrated.key]) == 1
+    mock_get_entities.assert_called_once_with([legacy.key])
+    mock_put_entities.assert_called_once_with("Shift", [(("Worker", 3), 5, dict(data, shift_id=5, duration_seconds=28800.0))], exclude_from_indexes=("duration_seconds",))
+    mock_delete_keys.assert_called_once_with([legacy.key])
+    mock_bump.assert_called_once_with("Shift")
+
+
+@patch("app.db.time.sleep")
+@patch("app.db.get_storage")
+def test_run_in_transaction_retries_on_contention(mock_get_storage, mock_sleep):
+    from google.api_core.exceptions import Aborted
+    from app.db import run_in_transaction
+
+    attempts = []
+
+    def operation():
+        attempts.append(len(attempts))
+        if len(attempts) < 3:
+            raise Aborted("too much contention")
+        return "done"
+
+    assert run_in_transaction(operation) == "done"
+    assert len(attempts) == 3
+    assert mock_sleep.call_count == 2
+    assert mock_get_storage.return_value.transaction.call_count == 3
+
+
+@patch("app.db.time.sleep")
+@patch("app.db.get_storage")
+def test_run_in_transaction_gives_up(mock_get_storage, mock_sleep):
+    import pytest
+    from google.api_core.exceptions import Aborted
+    from app.db import run_in_transaction
+
+    def operation():
+        raise Aborted("too much contention")
+
+    with pytest.raises(Aborted):
+        run_in_transaction(operation, max_attempts=2)
+    assert mock_sleep.call_count == 1
+
+
+EXPORTED_SHIFTS = [
+    {"id": 1, "worker_id": 1, "start": "2024-02-10T09:00:00-05:00", "end": "2024-02-10T17:00:00-05:00", "duration_hours": 8.0},
+    {"id": 2, "worker_id": 2, "start": "2024-02-11T09:00:00-05:00", "end": "2024-02-11T13:30:00-05:00", "duration_hours": 4.5},
+]
+
+
+@patch("app.main.export_shifts")
+def test_export_shifts_ndjson(mock_export_shifts):
+    import json
+
+    mock_export_shifts.return_value = iter([EXPORTED_SHIFTS[:1], [], EXPORTED_SHIFTS[1:]])
+    response = client.get("/shifts/export?from=2024-02-01T00:00:00&to=2024-03-01T00:00:00")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == EXPORTED_SHIFTS
+    mock_export_shifts.assert_called_once_with("2024-02-01T00:00:00", "2024-03-01T00:00:00")
+
+
+@patch("app.main.export_shifts")
+def test_export_shifts_csv(mock_export_shifts):
+    mock_export_shifts.return_value = iter([EXPORTED_SHIFTS])
+    response = client.get("/shifts/export?format=csv")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"] == 'attachment; filename="shifts.csv"'
+    assert response.text.splitlines() == [
+        "id,worker_id,start,end,duration_hours",
+        "1,1,2024-02-10T09:00:00-05:00,2024-02-10T17:00:00-05:00,8.0",
+        "2,2,2024-02-11T09:00:00-05:00,2024-02-11T13:30:00-05:00,4.5",
+    ]
+
+
+@patch("app.crud.get_timezone_setting")
+def test_export_shifts_invalid_range(mock_get_tz):
+    mock_get_tz.return_value = "UTC"
+    response = client.get("/shifts/export?from=2024-02-12T00:00:00&to=2024-02-10T00:00:00")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "`to` must be after `from`"
+
+
+def test_export_shifts_invalid_format():
+    response = client.get("/shifts/export?format=xml")
+    assert response.status_code == 422
+
+
+@patch("app.crud.get_timezone_setting")
+@patch("app.crud.iter_entity_pages")
+def test_export_shifts_reads_page_by_page(mock_iter_pages, mock_get_tz):
+    from datetime import datetime, timezone
+    from app.crud import export_shifts
+
+    def make_shift(shift_id, start_hour, end_hour):
+        entity = MagicMock()
+        entity.key.id = shift_id
+        entity.__getitem__ = lambda self, key: {
+            "worker_id": 1,
+            "start_utc": datetime(2024, 2, 10, start_hour, tzinfo=timezone.utc),
+            "end_utc": datetime(2024, 2, 10, end_hour, tzinfo=timezone.utc)
+        }[key]
+        return entity
+
+    fetched = []
+
+    def pages(kind, page_size, filters=None, order=None):
+        for page in ([make_shift(1, 0, 2), make_shift(2, 8, 12)], [make_shift(3, 13, 20)]):
+            fetched.append(len(page))
+            yield page
+
+    mock_get_tz.return_value = "UTC"
+    mock_iter_pages.side_effect = pages
+
+    exported = export_shifts("2024-02-10T06:00:00+00:00", None, page_size=2)
+    assert fetched == []
+    first = next(exported)
+    assert fetched == [2]
+    assert first == [{"id": 2, "worker_id": 1, "start": "2024-02-10T08:00:00+00:00", "end": "2024-02-10T12:00:00+00:00", "duration_hours": 4.0}]
+    assert [shift["id"] for shift in next(exported)] == [3]
+    assert fetched == [2, 1]
+    assert mock_iter_pages.call_args.kwargs["order"] == ["start_utc"]
+
+
+def test_page_response_number_format():
+    from app.main import page_response
+
+    # Clients see to_json's float format: 0.00001 where json.dumps writes 1e-05.
+    response = page_response([{"id": 1, "duration_hours": 1e-05}, {"id": 2, "duration_hours": 8.0}], None, '"etag"')
+    assert response.body == b'{"items":[{"id":1,"duration_hours":0.00001},{"id":2,"duration_hours":8.0}],"next_cursor":null}'
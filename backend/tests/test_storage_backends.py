@@ -0,0 +1,351 @@
+import os
+import uuid
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pytest
+
+BACKENDS = ["memory", "sqlite", "datastore"]
+
+
+@pytest.fixture(params=BACKENDS)
+def storage(request):
+    from app import db
+    from app.storage_memory import MemoryStorage
+    from app.storage_sqlite import SqliteStorage
+
+    if request.param == "memory":
+        backend = MemoryStorage("test")
+    elif request.param == "sqlite":
+        backend = SqliteStorage("test", ":memory:")
+    else:
+        if not os.environ.get("DATASTORE_EMULATOR_HOST"):
+            pytest.skip("needs the Datastore emulator")
+        from app.storage_datastore import DatastoreStorage
+        # A fresh project per test keeps emulator state from leaking between them.
+        backend = DatastoreStorage(f"test-{uuid.uuid4().hex[:12]}")
+    db.set_storage(backend)
+    yield backend
+    db.set_storage(None)
+
+
+def test_worker_crud(storage):
+    from app import crud
+
+    alice = crud.create_worker("Alice")
+    bob = crud.create_worker("Bob")
+    assert alice["id"] != bob["id"]
+
+    assert crud.get_worker(alice["id"]) == alice
+    assert crud.update_worker(bob["id"], "Robert") == {"id": bob["id"], "name": "Robert"}
+    assert crud.update_worker(999999, "Nobody") is None
+    assert sorted(worker["name"] for worker in crud.list_workers()) == ["Alice", "Robert"]
+
+    assert crud.delete_worker(alice["id"]) is True
+    assert crud.delete_worker(alice["id"]) is None
+    assert crud.get_worker(alice["id"]) is None
+
+
+def test_workers_page_through_with_cursor(storage):
+    from app import crud
+
+    created = crud.create_workers_batch([f"Worker {n}" for n in range(5)])
+
+    page, cursor = crud.list_workers_page(2)
+    seen = list(page)
+    while cursor:
+        page, cursor = crud.list_workers_page(2, cursor)
+        seen.extend(page)
+
+    assert sorted(worker["id"] for worker in seen) == sorted(worker["id"] for worker in created)
+    assert crud.get_workers_by_ids([created[1]["id"], created[0]["id"], created[1]["id"]]) == [created[1], created[0]]
+
+
+def test_invalid_cursor_is_rejected(storage):
+    from app import crud
+
+    with pytest.raises(ValueError):
+        crud.list_workers_page(2, "not a cursor!")
+
+
+def test_create_shift_rejects_overlap_and_unknown_worker(storage):
+    from app import crud
+
+    worker = crud.create_worker("Alice")
+    shift = crud.create_shift(worker["id"], "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00")
+
+    assert crud.get_shift(shift["id"]) == shift
+    assert shift["duration_hours"] == 8.0
+    with pytest.raises(ValueError, match="overlaps"):
+        crud.create_shift(worker["id"], "2024-02-10T16:00:00+00:00", "2024-02-10T20:00:00+00:00")
+    with pytest.raises(ValueError, match="Worker not found"):
+        crud.create_shift(worker["id"] + 1000, "2024-02-11T09:00:00+00:00", "2024-02-11T17:00:00+00:00")
+    assert crud.check_group_shift_overlap(worker["id"], datetime(2024, 2, 10, 12, tzinfo=timezone.utc), datetime(2024, 2, 10, 13, tzinfo=timezone.utc))
+    assert len(crud.list_shifts()) == 1
+
+
+def test_shift_range_filters_and_paging(storage):
+    from app import crud
+
+    alice = crud.create_worker("Alice")
+    bob = crud.create_worker("Bob")
+    for day in range(1, 6):
+        crud.create_shift(alice["id"], f"2024-03-0{day}T09:00:00+00:00", f"2024-03-0{day}T17:00:00+00:00")
+    crud.create_shift(bob["id"], "2024-03-03T10:00:00+00:00", "2024-03-03T12:00:00+00:00")
+
+    in_range = crud.list_shifts(start="2024-03-02T12:00:00+00:00", end="2024-03-04T00:00:00+00:00")
+    assert [(shift["worker_id"], shift["start"]) for shift in in_range] == [
+        (alice["id"], "2024-03-02T09:00:00+00:00"),
+        (alice["id"], "2024-03-03T09:00:00+00:00"),
+        (bob["id"], "2024-03-03T10:00:00+00:00"),
+    ]
+
+    starts = []
+    page, cursor = crud.list_shifts_page(2, worker_id=alice["id"], start="2024-03-01T00:00:00+00:00")
+    starts.extend(shift["start"] for shift in page)
+    while cursor:
+        page, cursor = crud.list_shifts_page(2, cursor, worker_id=alice["id"], start="2024-03-01T00:00:00+00:00")
+        starts.extend(shift["start"] for shift in page)
+    assert starts == sorted(starts) and len(starts) == 5
+
+    exported = [shift for page in crud.export_shifts(worker_id=bob["id"], page_size=1) for shift in page]
+    assert [shift["worker_id"] for shift in exported] == [bob["id"]]
+
+
+def test_update_shift_moves_it_to_the_new_worker(storage):
+    from app import crud
+
+    alice = crud.create_worker("Alice")
+    bob = crud.create_worker("Bob")
+    shift = crud.create_shift(alice["id"], "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00")
+
+    updated = crud.update_shift(shift["id"], bob["id"], "2024-02-10T10:00:00+00:00", "2024-02-10T18:00:00+00:00")
+
+    assert updated["worker_id"] == bob["id"]
+    assert crud.find_shift_parent(shift["id"]) == ("Worker", bob["id"])
+    assert crud.get_shift(shift["id"]) == updated
+    assert len(crud.list_shifts()) == 1
+    assert crud.update_shift(shift["id"] + 1000, bob["id"], "2024-02-11T10:00:00+00:00", "2024-02-11T18:00:00+00:00") is None
+
+    assert crud.delete_shift(shift["id"]) is True
+    assert crud.delete_shift(shift["id"]) is None
+
+
+def test_delete_worker_cascades_and_sweeper_finds_orphans(storage):
+    from app import crud
+
+    alice = crud.create_worker("Alice")
+    bob = crud.create_worker("Bob")
+    for worker in (alice, bob):
+        crud.create_shift(worker["id"], "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00")
+        crud.create_shift(worker["id"], "2024-02-11T09:00:00+00:00", "2024-02-11T17:00:00+00:00")
+
+    assert crud.delete_worker(alice["id"]) is True
+    assert crud.delete_worker(bob["id"], cascade=False) is True
+
+    assert [shift["worker_id"] for shift in crud.list_shifts()] == [bob["id"], bob["id"]]
+    assert crud.sweep_orphan_shifts(dry_run=True) == {bob["id"]: 2}
+    assert crud.sweep_orphan_shifts() == {bob["id"]: 2}
+    assert crud.list_shifts() == []
+
+
+def test_batch_create_is_atomic(storage):
+    from app import crud
+
+    worker = crud.create_worker("Alice")
+    items = [(worker["id"], f"2024-04-0{day}T09:00:00+00:00", f"2024-04-0{day}T17:00:00+00:00") for day in range(1, 4)]
+
+    rejected = crud.create_shifts_batch(items + [(worker["id"] + 1000, "2024-04-05T09:00:00+00:00", "2024-04-05T17:00:00+00:00")])
+    assert rejected["created"] == 0
+    assert crud.list_shifts() == []
+
+    created = crud.create_shifts_batch(items)
+    assert created["created"] == 3
+    assert len(crud.list_shifts(worker_id=worker["id"])) == 3
+
+
+@pytest.mark.parametrize("atomic, worker_groups", [(True, 25), (True, 1), (False, 25)])
+def test_batch_create_rechecks_workers_in_the_write_transaction(storage, atomic, worker_groups):
+    from app import crud, db
+
+    alice = crud.create_worker("Alice")
+    bob = crud.create_worker("Bob")
+    allocate_ids = db.allocate_ids
+
+    def delete_bob_then_allocate(kind, count):
+        # Bob is deleted after the batch checked its workers, before it writes.
+        crud.delete_worker(bob["id"])
+        return allocate_ids(kind, count)
+
+    items = [(worker["id"], "2024-04-01T09:00:00+00:00", "2024-04-01T17:00:00+00:00") for worker in (alice, bob)]
+    with patch("app.crud.allocate_ids", side_effect=delete_bob_then_allocate), patch("app.crud.MAX_TRANSACTION_GROUPS", worker_groups):
+        result = crud.create_shifts_batch(items, atomic=atomic)
+
+    assert result["results"][1]["status"] == "failed"
+    assert result["results"][1]["error"] == "Worker not found"
+    assert result["created"] == (0 if atomic else 1)
+    assert crud.find_orphan_worker_ids() == []
+
+
+def test_backfill_rewrites_shifts_missing_time_fields(storage):
+    from app import crud, db
+
+    worker = crud.create_worker("Alice")
+    shift = crud.create_shift(worker["id"], "2024-02-10T09:00:00+00:00", "2024-02-10T17:30:00+00:00")
+    entity = db.get_entity_by_id("Shift", shift["id"], parent=("Worker", worker["id"]))
+    del entity["duration_seconds"]
+    db.put_entities([entity])
+
+    keys, cursor = db.list_keys_page("Shift", 10)
+    assert cursor is None
+    assert crud.backfill_shift_time_fields(keys) == 1
+    assert crud.backfill_shift_time_fields(keys) == 0
+    stored = db.get_entity_by_id("Shift", shift["id"], parent=("Worker", worker["id"]))
+    assert stored["duration_seconds"] == 30600.0
+
+
+def test_legacy_shift_migration_moves_every_root_shift(storage):
+    from app import crud, db
+    from app.migrate_shift_keys import migrate_shifts
+
+    workers = [crud.create_worker(name) for name in ("Alice", "Bob")]
+    crud.create_shift(workers[0]["id"], "2024-02-09T09:00:00+00:00", "2024-02-09T17:00:00+00:00")
+    for shift_id in range(100, 107):
+        worker_id = workers[shift_id % 2]["id"]
+        start = datetime(2024, 2, 10 + shift_id - 100, 9, tzinfo=timezone.utc)
+        db.put_entity_by_id("Shift", shift_id, crud.shift_data(worker_id, shift_id, start, start.replace(hour=17)))
+
+    events = list(migrate_shifts(batch_size=3))
+
+    assert events[-1]["status"] == "completed"
+    assert events[-1]["migrated"] == 7
+    keys, _ = db.list_keys_page("Shift", 100)
+    assert len(keys) == 8
+    assert all(key.parent is not None for key in keys)
+    moved = crud.get_shift(103)
+    assert moved["worker_id"] == workers[1]["id"]
+    assert db.get_entity("Backfill", "legacy_shift_keys")["status"] == "completed"
+    assert list(migrate_shifts(batch_size=3))[-1]["migrated"] == 7
+
+
+def test_memory_storage_does_not_index_duration_seconds():
+    from app import crud, db
+    from app.storage_memory import MemoryStorage
+
+    db.set_storage(MemoryStorage("test"))
+    try:
+        worker = crud.create_worker("Alice")
+        crud.create_shift(worker["id"], "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00")
+        assert len(db.query_entities("Shift", [("worker_id", "=", worker["id"])])) == 1
+        assert db.query_entities("Shift", [("duration_seconds", "=", 28800.0)]) == []
+        assert db.query_entities("Shift", [("duration_seconds", ">", 0)]) == []
+    finally:
+        db.set_storage(None)
+
+
+def _memory_shifts(count):
+    from google.cloud import datastore
+
+    from app.storage_memory import MemoryStorage
+
+    backend = MemoryStorage("test")
+    start = datetime(2024, 2, 1, tzinfo=timezone.utc)
+    entities = []
+    for n in range(count):
+        entity = datastore.Entity(key=backend.key("Worker", n % 3 + 1, "Shift", n + 1))
+        entity.update({"worker_id": n % 3 + 1, "start_utc": start.replace(hour=n % 24, day=n // 24 + 1)})
+        entities.append(entity)
+    backend.put_multi(entities)
+    return backend
+
+
+def _page_through(backend, **query):
+    seen = []
+    page, cursor = backend.query("Shift", limit=4, **query)
+    seen.extend(page)
+    while cursor:
+        page, cursor = backend.query("Shift", limit=4, cursor=cursor, **query)
+        seen.extend(page)
+    return [entity.key.id for entity in seen]
+
+
+@pytest.mark.parametrize("order", [None, ["start_utc"], ["-start_utc"], ["worker_id", "start_utc"]])
+def test_memory_storage_cursors_survive_writes_between_pages(order):
+    from google.cloud import datastore
+
+    from app.storage import sort_entities
+
+    backend = _memory_shifts(30)
+    page, cursor = backend.query("Shift", order=order, limit=10)
+    first = [entity.key.id for entity in page]
+    # Drop an entity already returned and one still ahead; pages must not shift.
+    backend.delete_multi([page[0].key, page[-1].key])
+    ahead = sort_entities(backend.query("Shift", order=order)[0], order)[-1]
+    backend.delete_multi([ahead.key])
+    added = datastore.Entity(key=backend.key("Worker", 3, "Shift", 100))
+    late = datetime(2020 if order and order[0].startswith("-") else 2030, 1, 1, tzinfo=timezone.utc)
+    added.update({"worker_id": 3, "start_utc": late})
+    backend.put_multi([added])
+
+    rest = []
+    while cursor:
+        page, cursor = backend.query("Shift", order=order, limit=10, cursor=cursor)
+        rest.extend(entity.key.id for entity in page)
+
+    expected = [entity.key.id for entity in sort_entities(backend.query("Shift")[0], order) if entity.key.id not in first]
+    assert rest == expected
+    assert not set(first) & set(rest)
+
+
+def test_memory_storage_pages_match_a_full_sort():
+    from app.storage import matches, sort_entities
+
+    backend = _memory_shifts(60)
+    everything, _ = backend.query("Shift")
+    bound = datetime(2024, 2, 2, 3, tzinfo=timezone.utc)
+    cases = [
+        {"order": ["start_utc"], "filters": [("start_utc", ">", bound)]},
+        {"order": ["start_utc"], "filters": [("worker_id", "=", 2), ("start_utc", "<=", bound)]},
+        {"order": None, "filters": [("start_utc", ">=", bound)]},
+        {"order": ["__key__"], "filters": []},
+        {"order": None, "filters": [], "ancestor": ("Worker", 3)},
+    ]
+    for case in cases:
+        filters = case["filters"]
+        expected = [entity for entity in everything if matches(entity, filters)]
+        if "ancestor" in case:
+            expected = [entity for entity in expected if entity.key.flat_path[:2] == case["ancestor"]]
+        # With no order, an inequality filter sorts by its property as in Datastore.
+        order = case["order"] or [name for name, op, _ in filters if op != "="][:1]
+        assert _page_through(backend, filters=filters, order=case["order"], ancestor=case.get("ancestor")) == [
+            entity.key.id for entity in sort_entities(expected, order)
+        ]
+
+
+def test_memory_storage_ordered_pages_walk_the_index_instead_of_sorting():
+    from app.storage_memory import MemoryStorage
+
+    backend = _memory_shifts(40)
+    with patch.object(MemoryStorage, "_sorted_candidates", side_effect=AssertionError("re-sorted the kind")):
+        assert len(_page_through(backend, order=["start_utc"])) == 40
+        assert len(_page_through(backend)) == 40
+        assert len(_page_through(backend, projection=["__key__"], order=["__key__"])) == 40
+
+
+def test_memory_storage_rejects_a_cursor_from_another_order():
+    backend = _memory_shifts(10)
+    _, cursor = backend.query("Shift", order=["start_utc"], limit=2)
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        backend.query("Shift", limit=2, cursor=cursor)
+
+
+def test_sqlite_shift_queries_use_the_worker_start_index():
+    from app.storage_sqlite import SqliteStorage
+
+    backend = SqliteStorage("test", ":memory:")
+    plan = backend._connection.execute(
+        "EXPLAIN QUERY PLAN SELECT data FROM entities WHERE kind = 'Shift' "
+        "AND json_extract(data, '$.worker_id') = 3 AND json_extract(data, '$.start_utc') > 0 "
+        "ORDER BY json_extract(data, '$.start_utc')"
+    ).fetchall()
+    assert "entities_worker_start" in " ".join(row[-1] for row in plan)
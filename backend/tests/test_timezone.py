@@ -90,3 +90,80 @@ def test_put_timezone_special_characters():
 def test_put_timezone_case_variations(mock_put_entity):
     response = client.put("/settings/timezone", json={"timezone": "america/new_york"})
     assert response.status_code == 422
+
+
+@patch("app.crud.get_entity")
+def test_get_timezone_cached(mock_get_entity):
+    mock_get_entity.return_value = {"timezone": "Asia/Tokyo", "version": 1}
+
+    for _ in range(3):
+        response = client.get("/settings/timezone")
+        assert response.json() == {"timezone": "Asia/Tokyo"}
+
+    mock_get_entity.assert_called_once()
+    stats = client.get("/settings/cache").json()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+
+
+@patch("app.crud.get_entity")
+@patch("app.crud.put_entity")
+def test_put_timezone_updates_cache(mock_put_entity, mock_get_entity):
+    mock_get_entity.return_value = {"timezone": "Asia/Tokyo", "version": 1}
+    client.get("/settings/timezone")
+
+    client.put("/settings/timezone", json={"timezone": "Europe/Paris"})
+    response = client.get("/settings/timezone")
+
+    assert response.json() == {"timezone": "Europe/Paris"}
+    mock_get_entity.assert_called_once()
+    assert mock_put_entity.call_args.args[2]["timezone"] == "Europe/Paris"
+    assert "version" in mock_put_entity.call_args.args[2]
+
+
+@patch("app.crud._settings_cache.ttl_seconds", 0)
+@patch("app.crud.get_entity_projection")
+@patch("app.crud.get_entity")
+def test_get_timezone_revalidates_after_ttl(mock_get_entity, mock_get_projection):
+    mock_get_entity.return_value = {"timezone": "Asia/Tokyo", "version": 1}
+    mock_get_projection.return_value = {"version": 1}
+
+    client.get("/settings/timezone")
+    response = client.get("/settings/timezone")
+    assert response.json() == {"timezone": "Asia/Tokyo"}
+    mock_get_entity.assert_called_once()
+    assert client.get("/settings/cache").json()["revalidations"] == 1
+
+    mock_get_entity.return_value = {"timezone": "Europe/London", "version": 2}
+    mock_get_projection.return_value = {"version": 2}
+    response = client.get("/settings/timezone")
+    assert response.json() == {"timezone": "Europe/London"}
+    assert mock_get_entity.call_count == 2
+
+
+def test_get_timezones_catalog():
+    response = client.get("/settings/timezones")
+    assert response.status_code == 200
+    timezones = response.json()["timezones"]
+    assert "America/New_York" in timezones
+    assert "UTC" in timezones
+    assert timezones == sorted(timezones)
+    assert response.headers["etag"]
+
+
+def test_get_timezones_not_modified():
+    etag = client.get("/settings/timezones").headers["etag"]
+    response = client.get("/settings/timezones", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    response = client.get("/settings/timezones", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+
+
+def test_get_timezones_matches_validation():
+    timezones = client.get("/settings/timezones").json()["timezones"]
+    with patch("app.crud.put_entity"):
+        response = client.put("/settings/timezone", json={"timezone": timezones[0]})
+    assert response.status_code == 200
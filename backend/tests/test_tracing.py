@@ -0,0 +1,109 @@
+import asyncio
+import json
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def memory_storage():
+    from app import db
+    from app.storage_memory import MemoryStorage
+
+    db.set_storage(MemoryStorage("test"))
+    yield
+    db.set_storage(None)
+
+
+def test_server_timing_counts_storage_round_trips(memory_storage):
+    from app import crud
+
+    worker = crud.create_worker("Alice")
+    shift = crud.create_shift(worker["id"], "2024-02-10T09:00:00+00:00", "2024-02-10T17:00:00+00:00")
+
+    response = client.get(f"/shifts/{shift['id']}")
+
+    assert response.status_code == 200
+    db_timing, total_timing = response.headers["server-timing"].split(", ")
+    # The keys-only lookup by shift_id and the get under the worker; the
+    # timezone comes from the settings cache create_shift filled.
+    assert db_timing.startswith('db;desc="2 round trips";dur=')
+    assert total_timing.startswith("total;dur=")
+
+
+def test_server_timing_without_storage_calls():
+    response = client.get("/health")
+
+    assert response.headers["server-timing"].startswith('db;desc="0 round trips";dur=0.00, total;dur=')
+
+
+def test_slow_request_is_logged_with_rpc_breakdown(memory_storage, caplog):
+    from app import db
+    from app.tracing import TracingMiddleware
+
+    async def endpoint(scope, receive, send):
+        db.put_entity_by_id("Worker", 1, {"name": "Alice"})
+        db.update_entity_by_id("Worker", 1, {"name": "Alicia"})
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "PUT", "path": "/workers/1", "headers": []}
+    with caplog.at_level(logging.WARNING, logger="app.tracing"):
+        asyncio.run(TracingMiddleware(endpoint, threshold_ms=0)(scope, receive, send))
+
+    assert dict(sent[0]["headers"])[b"server-timing"].startswith(b'db;desc="5 round trips"')
+    logged = json.loads(caplog.records[-1].getMessage())
+    assert logged["event"] == "slow_request"
+    assert logged["path"] == "/workers/1"
+    assert logged["status"] == 200
+    assert logged["rpc_count"] == 5
+    assert [(rpc["operation"], rpc["kind"]) for rpc in logged["rpcs"]] == [
+        ("put", "Worker"), ("begin_transaction", ""), ("get", "Worker"), ("put", "Worker"), ("commit", ""),
+    ]
+
+
+def test_background_work_after_the_response_is_outside_the_trace(memory_storage, caplog):
+    from app import db
+    from app.tracing import TracingMiddleware
+
+    async def endpoint(scope, receive, send):
+        db.put_entity_by_id("Worker", 1, {"name": "Alice"})
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+        # Background tasks run here, after the response is complete.
+        db.put_entity_by_id("Worker", 2, {"name": "Bob"})
+        await asyncio.sleep(0.2)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "POST", "path": "/workers", "headers": []}
+    with caplog.at_level(logging.WARNING, logger="app.tracing"):
+        asyncio.run(TracingMiddleware(endpoint, threshold_ms=0)(scope, receive, send))
+
+    logged = [json.loads(record.getMessage()) for record in caplog.records if record.name == "app.tracing"]
+    assert len(logged) == 1
+    assert logged[0]["rpc_count"] == 1
+    assert logged[0]["duration_ms"] < 200
+
+
+def test_fast_request_is_not_logged(caplog):
+    with caplog.at_level(logging.WARNING, logger="app.tracing"):
+        client.get("/health")
+
+    assert not [record for record in caplog.records if record.name == "app.tracing"]
@@ -0,0 +1,122 @@
+import random
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone, tzinfo
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+
+from app.crud import from_utc
+from app.tzconvert import batch_from_epoch, batch_from_utc, ZoneOffsetTable
+
+
+ZONES = [
+    "UTC",
+    "America/New_York",
+    "Europe/London",
+    "Australia/Lord_Howe",
+    "Asia/Kolkata",
+    "America/St_Johns",
+    "Africa/Casablanca",
+    "Pacific/Chatham",
+]
+
+
+def test_batch_matches_from_utc_across_dst_boundaries():
+    base = datetime(2024, 3, 10, 6, 0, 0, tzinfo=timezone.utc)
+    datetimes = [base + timedelta(minutes=minute) for minute in range(-120, 240)]
+    datetimes += [datetime(2024, 11, 3, 5, 59, 59, tzinfo=timezone.utc), datetime(2024, 11, 3, 6, 0, 0, tzinfo=timezone.utc)]
+    for tz_name in ZONES:
+        assert batch_from_utc(datetimes, tz_name) == [from_utc(dt, tz_name) for dt in datetimes]
+
+
+def test_batch_matches_from_utc_random_history():
+    rng = random.Random(1234)
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    datetimes = [
+        epoch + timedelta(seconds=rng.randrange(1_600_000_000, 1_760_000_000), microseconds=rng.choice([0, 0, rng.randrange(1_000_000)]))
+        for _ in range(2000)
+    ]
+    for tz_name in ZONES:
+        assert batch_from_utc(datetimes, tz_name) == [from_utc(dt, tz_name) for dt in datetimes]
+
+
+def test_batch_matches_from_utc_local_mean_time():
+    datetimes = [datetime(1900, 1, 1, hour, 30, 15, tzinfo=timezone.utc) for hour in range(24)]
+    for tz_name in ["Europe/Amsterdam", "Asia/Kolkata", "America/New_York"]:
+        assert batch_from_utc(datetimes, tz_name) == [from_utc(dt, tz_name) for dt in datetimes]
+
+
+class SteppedZone(tzinfo):
+    # Offsets in seconds taking effect at the given epoch seconds, for
+    # transitions closer together than any real zone has. Offsets only grow,
+    # so every local time maps back to one offset.
+    def __init__(self, steps):
+        self.times = [time for time, _ in steps]
+        self.steps = steps
+
+    def offset_at(self, ts):
+        return self.steps[max(bisect_right(self.times, ts) - 1, 0)][1]
+
+    def fromutc(self, dt):
+        ts = (dt.replace(tzinfo=timezone.utc) - datetime(1970, 1, 1, tzinfo=timezone.utc)) // timedelta(seconds=1)
+        return dt + timedelta(seconds=self.offset_at(ts))
+
+    def utcoffset(self, dt):
+        local = (dt.replace(tzinfo=timezone.utc) - datetime(1970, 1, 1, tzinfo=timezone.utc)) // timedelta(seconds=1)
+        for _, offset in reversed(self.steps):
+            if self.offset_at(local - offset) == offset:
+                return timedelta(seconds=offset)
+        return timedelta(seconds=self.steps[0][1])
+
+    def dst(self, dt):
+        return None
+
+
+def test_offset_table_finds_transitions_inside_one_probe_interval():
+    # Three changes within 90 minutes, all inside one 3-hour probe interval.
+    base = 1_700_000_000
+    zone = SteppedZone([(0, 0), (base, 3600), (base + 1800, 7200), (base + 5400, 10800)])
+    with patch("app.tzconvert.get_zone", return_value=zone):
+        table = ZoneOffsetTable("Test/Stepped")
+    seconds = np.arange(base - 3600, base + 4 * 3600, 60, dtype=np.int64)
+    seconds = np.concatenate([seconds, [base - 1, base, base + 1799, base + 1800, base + 5399, base + 5400]])
+    assert table.offsets(seconds).tolist() == [zone.offset_at(ts) for ts in seconds.tolist()]
+
+
+def test_batch_from_epoch():
+    assert batch_from_epoch([1707573600, 1707602400], "America/New_York") == [
+        "2024-02-10T09:00:00-05:00",
+        "2024-02-10T17:00:00-05:00",
+    ]
+    assert batch_from_epoch([1707573600], "UTC", microseconds=[250000]) == ["2024-02-10T14:00:00.250000+00:00"]
+    assert batch_from_epoch([], "UTC") == []
+
+
+@patch("app.crud.get_timezone_setting")
+@patch("app.crud.list_entities")
+def test_list_shifts_uses_batch_conversion(mock_list_entities, mock_get_tz):
+    from app.crud import list_shifts
+
+    mock_get_tz.return_value = "America/New_York"
+    start = datetime(2024, 3, 9, 14, 0, 0, tzinfo=timezone.utc)
+    entities = []
+    for shift_id in range(100):
+        entity = MagicMock()
+        entity.key.id = shift_id
+        values = {
+            "worker_id": shift_id % 7,
+            "start_utc": start + timedelta(hours=shift_id),
+            "end_utc": start + timedelta(hours=shift_id + 8)
+        }
+        entity.__getitem__ = lambda self, key, values=values: values[key]
+        entities.append(entity)
+    mock_list_entities.return_value = entities
+
+    shifts = list_shifts()
+
+    assert len(shifts) == 100
+    for shift, entity in zip(shifts, entities):
+        assert shift["id"] == entity.key.id
+        assert shift["worker_id"] == entity["worker_id"]
+        assert shift["start"] == from_utc(entity["start_utc"], "America/New_York")
+        assert shift["end"] == from_utc(entity["end_utc"], "America/New_York")
@@ -1,3 +1,4 @@
+from datetime import datetime, timezone
 from unittest.mock import patch, MagicMock
 from fastapi.testclient import TestClient
 from app.main import app
@@ -5,26 +6,99 @@ from app.main import app
 client = TestClient(app)
 
 
-@patch("app.main.list_workers")
-def test_get_workers_empty(mock_list_workers):
-    mock_list_workers.return_value = []
+@patch("app.main.list_workers_page")
+def test_get_workers_empty(mock_list_workers_page):
+    mock_list_workers_page.return_value = ([], None)
     response = client.get("/workers")
     assert response.status_code == 200
-    assert response.json() == []
+    assert response.json() == {"items": [], "next_cursor": None}
 
 
-@patch("app.main.list_workers")
-def test_get_workers_multiple(mock_list_workers):
-    mock_list_workers.return_value = [
+@patch("app.main.list_workers_page")
+def test_get_workers_multiple(mock_list_workers_page):
+    mock_list_workers_page.return_value = ([
         {"id": 1, "name": "John Doe"},
         {"id": 2, "name": "Jane Smith"}
-    ]
+    ], "next-page")
     response = client.get("/workers")
     assert response.status_code == 200
-    assert response.json() == [
-        {"id": 1, "name": "John Doe"},
-        {"id": 2, "name": "Jane Smith"}
-    ]
+    assert response.json() == {
+        "items": [
+            {"id": 1, "name": "John Doe"},
+            {"id": 2, "name": "Jane Smith"}
+        ],
+        "next_cursor": "next-page"
+    }
+
+
+@patch("app.main.list_workers_page")
+def test_get_workers_passes_limit_and_cursor(mock_list_workers_page):
+    from app.settings import DEFAULT_PAGE_SIZE
+
+    mock_list_workers_page.return_value = ([], None)
+    client.get("/workers")
+    client.get("/workers?limit=10&cursor=abc")
+    assert mock_list_workers_page.call_args_list[0].args == (DEFAULT_PAGE_SIZE, None)
+    assert mock_list_workers_page.call_args_list[1].args == (10, "abc")
+
+
+@patch("app.main.list_workers_page")
+def test_get_workers_invalid_cursor(mock_list_workers_page):
+    mock_list_workers_page.side_effect = ValueError("Invalid cursor")
+    response = client.get("/workers?cursor=bogus")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+@patch("app.main.list_workers")
+def test_get_workers_all_opt_in(mock_list_workers):
+    mock_list_workers.return_value = [{"id": 1, "name": "John Doe"}]
+    response = client.get("/workers?all=true")
+    assert response.status_code == 200
+    assert response.json() == {"items": [{"id": 1, "name": "John Doe"}], "next_cursor": None}
+
+
+@patch("app.main.list_workers_page")
+def test_get_workers_not_modified(mock_list_workers_page):
+    mock_list_workers_page.return_value = ([{"id": 1, "name": "John Doe"}], None)
+    etag = client.get("/workers").headers["etag"]
+    response = client.get("/workers", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert mock_list_workers_page.call_count == 1
+
+    assert client.get("/workers?limit=10").headers["etag"] != etag
+
+
+@patch("app.main.list_workers_page")
+def test_get_workers_etag_changes_after_write(mock_list_workers_page, data_versions):
+    from app import crud
+
+    mock_list_workers_page.return_value = ([], None)
+    etag = client.get("/workers").headers["etag"]
+    with patch("app.crud.put_entity_with_auto_id") as mock_put_entity:
+        mock_put_entity.return_value = MagicMock(key=MagicMock(id=1), **{"__getitem__.return_value": "Alice Johnson"})
+        crud.create_worker("Alice Johnson")
+    assert data_versions.call_args.args[0] == "Worker"
+    response = client.get("/workers", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+@patch("app.main.list_workers_page")
+def test_if_none_match_sees_writes_from_other_instances(mock_list_workers_page):
+    from app import crud
+
+    mock_list_workers_page.return_value = ([], None)
+    etag = client.get("/workers").headers["etag"]
+    # Another instance bumps the stored version; this one's cache still holds
+    # the old version and keeps building ETags from it.
+    crud.save_data_version("Worker", 12345)
+    assert client.get("/workers").headers["etag"] == etag
+    response = client.get("/workers", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
 
 
 @patch("app.main.create_worker")
@@ -102,8 +176,9 @@ def test_put_worker_nonexistent(mock_update_worker):
     assert response.json()["detail"] == "Worker not found"
 
 
+@patch("app.main.count_worker_shifts", return_value=0)
 @patch("app.main.delete_worker")
-def test_delete_worker_existing(mock_delete_worker):
+def test_delete_worker_existing(mock_delete_worker, mock_count_shifts):
     mock_delete_worker.return_value = True
     response = client.delete("/workers/1")
     assert response.status_code == 204
@@ -111,8 +186,9 @@ def test_delete_worker_existing(mock_delete_worker):
     mock_delete_worker.assert_called_once_with(1)
 
 
+@patch("app.main.count_worker_shifts", return_value=0)
 @patch("app.main.delete_worker")
-def test_delete_worker_nonexistent(mock_delete_worker):
+def test_delete_worker_nonexistent(mock_delete_worker, mock_count_shifts):
     mock_delete_worker.return_value = None
     response = client.delete("/workers/999")
     assert response.status_code == 404
@@ -190,8 +266,243 @@ def test_put_worker_negative_id(mock_update_worker):
     assert response.status_code == 404
 
 
+@patch("app.main.count_worker_shifts", return_value=0)
 @patch("app.main.delete_worker")
-def test_delete_worker_negative_id(mock_delete_worker):
+def test_delete_worker_negative_id(mock_delete_worker, mock_count_shifts):
     mock_delete_worker.return_value = None
     response = client.delete("/workers/-1")
     assert response.status_code == 404
+
+
+@patch("app.main.create_workers_batch")
+def test_post_workers_batch_valid(mock_create_batch):
+    mock_create_batch.return_value = [{"id": 10, "name": "Alice"}, {"id": 11, "name": "Bob"}]
+    response = client.post("/workers:batch", json={"workers": [{"name": "Alice"}, {"name": "Bob"}]})
+    assert response.status_code == 201
+    assert response.json() == [{"id": 10, "name": "Alice"}, {"id": 11, "name": "Bob"}]
+    mock_create_batch.assert_called_once_with(["Alice", "Bob"])
+
+
+def test_post_workers_batch_invalid_name():
+    response = client.post("/workers:batch", json={"workers": [{"name": "Alice"}, {"name": "  "}]})
+    assert response.status_code == 422
+
+
+def test_post_workers_batch_empty():
+    response = client.post("/workers:batch", json={"workers": []})
+    assert response.status_code == 422
+
+
+@patch("app.crud.put_entities_by_ids")
+@patch("app.crud.allocate_ids")
+def test_create_workers_batch_uses_allocated_ids(mock_allocate_ids, mock_put_entities):
+    from app.crud import create_workers_batch
+
+    mock_allocate_ids.return_value = [10, 11]
+
+    def put_entities(kind, items):
+        entities = []
+        for worker_id, data in items:
+            entity = MagicMock()
+            entity.key.id = worker_id
+            entity.__getitem__ = lambda self, key, data=data: data[key]
+            entities.append(entity)
+        return entities
+
+    mock_put_entities.side_effect = put_entities
+
+    assert create_workers_batch(["Alice", "Bob"]) == [{"id": 10, "name": "Alice"}, {"id": 11, "name": "Bob"}]
+    mock_allocate_ids.assert_called_once_with("Worker", 2)
+    mock_put_entities.assert_called_once_with("Worker", [(10, {"name": "Alice"}), (11, {"name": "Bob"})])
+
+
+@patch("app.main.get_workers_by_ids")
+def test_get_workers_by_ids(mock_get_workers_by_ids):
+    mock_get_workers_by_ids.return_value = [{"id": 2, "name": "Jane Smith"}, {"id": 1, "name": "John Doe"}]
+    response = client.get("/workers?ids=2,1,3")
+    assert response.status_code == 200
+    assert response.json() == {
+        "items": [{"id": 2, "name": "Jane Smith"}, {"id": 1, "name": "John Doe"}],
+        "next_cursor": None
+    }
+    mock_get_workers_by_ids.assert_called_once_with([2, 1, 3])
+
+
+def test_get_workers_by_ids_invalid():
+    response = client.get("/workers?ids=1,two")
+    assert response.status_code == 400
+
+
+@patch("app.crud.get_entities_by_ids")
+def test_get_workers_by_ids_single_lookup(mock_get_entities):
+    from app.crud import get_workers_by_ids
+
+    def make_worker(worker_id, name):
+        entity = MagicMock()
+        entity.key.id = worker_id
+        entity.__getitem__ = lambda self, key: {"name": name}[key]
+        return entity
+
+    mock_get_entities.return_value = {1: make_worker(1, "John Doe"), 2: make_worker(2, "Jane Smith")}
+
+    assert get_workers_by_ids([2, 1, 3, 2]) == [{"id": 2, "name": "Jane Smith"}, {"id": 1, "name": "John Doe"}]
+    mock_get_entities.assert_called_once_with("Worker", [2, 1, 3])
+
+
+@patch("app.crud.query_keys", return_value=[])
+@patch("app.crud.delete_entity")
+@patch("app.crud.get_entity_by_id")
+@patch("app.crud.entity_exists")
+def test_delete_worker_checks_existence_keys_only(mock_exists, mock_get_entity, mock_delete_entity, mock_query_keys):
+    from app.crud import delete_worker
+
+    mock_exists.return_value = False
+    assert delete_worker(3) is None
+    mock_delete_entity.assert_not_called()
+
+    mock_exists.return_value = True
+    assert delete_worker(3) is True
+    mock_delete_entity.assert_called_once_with("Worker", 3)
+    mock_get_entity.assert_not_called()
+
+
+def test_entity_exists_is_a_keys_only_key_query():
+    from app.db import entity_exists
+    from app.storage_datastore import DatastoreStorage
+
+    storage = DatastoreStorage("test")
+    storage._client = MagicMock()
+    query = storage._client.query.return_value
+    query.fetch.return_value.pages = iter([[MagicMock()]])
+    query.fetch.return_value.next_page_token = None
+
+    with patch("app.db.get_storage", return_value=storage):
+        assert entity_exists("Worker", 3) is True
+    query.key_filter.assert_called_once_with(storage.key("Worker", 3), "=")
+    assert query.projection == ["__key__"]
+    query.fetch.assert_called_once_with(limit=1, start_cursor=None)
+
+
+@patch("app.crud.delete_keys")
+@patch("app.crud.query_keys")
+@patch("app.crud.delete_entity")
+@patch("app.crud.entity_exists", return_value=True)
+def test_delete_worker_cascades_to_shifts_in_chunks(mock_exists, mock_delete_entity, mock_query_keys, mock_delete_keys, data_versions):
+    from app import crud
+
+    crud._shift_index.add(3, 1, datetime(2024, 2, 10, 9, tzinfo=timezone.utc), datetime(2024, 2, 10, 17, tzinfo=timezone.utc))
+    mock_query_keys.return_value = [f"key-{n}" for n in range(5)]
+
+    assert crud.delete_worker(3) is True
+    mock_query_keys.assert_called_once_with("Shift", [("worker_id", "=", 3)])
+    assert [call.args[0] for call in mock_delete_keys.call_args_list] == [["key-0", "key-1", "key-2", "key-3", "key-4"]]
+    assert [call.args[0] for call in data_versions.call_args_list] == ["Worker", "Shift"]
+
+    mock_delete_keys.reset_mock()
+    assert sum(crud.delete_worker_shifts(3, chunk_size=2)) == 5
+    assert [len(call.args[0]) for call in mock_delete_keys.call_args_list] == [2, 2, 1]
+
+
+@patch("app.main.run_worker_deletion")
+@patch("app.main.start_worker_deletion")
+def test_delete_worker_async_returns_job(mock_start, mock_run):
+    job = {"job_id": "abc", "worker_id": 3, "status": "running", "deleted_shifts": 0}
+    mock_start.return_value = job
+    response = client.delete("/workers/3?async=true")
+    assert response.status_code == 202
+    assert response.json() == job
+    assert response.headers["location"] == "/worker-deletions/abc"
+    mock_start.assert_called_once_with(3)
+    mock_run.assert_called_once_with(job)
+
+
+@patch("app.main.run_worker_deletion")
+@patch("app.main.start_worker_deletion")
+@patch("app.main.delete_worker")
+@patch("app.main.count_worker_shifts")
+def test_delete_worker_with_many_shifts_runs_in_the_background(mock_count_shifts, mock_delete, mock_start, mock_run):
+    from app.settings import WORKER_DELETE_SYNC_MAX_SHIFTS
+
+    job = {"job_id": "abc", "worker_id": 3, "status": "running", "deleted_shifts": 0}
+    mock_start.return_value = job
+    mock_count_shifts.return_value = WORKER_DELETE_SYNC_MAX_SHIFTS + 1
+    response = client.delete("/workers/3")
+    assert response.status_code == 202
+    mock_count_shifts.assert_called_once_with(3, WORKER_DELETE_SYNC_MAX_SHIFTS + 1)
+    mock_delete.assert_not_called()
+    mock_run.assert_called_once_with(job)
+
+    mock_count_shifts.return_value = WORKER_DELETE_SYNC_MAX_SHIFTS
+    mock_delete.return_value = True
+    assert client.delete("/workers/3").status_code == 204
+
+
+@patch("app.main.start_worker_deletion")
+def test_delete_worker_async_nonexistent(mock_start):
+    mock_start.return_value = None
+    response = client.delete("/workers/999?async=true")
+    assert response.status_code == 404
+
+
+@patch("app.worker_deletion.put_entity")
+@patch("app.worker_deletion.delete_worker_shifts")
+def test_run_worker_deletion_records_progress(mock_delete_shifts, mock_put_entity):
+    from app.worker_deletion import run_worker_deletion
+
+    saved = []
+    mock_put_entity.side_effect = lambda kind, job_id, data: saved.append(dict(data))
+    mock_delete_shifts.return_value = iter([500, 120])
+
+    state = run_worker_deletion({"job_id": "abc", "worker_id": 3, "status": "running", "deleted_shifts": 0})
+
+    assert state["status"] == "completed"
+    assert [entry["deleted_shifts"] for entry in saved] == [500, 620, 620]
+    assert saved[-1]["status"] == "completed"
+
+
+@patch("app.worker_deletion.time.time")
+@patch("app.worker_deletion.put_entity")
+@patch("app.worker_deletion.get_entity")
+def test_stale_running_deletion_job_is_reported_failed(mock_get_entity, mock_put_entity, mock_time):
+    from app.settings import WORKER_DELETION_STALE_SECONDS
+    from app.worker_deletion import load_deletion_state
+
+    job = {"worker_id": 3, "status": "running", "deleted_shifts": 500, "heartbeat": 1000.0}
+    mock_get_entity.return_value = job
+    mock_time.return_value = 1000.0 + WORKER_DELETION_STALE_SECONDS
+    assert load_deletion_state("abc")["status"] == "running"
+    mock_put_entity.assert_not_called()
+
+    mock_time.return_value = 1001.0 + WORKER_DELETION_STALE_SECONDS
+    assert load_deletion_state("abc")["status"] == "failed"
+    assert mock_put_entity.call_args.args[2]["status"] == "failed"
+
+
+@patch("app.main.get_worker_deletion")
+def test_get_worker_deletion_job(mock_get_job):
+    mock_get_job.return_value = {"job_id": "abc", "worker_id": 3, "status": "completed", "deleted_shifts": 620}
+    response = client.get("/worker-deletions/abc")
+    assert response.status_code == 200
+    assert response.json()["deleted_shifts"] == 620
+
+    mock_get_job.return_value = None
+    assert client.get("/worker-deletions/missing").status_code == 404
+
+
+@patch("app.crud.delete_keys")
+@patch("app.crud.query_keys")
+@patch("app.crud.get_entities_by_ids")
+@patch("app.crud.query_projection")
+def test_sweep_orphan_shifts(mock_query_projection, mock_get_entities, mock_query_keys, mock_delete_keys):
+    from app.crud import sweep_orphan_shifts
+
+    mock_query_projection.return_value = [{"worker_id": 1}, {"worker_id": 2}, {"worker_id": 3}]
+    mock_get_entities.return_value = {2: MagicMock()}
+    mock_query_keys.side_effect = lambda kind, filters: [f"{filters[0][2]}-a", f"{filters[0][2]}-b"]
+
+    assert sweep_orphan_shifts(dry_run=True) == {1: 2, 3: 2}
+    mock_delete_keys.assert_not_called()
+    assert mock_query_projection.call_args.kwargs["distinct_on"] == ["worker_id"]
+
+    assert sweep_orphan_shifts() == {1: 2, 3: 2}
+    assert [call.args[0] for call in mock_delete_keys.call_args_list] == [["1-a", "1-b"], ["3-a", "3-b"]]